@@ -1,11 +1,18 @@
 from django.contrib import admin
-from .models import Listing, PriceHistory
+from .models import Listing, MarketStats, PriceHistory, PricePoint
+from .search import ListingTextSearch, search_backend
 
 @admin.register(Listing)
 class ListingAdmin(admin.ModelAdmin):
     list_display = ['id','title', 'city', 'province', 'current_price', 'bedrooms', 'bathrooms']
     list_filter = ['city', 'province', 'bedrooms', 'bathrooms']
     search_fields = ['title', 'street_address', 'city', 'description']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains over four unindexed columns
+        if not search_term.strip() or search_backend(queryset.db) == 'icontains':
+            return super().get_search_results(request, queryset, search_term)
+        return ListingTextSearch(search_term, using=queryset.db).filter(queryset), False
     
     fieldsets = (
         ('Basic Information', {
@@ -16,8 +23,20 @@ class ListingAdmin(admin.ModelAdmin):
         }),
     )
 
+class PricePointInline(admin.TabularInline):
+    model = PricePoint
+    fields = ['date', 'price']
+    extra = 0
+
 @admin.register(PriceHistory)
 class PriceHistoryAdmin(admin.ModelAdmin):
     list_display = ['id','listing', 'date_recorded']
+    inlines = [PricePointInline]
     list_filter = ['date_recorded']
     search_fields = ['listing__title']
+
+@admin.register(MarketStats)
+class MarketStatsAdmin(admin.ModelAdmin):
+    list_display = ['city', 'province', 'listing_count', 'median_price', 'median_price_per_sqft', 'price_change_1y', 'updated_at']
+    list_filter = ['province']
+    search_fields = ['city']
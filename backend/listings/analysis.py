@@ -0,0 +1,277 @@
+import json
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q
+from django.utils import timezone
+
+from .llm import acomplete, complete, request_key, stream
+from .metrics import CacheStats
+from .models import AnalysisCache
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+
+#----------------------------- Prompt -----------------------------#
+
+
+def generate_prompt(listing, price_history):
+    """
+    Helper to generate the prompt for OpenAI based on Listing and PriceHistory.
+    """
+    return (
+        f"Analyze the future price trend for this property and provide a structured, professional real estate analysis report:\n\n"
+        f"**Property Details:**\n"
+        f"• Listing: {listing.title}\n"
+        f"• Location: {listing.city}, {listing.province}\n"
+        f"• Current Price: {listing.current_price}\n"
+        f"• Specifications: {listing.bedrooms} bedrooms, {listing.bathrooms} bathrooms, {listing.square_feet} sqft\n"
+        f"• Description: {listing.description}\n\n"
+        f"**Price History Data:**\n"
+        f"• Price Values: {price_history.price_values if price_history else 'N/A'}\n"
+        f"• Date Recorded: {price_history.date_recorded if price_history else 'N/A'}\n\n"
+        f"Please provide your analysis in the following structured format with clear headings and bullet points:\n\n"
+        f"**MARKET ANALYSIS SUMMARY**\n"
+        f"[Brief overview of current market position]\n\n"
+        f"**PRICE TREND ANALYSIS**\n"
+        f"[Detailed analysis of price movements and patterns]\n\n"
+        f"**FUTURE PRICE PREDICTION**\n"
+        f"[Specific predictions with reasoning]\n\n"
+        f"**KEY FACTORS & RECOMMENDATIONS**\n"
+        f"[Important factors affecting price and actionable recommendations]\n\n"
+        f"Use professional real estate terminology and provide specific, actionable insights."
+    )
+
+
+#----------------------------- Two-tier analysis cache -----------------------------#
+#
+# Tier 1 is a bounded in-process LRU with a TTL (the Django cache alias named by
+# ANALYSIS_MEMORY_CACHE_ALIAS, LocMemCache by default) keyed by listing id and
+# Listing.updated_at, so a hit costs only the primary-key read of the listing. Every write
+# to a listing or its price histories moves updated_at (see signals.py), so an edit saved
+# by any worker makes the older entries of every worker unreachable; nothing has to be
+# invalidated per process. An entry also never outlives the AnalysisCache row it came from.
+# Tier 2 is the AnalysisCache table, content-addressed by llm.request_key(prompt): a
+# hash of the model, parameters and fully rendered prompt, looked up through a unique
+# index. Any change to the data in the prompt changes the key, so stale rows are never
+# served, and listings with identical prompts share a row. Rows older than
+# ANALYSIS_CACHE_TTL are ignored and purged, and the table is trimmed to
+# ANALYSIS_CACHE_MAX_ROWS newest rows.
+#
+# A popular listing can be analyzed by many users at once. Every miss for the same
+# prompt joins a single in-flight computation instead of issuing its own OpenAI call,
+# and the unique prompt_hash keeps concurrent writers (including other processes)
+# from inserting duplicate rows.
+
+_flight = SingleFlight()
+_async_flight = AsyncSingleFlight()
+
+stats = CacheStats(tiers=('memory', 'db'), extra=('memory_evictions', 'db_evictions'))
+_writes_since_purge = 0
+
+
+def _memory():
+    return caches[settings.ANALYSIS_MEMORY_CACHE_ALIAS]
+
+
+def _memory_key(listing):
+    return f'analysis:listing:{listing.pk}:{listing.updated_at.isoformat()}'
+
+
+def expiry_cutoff():
+    """
+    Oldest `timestamp` an AnalysisCache row may have and still be served (ANALYSIS_CACHE_TTL).
+    Example:
+        >>> AnalysisCache.objects.filter(timestamp__gte=expiry_cutoff())  # unexpired rows
+    """
+    return timezone.now() - timedelta(seconds=settings.ANALYSIS_CACHE_TTL)
+
+
+def get_memory_analysis(listing):
+    """
+    Return the analysis text held in the memory tier for this version of the listing, or None.
+    """
+    analysis = _memory().get(_memory_key(listing))
+    stats.incr('memory_hits' if analysis is not None else 'memory_misses')
+    return analysis
+
+
+async def aget_memory_analysis(listing):
+    analysis = await _memory().aget(_memory_key(listing))
+    stats.incr('memory_hits' if analysis is not None else 'memory_misses')
+    return analysis
+
+
+def remember_analysis(listing, analysis, stored_at):
+    """
+    Keep an analysis in the memory tier until the memory TTL or the expiry of the
+    AnalysisCache row stored at `stored_at`, whichever comes first.
+    """
+    memory = _memory()
+    remaining = settings.ANALYSIS_CACHE_TTL - (timezone.now() - stored_at).total_seconds()
+    if memory.default_timeout is not None:
+        remaining = min(remaining, memory.default_timeout)
+    if remaining > 0:
+        memory.set(_memory_key(listing), analysis, timeout=remaining)
+        if hasattr(memory, 'take_culled'):  # other backends evict by their own policy, unseen here
+            stats.incr('memory_evictions', memory.take_culled())
+
+
+def clear_memory():
+    """
+    Empty the memory tier, e.g. after bulk data changes that bypass model signals.
+    """
+    _memory().clear()
+
+
+def get_cached_analysis(listing, price_history, prompt=None):
+    """
+    Return the unexpired cached analysis text for this listing and price history, or None.
+    `prompt` is the already rendered prompt, if the caller has it (rendered otherwise).
+    A database hit is promoted into the memory tier.
+    """
+    if prompt is None:
+        prompt = generate_prompt(listing, price_history)
+    entry = AnalysisCache.objects.filter(
+        prompt_hash=request_key(prompt), timestamp__gte=expiry_cutoff()
+    ).only('analysis_result', 'timestamp').first()
+    stats.incr('db_hits' if entry else 'db_misses')
+    if entry is None:
+        return None
+    remember_analysis(listing, entry.analysis_result, entry.timestamp)
+    return entry.analysis_result
+
+
+async def aget_cached_analysis(listing, price_history, prompt=None):
+    return await sync_to_async(get_cached_analysis)(listing, price_history, prompt)
+
+
+def store_analysis(listing, price_history, analysis, prompt=None):
+    """
+    Save the analysis of `prompt` (rendered from the listing and price history when not
+    given) in both tiers, keeping the existing row if another writer stored one first
+    (get_or_create falls back to a read when the unique constraint rejects the insert).
+    An expired row for the same key is replaced.
+    Returns:
+        str: The analysis text that is now cached for this key.
+    """
+    global _writes_since_purge
+    if prompt is None:
+        prompt = generate_prompt(listing, price_history)
+    key = request_key(prompt)
+    AnalysisCache.objects.filter(prompt_hash=key, timestamp__lt=expiry_cutoff()).delete()
+    entry, created = AnalysisCache.objects.get_or_create(
+        prompt_hash=key,
+        defaults={'listing': listing, 'price_history': price_history, 'analysis_result': analysis},
+    )
+    remember_analysis(listing, entry.analysis_result, entry.timestamp)
+
+    if created:
+        _writes_since_purge += 1
+        if _writes_since_purge >= settings.ANALYSIS_CACHE_PURGE_INTERVAL:
+            _writes_since_purge = 0
+            purge_analysis_cache()
+    return entry.analysis_result
+
+
+def purge_analysis_cache(max_rows=None):
+    """
+    Delete expired AnalysisCache rows, then the oldest rows beyond `max_rows`
+    (ANALYSIS_CACHE_MAX_ROWS by default).
+    Returns:
+        int: Number of rows deleted.
+    """
+    max_rows = settings.ANALYSIS_CACHE_MAX_ROWS if max_rows is None else max_rows
+    deleted, _ = AnalysisCache.objects.filter(timestamp__lt=expiry_cutoff()).delete()
+
+    # Everything older than the max_rows-th newest row goes
+    boundary = AnalysisCache.objects.order_by('-timestamp', '-id').values_list('timestamp', 'id')[max_rows:max_rows + 1]
+    boundary = list(boundary)
+    if boundary:
+        timestamp, row_id = boundary[0]
+        extra, _ = AnalysisCache.objects.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lte=row_id)
+        ).delete()
+        deleted += extra
+
+    stats.incr('db_evictions', deleted)
+    return deleted
+
+
+def _compute(listing, price_history, prompt):
+    # Re-check: a flight for this key may have finished between our miss and becoming leader
+    cached = get_cached_analysis(listing, price_history, prompt)
+    if cached:
+        return cached
+    analysis = complete(prompt)
+    return store_analysis(listing, price_history, analysis, prompt)
+
+
+async def _acompute(listing, price_history, prompt):
+    cached = await aget_cached_analysis(listing, price_history, prompt)
+    if cached:
+        return cached
+    analysis = await acomplete(prompt)
+    return await sync_to_async(store_analysis)(listing, price_history, analysis, prompt)
+
+
+def analyze(listing, price_history):
+    """
+    Return the analysis for a listing, calling OpenAI at most once per prompt across
+    concurrent threads in this process. Exceptions are propagated to every waiter.
+    """
+    prompt = generate_prompt(listing, price_history)
+    return _flight.do(request_key(prompt), lambda: _compute(listing, price_history, prompt))
+
+
+async def aanalyze(listing, price_history):
+    """
+    Async counterpart of analyze(): concurrent coroutines share one upstream call.
+    """
+    # Building the prompt reads the price points from the DB, so run it off the event loop
+    prompt = await sync_to_async(generate_prompt)(listing, price_history)
+    return await _async_flight.do(request_key(prompt), lambda: _acompute(listing, price_history, prompt))
+
+
+#----------------------------- Streaming (server-sent events) -----------------------------#
+
+
+def sse_event(event, data):
+    """
+    Format one server-sent event with a JSON payload.
+    """
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def stream_analysis_events(listing, price_history, cached=None):
+    """
+    Yield the analysis as server-sent events. `cached` is the cached analysis text, if any.
+    A cache hit is a single `analysis` event. On a miss, each OpenAI text delta is
+    relayed as a `token` event as soon as it arrives; when the stream ends the full
+    text is stored in AnalysisCache and sent as a final `analysis` event.
+    Events:
+        token:    {"delta": "..."}
+        analysis: {"analysis": "<full text>", "cached": true|false}
+        error:    {"error": "AI analysis failed.", "details": "..."}
+    """
+    if cached is not None:
+        yield sse_event('analysis', {'analysis': cached, 'cached': True})
+        return
+
+    prompt = generate_prompt(listing, price_history)
+    parts = []
+    try:
+        for delta in stream(prompt):
+            parts.append(delta)
+            yield sse_event('token', {'delta': delta})
+    except Exception as e:
+        logger.exception("OpenAI streaming analysis failed for listing %s", listing.pk)
+        yield sse_event('error', {'error': 'AI analysis failed.', 'details': str(e)})
+        return
+
+    analysis = store_analysis(listing, price_history, ''.join(parts).strip(), prompt)
+    yield sse_event('analysis', {'analysis': analysis, 'cached': False})
@@ -0,0 +1,117 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .conditional import bump_versions
+from .deferred import defer_until_commit
+from .models import Listing, ListingChange, PriceHistory
+from .serializer import LISTING_ROW_FIELDS, serialize_listing_rows
+
+
+#----------------------------- Change feed -----------------------------#
+#
+# GET /api/listings/changes/?since=<token> lets clients keep a local copy of the catalogue
+# in sync by fetching only what changed. Every write to a listing or its price histories
+# replaces that listing's ListingChange row with a new one (signals.py, and bulk.py /
+# populate_listings for bulk writes), so:
+#   - the sequence (ListingChange.id) only grows, and a token is the last sequence a client saw;
+#   - the table holds one row per listing or tombstone, and a sync reads
+#     only the rows after the token: O(changes), not O(catalogue);
+#   - a listing written many times since the token is sent once, with its current data.
+# Change rows are written after bumping the ListingChange TableVersion row in the same
+# transaction. That UPDATE locks the counter until commit, so writers commit in sequence
+# order and a reader never skips a lower sequence that becomes visible later.
+# Price history writes are recorded once per transaction and listing, in a short
+# transaction of their own right after the writing one commits (schedule_price_history_change).
+
+
+def record_changes(listing_ids, kind=ListingChange.UPSERT):
+    """
+    Record that listings were written ("upsert") or deleted ("delete"). Call it inside the
+    writing transaction.
+    Example:
+        >>> record_changes([listing.pk])
+        >>> record_changes([deleted_pk], kind=ListingChange.DELETE)
+    """
+    listing_ids = list(listing_ids)
+    if not listing_ids:
+        return
+    bump_versions(ListingChange)
+    ListingChange.objects.filter(listing_id__in=listing_ids).delete()
+    ListingChange.objects.bulk_create([ListingChange(listing_id=pk, kind=kind) for pk in listing_ids])
+
+
+def record_reset():
+    """
+    Drop the feed and start it over with a reset marker, for when the catalogue was rebuilt
+    with reused ids (populate_listings). Clients holding an older token must discard their
+    copy; the listings written afterwards are recorded with record_changes() as usual.
+    """
+    bump_versions(ListingChange)
+    ListingChange.objects.all().delete()  # keeps the sequence: tokens never go backwards
+    ListingChange.objects.create(kind=ListingChange.RESET)
+
+
+def schedule_price_history_change(listing_id):
+    """
+    Note that a listing's price histories were written in the current transaction. Once it
+    commits, every noted listing is touched (its detail ETag and updated_at move), the
+    PriceHistory version is bumped and one change is recorded per listing, however many
+    histories and points the transaction wrote. (Done after the commit because a history's
+    points are written after its post_save signal, e.g. by PriceHistory.save().)
+    """
+    defer_until_commit(_record_price_history_changes, listing_id)
+
+
+def _record_price_history_changes(listing_ids):
+    with transaction.atomic():
+        # A deleted listing already has its tombstone; an upsert must not replace it
+        existing = list(Listing.objects.filter(pk__in=listing_ids).values_list('id', flat=True))
+        bump_versions(PriceHistory)
+        if existing:
+            Listing.objects.filter(pk__in=existing).update(updated_at=timezone.now())
+            record_changes(existing)
+
+
+def changes_since(since, limit):
+    """
+    The changes recorded after a token, oldest first.
+    Args:
+        since (int): The client's token (0 to sync from the beginning).
+        limit (int): Maximum number of changes to return.
+    Returns:
+        dict: {"next": token to send next time, "has_more": whether another page follows
+               right away, "reset": whether the client must drop its copy first,
+               "upserted": [serialized listings], "deleted": [listing ids]}
+    Example:
+        >>> changes_since(0, 500)
+        {"next": "1042", "has_more": False, "reset": False, "upserted": [...], "deleted": [17]}
+    """
+    reset = ListingChange.objects.filter(pk__gt=since, kind=ListingChange.RESET).order_by('-pk').values_list('pk', flat=True).first()
+    if reset is not None:
+        since = reset  # everything up to the reset is void; the client rebuilds from it
+    page = list(
+        ListingChange.objects.filter(pk__gt=since).exclude(kind=ListingChange.RESET)
+        .order_by('pk').values_list('pk', 'listing_id', 'kind')[:limit + 1]
+    )
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    upserted_ids = [listing_id for _, listing_id, kind in page if kind == ListingChange.UPSERT]
+    rows = {row['id']: row for row in Listing.objects.filter(pk__in=upserted_ids).values(*LISTING_ROW_FIELDS)}
+    # A listing deleted after the page was read has a later tombstone; report it deleted now
+    deleted = [listing_id for _, listing_id, kind in page if kind == ListingChange.DELETE or listing_id not in rows]
+    return {
+        'next': str(page[-1][0] if page else since),
+        'has_more': has_more,
+        'reset': reset is not None,
+        'upserted': serialize_listing_rows(rows[listing_id] for listing_id in upserted_ids if listing_id in rows),
+        'deleted': deleted,
+    }
+
+
+def latest_token():
+    """
+    The sequence of the newest recorded change (0 if none): a cheap marker of the catalogue's
+    state that only grows, used to key data derived from all listings (see clusters.py).
+    """
+    return ListingChange.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
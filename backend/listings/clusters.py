@@ -0,0 +1,267 @@
+import logging
+import math
+import threading
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+
+from . import changes
+from .metrics import CacheStats
+from .models import Listing, ListingChange
+
+logger = logging.getLogger(__name__)
+
+
+#----------------------------- Map clusters -----------------------------#
+#
+# /api/listings/clusters/ aggregates the listings of each visible web-map tile into grid
+# cells (count, centroid, price min/median/max), so a map payload is bounded by the tiles
+# in view rather than by the number of listings.
+# The grid is precomputed once per process for every zoom level at once: each listing's
+# position is encoded as a Morton code (interleaved x/y bits) at GRID_ZOOM, and the arrays
+# are kept sorted by code. In that order every tile, and every cell inside it, at any zoom
+# is a contiguous slice, found with two binary searches; aggregating a tile is a handful of
+# vectorized reductions over its slice.
+# The grid follows writes through the change feed (changes.py): each use applies the
+# listings changed since the token it was built at, and rebuilds after a reset or a large
+# batch. Aggregated tiles are cached in the LISTINGS_CACHE_ALIAS cache under the latest
+# change token, so any listing write moves every tile to a new key.
+
+GRID_ZOOM = 24  # stored precision: cells of ~2.4 m at the equator
+CELL_ZOOM_OFFSET = 3  # a tile is split into 2^3 x 2^3 = 64 cells (32 px on 256 px tiles)
+MAX_ZOOM = GRID_ZOOM - CELL_ZOOM_OFFSET
+MAX_MERCATOR_LATITUDE = 85.05112878  # web-map tiles stop here
+
+# Applying more changes than this one by one costs more than rebuilding
+REBUILD_CHANGES = 10_000
+
+stats = CacheStats(tiers=('tile',), extra=('rebuilds', 'updates', 'errors'))
+
+
+def _cache():
+    return caches[settings.LISTINGS_CACHE_ALIAS]
+
+
+def tile_coordinates(latitudes, longitudes, zoom):
+    """
+    Web-mercator tile coordinates (fractional) of points at a zoom level.
+    Example:
+        >>> tile_coordinates(np.array([43.6532]), np.array([-79.3832]), 10)
+        (array([286.19...]), array([373.80...]))
+    """
+    latitudes = np.radians(np.clip(latitudes, -MAX_MERCATOR_LATITUDE, MAX_MERCATOR_LATITUDE))
+    scale = 2.0 ** zoom
+    x = (np.asarray(longitudes, dtype=float) + 180.0) / 360.0 * scale
+    y = (1.0 - np.arcsinh(np.tan(latitudes)) / math.pi) / 2.0 * scale
+    return x, y
+
+
+def _spread_bits(values):
+    # 0b1011 -> 0b01000101: bit i moves to bit 2i
+    values = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF), (4, 0x0F0F0F0F0F0F0F0F),
+                        (2, 0x3333333333333333), (1, 0x5555555555555555)):
+        values = (values | (values << np.uint64(shift))) & np.uint64(mask)
+    return values
+
+
+def morton_codes(x, y):
+    """Interleave integer tile coordinates into Morton codes (x in the even bits)."""
+    return _spread_bits(np.asarray(x)) | (_spread_bits(np.asarray(y)) << np.uint64(1))
+
+
+def grid_codes(latitudes, longitudes):
+    """Morton codes of points at GRID_ZOOM."""
+    x, y = tile_coordinates(latitudes, longitudes, GRID_ZOOM)
+    limit = 2 ** GRID_ZOOM - 1
+    return morton_codes(np.clip(x, 0, limit).astype(np.int64), np.clip(y, 0, limit).astype(np.int64))
+
+
+def tile_code_range(zoom, x, y):
+    """
+    [low, high) range of grid codes inside tile (zoom, x, y).
+    """
+    shift = 2 * (GRID_ZOOM - zoom)
+    prefix = int(morton_codes(np.array([x]), np.array([y]))[0])
+    return prefix << shift, (prefix + 1) << shift
+
+
+def parse_zoom(raw):
+    """
+    Parse a zoom level (0 to MAX_ZOOM).
+    Raises:
+        ValueError: If the value is not an integer in range.
+    """
+    try:
+        zoom = int(raw)
+        if not 0 <= zoom <= MAX_ZOOM:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid value for 'zoom': {raw!r} (expected an integer from 0 to {MAX_ZOOM})")
+    return zoom
+
+
+def tiles_in_bbox(west, south, east, north, zoom):
+    """
+    The (x, y) tiles covering a box at a zoom level, row by row from the north-west.
+    """
+    (x0, x1), (y1, y0) = tile_coordinates(np.array([south, north]), np.array([west, east]), zoom)
+    limit = 2 ** zoom - 1
+    xs = range(min(int(x0), limit), min(int(x1), limit) + 1)
+    ys = range(min(int(y0), limit), min(int(y1), limit) + 1)
+    return [(x, y) for y in ys for x in xs]
+
+
+class ClusterGrid:
+    """
+    Process-wide grid of listing positions sorted by Morton code. Thread-safe.
+    Example:
+        >>> grid.sync()
+        >>> grid.tile(10, 286, 373)
+        [{"lat": 43.65, "lng": -79.38, "count": 812, "price_min": ..., "price_median": ..., "price_max": ...}, ...]
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._token = None  # change token the arrays reflect; None until built
+
+    def invalidate(self):
+        """Drop the grid; the next sync() rebuilds it from the database."""
+        with self._lock:
+            self._token = None
+
+    def sync(self):
+        """
+        Bring the grid up to date with the change feed (one query when nothing changed).
+        """
+        with self._lock:
+            if self._token is None:
+                self._build()
+                return
+            pending = list(
+                ListingChange.objects.filter(pk__gt=self._token).order_by('pk')
+                .values_list('pk', 'listing_id', 'kind')[:REBUILD_CHANGES + 1]
+            )
+            if not pending:
+                return
+            if len(pending) > REBUILD_CHANGES or any(kind == ListingChange.RESET for _, _, kind in pending):
+                self._build()
+                return
+            self._apply([listing_id for _, listing_id, _ in pending])
+            self._token = pending[-1][0]
+            stats.incr('updates')
+
+    def _rows(self, listings):
+        rows = list(listings.filter(latitude__isnull=False, longitude__isnull=False).values_list(
+            'id', 'latitude', 'longitude', Cast('current_price', FloatField())
+        ).iterator(chunk_size=10_000))
+        ids, latitudes, longitudes, prices = (
+            np.array(column, dtype=dtype) for column, dtype in
+            zip(zip(*rows) if rows else ([], [], [], []), (np.int64, float, float, float))
+        )
+        codes = grid_codes(latitudes, longitudes)
+        order = np.argsort(codes, kind='stable')
+        return codes[order], ids[order], latitudes[order], longitudes[order], prices[order]
+
+    def _build(self):
+        token = changes.latest_token()  # read first: later writes are re-applied by the next sync
+        self._codes, self._ids, self._latitudes, self._longitudes, self._prices = self._rows(Listing.objects.all())
+        self._token = token
+        stats.incr('rebuilds')
+
+    def _apply(self, listing_ids):
+        keep = ~np.isin(self._ids, np.array(listing_ids, dtype=np.int64))
+        current = [array[keep] for array in (self._codes, self._ids, self._latitudes, self._longitudes, self._prices)]
+        fresh = self._rows(Listing.objects.filter(pk__in=listing_ids))
+        positions = np.searchsorted(current[0], fresh[0])  # both sorted: a linear merge
+        self._codes, self._ids, self._latitudes, self._longitudes, self._prices = (
+            np.insert(array, positions, values) for array, values in zip(current, fresh)
+        )
+
+    def tile(self, zoom, x, y):
+        """
+        Clusters of one tile: one per non-empty grid cell, in Morton order.
+        Returns:
+            list[dict]: {"lat", "lng" (centroid), "count", "price_min", "price_median", "price_max"},
+                        plus the listing's "id" when the cell holds a single listing.
+        """
+        with self._lock:  # the arrays are replaced, never modified, so a consistent set suffices
+            codes, ids, latitudes, longitudes, prices = (
+                self._codes, self._ids, self._latitudes, self._longitudes, self._prices
+            )
+        low, high = tile_code_range(zoom, x, y)
+        start, end = np.searchsorted(codes, np.array([low, high], dtype=np.uint64))
+        if start == end:
+            return []
+        cells = codes[start:end] >> np.uint64(2 * (GRID_ZOOM - zoom - CELL_ZOOM_OFFSET))
+        starts = np.flatnonzero(np.concatenate(([True], cells[1:] != cells[:-1])))
+        counts = np.diff(np.append(starts, end - start))
+        tile_prices = prices[start:end]
+        # Codes are sorted, so sorting by (cell, price) only reorders prices within each cell
+        sorted_prices = tile_prices[np.lexsort((tile_prices, cells))]
+        medians = (sorted_prices[starts + (counts - 1) // 2] + sorted_prices[starts + counts // 2]) / 2
+
+        clusters = []
+        for i, (count, lat, lng, low_price, median, high_price) in enumerate(zip(
+            counts.tolist(),
+            (np.add.reduceat(latitudes[start:end], starts) / counts).tolist(),
+            (np.add.reduceat(longitudes[start:end], starts) / counts).tolist(),
+            np.minimum.reduceat(tile_prices, starts).tolist(),
+            medians.tolist(),
+            np.maximum.reduceat(tile_prices, starts).tolist(),
+        )):
+            cluster = {
+                'lat': round(lat, 6), 'lng': round(lng, 6), 'count': count,
+                'price_min': low_price, 'price_median': round(median, 2), 'price_max': high_price,
+            }
+            if count == 1:
+                cluster['id'] = int(ids[start + starts[i]])
+            clusters.append(cluster)
+        return clusters
+
+
+grid = ClusterGrid()
+
+
+def tile_clusters(tiles, zoom, token):
+    """
+    Clusters of several tiles, read from the cache where possible.
+    Args:
+        tiles (list[tuple[int, int]]): (x, y) tiles at `zoom`.
+        zoom (int): The zoom level (0 to MAX_ZOOM).
+        token (int): changes.latest_token() read for this request; part of the cache keys.
+    Returns:
+        dict: {(x, y): [clusters]} for every requested tile.
+    """
+    keys = {(x, y): f'listings:clusters:{token}:{zoom}:{x}:{y}' for x, y in tiles}
+    try:
+        cached = _cache().get_many(list(keys.values()))
+    except Exception:
+        logger.warning("Listing cluster cache unavailable", exc_info=True)
+        stats.incr('errors')
+        cached = None
+
+    results, missing = {}, []
+    for tile, key in keys.items():
+        if cached is not None and key in cached:
+            results[tile] = cached[key]
+        else:
+            missing.append(tile)
+    stats.incr('tile_hits', len(results))
+    stats.incr('tile_misses', len(missing))
+    if not missing:
+        return results
+
+    grid.sync()
+    computed = {tile: grid.tile(zoom, *tile) for tile in missing}
+    results.update(computed)
+    if cached is not None:
+        try:
+            _cache().set_many({keys[tile]: clusters for tile, clusters in computed.items()})
+        except Exception:
+            logger.warning("Listing cluster cache unavailable", exc_info=True)
+            stats.incr('errors')
+    return results
@@ -0,0 +1,177 @@
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .models import Listing
+
+
+#----------------------------- Comparable listings -----------------------------#
+#
+# Every listing is a row of a NumPy feature matrix (log price, bedrooms, bathrooms,
+# log square feet) plus integer city/province codes. Finding comparables is a single
+# vectorized weighted distance over the matrix followed by argpartition, instead of a
+# Python loop or a database scan per request.
+# The matrix is built once per process on first use and kept current in place by the
+# Listing signals (see signals.py). Writes that send no signals (bulk_create,
+# queryset.update, other processes) are picked up by a full rebuild every
+# COMPARABLES_INDEX_TTL seconds.
+
+FIELDS = ('id', 'current_price', 'bedrooms', 'bathrooms', 'square_feet', 'city', 'province')
+
+# Importance of each feature after standardization: price and size matter most
+FEATURE_WEIGHTS = np.array([3.0, 1.0, 1.0, 2.0])
+# Added to the distance of listings in another city / another province
+CITY_PENALTY = 1.0
+PROVINCE_PENALTY = 2.0
+
+
+def feature_vector(current_price, bedrooms, bathrooms, square_feet):
+    """
+    Feature values of one listing. Price and size are compared on a log scale, so a
+    $100k difference matters more for a $300k condo than for a $3M house.
+    """
+    return (
+        math.log(float(current_price)) if current_price and current_price > 0 else 0.0,
+        float(bedrooms),
+        float(bathrooms),
+        math.log(square_feet) if square_feet and square_feet > 0 else 0.0,
+    )
+
+
+class ComparablesIndex:
+    """
+    Process-wide feature matrix of all listings supporting k-nearest-neighbour queries.
+    Rows are updated in place; deleted listings are tombstoned and compacted away
+    on the next rebuild. Thread-safe.
+    Example:
+        >>> index.nearest(listing, k=5)
+        [(42, 0.18), (7, 0.25), ...]
+    """
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._built_at = None
+
+    #---- Lifecycle ----#
+
+    def invalidate(self):
+        """Drop the matrix; the next query rebuilds it from the database."""
+        with self._lock:
+            self._built_at = None
+
+    def _ensure_built(self):
+        if self._built_at is None or time.monotonic() - self._built_at > settings.COMPARABLES_INDEX_TTL:
+            self._build()
+
+    def _build(self):
+        rows = list(Listing.objects.order_by('id').values_list(*FIELDS).iterator(chunk_size=10_000))
+        capacity = max(self.INITIAL_CAPACITY, len(rows))
+        self._ids = np.zeros(capacity, dtype=np.int64)
+        self._features = np.zeros((capacity, len(FEATURE_WEIGHTS)), dtype=np.float64)
+        self._cities = np.zeros(capacity, dtype=np.int32)
+        self._provinces = np.zeros(capacity, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._city_codes, self._province_codes = {}, {}
+        self._rows = {}
+        self._size = 0
+        for pk, price, bedrooms, bathrooms, square_feet, city, province in rows:
+            self._set_row(self._size, pk, feature_vector(price, bedrooms, bathrooms, square_feet), city, province)
+            self._size += 1
+        self._rescale()
+        self._built_at = time.monotonic()
+
+    def _rescale(self):
+        """Recompute per-feature spread so every feature contributes on the same scale."""
+        alive = self._features[:self._size][self._alive[:self._size]]
+        scale = alive.std(axis=0) if len(alive) > 1 else np.ones(len(FEATURE_WEIGHTS))
+        scale[scale == 0] = 1.0
+        self._inverse_scale = FEATURE_WEIGHTS / scale
+
+    #---- Incremental updates ----#
+
+    def _code(self, codes, value):
+        return codes.setdefault((value or '').strip().lower(), len(codes))
+
+    def _set_row(self, row, pk, features, city, province):
+        self._ids[row] = pk
+        self._features[row] = features
+        self._cities[row] = self._code(self._city_codes, city)
+        self._provinces[row] = self._code(self._province_codes, province)
+        self._alive[row] = True
+        self._rows[pk] = row
+
+    def _grow(self):
+        capacity = len(self._ids) * 2
+        for name in ('_ids', '_features', '_cities', '_provinces', '_alive'):
+            array = getattr(self, name)
+            grown = np.zeros((capacity,) + array.shape[1:], dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def upsert(self, listing):
+        """Add or refresh one listing's row (no-op until the matrix has been built)."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            features = feature_vector(listing.current_price, listing.bedrooms, listing.bathrooms, listing.square_feet)
+            row = self._rows.get(listing.pk)
+            if row is None:
+                if self._size == len(self._ids):
+                    self._grow()
+                row = self._size
+                self._size += 1
+            self._set_row(row, listing.pk, features, listing.city, listing.province)
+
+    def remove(self, pk):
+        """Tombstone a deleted listing's row."""
+        with self._lock:
+            if self._built_at is None:
+                return
+            row = self._rows.pop(pk, None)
+            if row is not None:
+                self._alive[row] = False
+
+    #---- Queries ----#
+
+    def nearest(self, listing, k=5, same_city=False):
+        """
+        Return the k listings most similar to `listing`, closest first.
+        Args:
+            listing (Listing): The subject listing (excluded from the results).
+            k (int): Number of comparables.
+            same_city (bool): Only consider listings in the subject's city.
+        Returns:
+            list[tuple[int, float]]: (listing id, distance) pairs; 0 means identical features.
+        """
+        subject = np.array(feature_vector(listing.current_price, listing.bedrooms, listing.bathrooms, listing.square_feet))
+        with self._lock:
+            self._ensure_built()
+            n = self._size
+            city = self._city_codes.get((listing.city or '').strip().lower(), -1)
+            province = self._province_codes.get((listing.province or '').strip().lower(), -1)
+
+            distances = np.sqrt(np.square((self._features[:n] - subject) * self._inverse_scale).sum(axis=1))
+            distances += CITY_PENALTY * (self._cities[:n] != city)
+            distances += PROVINCE_PENALTY * (self._provinces[:n] != province)
+
+            excluded = ~self._alive[:n] | (self._ids[:n] == listing.pk)
+            if same_city:
+                excluded |= self._cities[:n] != city
+            distances[excluded] = np.inf
+
+            k = min(k, n)
+            if k <= 0:
+                return []
+            candidates = np.argpartition(distances, k - 1)[:k]
+            candidates = candidates[np.argsort(distances[candidates], kind='stable')]
+            return [
+                (int(self._ids[row]), float(distances[row]))
+                for row in candidates if np.isfinite(distances[row])
+            ]
+
+
+index = ComparablesIndex()
@@ -0,0 +1,127 @@
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .models import Listing, PriceHistory, TableVersion
+
+
+#----------------------------- Conditional GET -----------------------------#
+#
+# The listing read endpoints tag their responses with a strong ETag and Last-Modified,
+# and answer a matching If-None-Match / If-Modified-Since with 304 before the view
+# queries or serializes anything. Validators come from cheap reads:
+#   - a single listing: its `updated_at`, which is also touched when one of its price
+#     histories changes (once per transaction, see changes.schedule_price_history_change);
+#   - list/search pages: the TableVersion counters of the listing and price history
+#     tables plus the request's path and query string.
+# Writes that send no signals (bulk_create, queryset.update) must call bump_versions()
+# themselves, as populate_listings does.
+
+VERSIONED_MODELS = (Listing, PriceHistory)
+
+
+def bump_versions(*models):
+    """
+    Increment the TableVersion of each model's table. Call it inside the writing
+    transaction so the new version becomes visible together with the data.
+    Example:
+        >>> bump_versions(Listing, PriceHistory)
+    """
+    now = timezone.now()
+    for model in models:
+        table = model._meta.db_table
+        if not TableVersion.objects.filter(table=table).update(version=F('version') + 1, updated_at=now):
+            _, created = TableVersion.objects.get_or_create(table=table, defaults={'version': 1})
+            if not created:  # another writer created the row first
+                TableVersion.objects.filter(table=table).update(version=F('version') + 1, updated_at=now)
+
+
+def _etag(*parts):
+    return quote_etag(hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()[:32])
+
+
+def listing_validators(request, pk):
+    """
+    (ETag, Last-Modified) of one listing's detail representation, or None if it does not exist.
+    """
+    updated_at = Listing.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return _etag('listing', pk, updated_at.isoformat()), updated_at
+
+
+def listing_query_validators(request, pk):
+    """
+    Like listing_validators(), for a per-listing resource whose body also depends on the
+    query string (e.g. a trend's forecast horizon): the ETag differs per path and query.
+    """
+    state = listing_validators(request, pk)
+    if state is None:
+        return None
+    etag, updated_at = state
+    return _etag(etag, request.get_full_path()), updated_at
+
+
+def collection_versions(request):
+    """
+    Versions of the listing tables and the latest change time, read once per request.
+    Returns:
+        tuple[tuple[int, ...], datetime | None]: One version per VERSIONED_MODELS table, and when
+                                                 the newest of them was bumped (None if never).
+    """
+    state = getattr(request, '_collection_versions', None)
+    if state is None:
+        tables = [model._meta.db_table for model in VERSIONED_MODELS]
+        rows = {table: (version, updated_at) for table, version, updated_at in
+                TableVersion.objects.filter(table__in=tables).values_list('table', 'version', 'updated_at')}
+        versions = tuple(rows.get(table, (0, None))[0] for table in tables)
+        modified = [updated_at for _, updated_at in rows.values() if updated_at]
+        state = request._collection_versions = (versions, max(modified, default=None))
+    return state
+
+
+def collection_validators(request, *args, **kwargs):
+    """
+    (ETag, Last-Modified) of a list or search page: changes whenever any listing or
+    price history is written, and differs per query string (filters, cursor, page size).
+    """
+    versions, last_modified = collection_versions(request)
+    return _etag('collection', *versions, request.get_full_path()), last_modified
+
+
+def conditional_get(validators):
+    """
+    Decorator for GET views of listing data.
+    `validators(request, *args, **kwargs)` returns (etag, last_modified) for the resource,
+    or None to skip conditional handling (e.g. when it does not exist). A request whose
+    If-None-Match / If-Modified-Since still matches gets a 304 without running the view;
+    200 responses carry ETag, Last-Modified and Cache-Control, telling clients they may
+    store the response but must revalidate after LISTINGS_HTTP_MAX_AGE seconds.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            state = validators(request, *args, **kwargs) if request.method in ('GET', 'HEAD') else None
+            if state is None:
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = state
+            timestamp = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            response.headers['ETag'] = etag
+            if timestamp is not None:
+                response.headers['Last-Modified'] = http_date(timestamp)
+            patch_cache_control(response, public=True, max_age=settings.LISTINGS_HTTP_MAX_AGE, must_revalidate=True)
+            return response
+        return wrapper
+    return decorator
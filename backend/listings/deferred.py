@@ -0,0 +1,53 @@
+import threading
+
+from django.db import transaction
+
+
+#----------------------------- Per-transaction batches -----------------------------#
+#
+# Signal receivers that maintain derived data (the change feed, market statistics) add
+# what each write touched to a batch, and the batch is flushed once, after the transaction
+# commits (immediately in autocommit mode), however many rows the transaction wrote.
+# A batch lives as long as the connection's list of pending on_commit callbacks: Django
+# replaces that list when it runs the callbacks or rolls back (to a savepoint, too), and the
+# next write then starts a new batch, so nothing written by a rolled-back transaction leaks
+# into a later flush.
+
+_batches = threading.local()  # connections are per thread, and so are their batches
+
+
+class _Batch:
+    def __init__(self, flush, callbacks):
+        self.flush = flush
+        self.callbacks = callbacks  # the connection's run_on_commit list it was started in
+        self.items = set()
+
+    def __call__(self):
+        items, self.items = self.items, set()
+        if items:
+            self.flush(items)
+
+
+def defer_until_commit(flush, item):
+    """
+    Add an item to the batch that `flush` receives once the current transaction commits.
+    Args:
+        flush (Callable[[set], None]): Called once per transaction with every item added in it.
+        item (Hashable): What the write touched (duplicates are dropped).
+    Example:
+        >>> with transaction.atomic():
+        ...     defer_until_commit(refresh_markets, ('Toronto', 'ON'))
+        ...     defer_until_commit(refresh_markets, ('Toronto', 'ON'))
+        # refresh_markets({('Toronto', 'ON')}) runs once, after the commit
+    """
+    batches = getattr(_batches, 'by_flush', None)
+    if batches is None:
+        batches = _batches.by_flush = {}
+    connection = transaction.get_connection()
+    batch = batches.get(flush)
+    if batch is None or batch.callbacks is not connection.run_on_commit:
+        batch = batches[flush] = _Batch(flush, connection.run_on_commit)
+    batch.items.add(item)
+    # Registered on every write (whichever callback runs first flushes the batch), so the
+    # batch survives the rollback of a savepoint that only part of its writes were in
+    transaction.on_commit(batch)
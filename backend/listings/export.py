@@ -0,0 +1,104 @@
+import zlib
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from .serializer import LISTING_ROW_FIELDS, serialize_listing_rows
+
+
+#----------------------------- Streaming catalogue export -----------------------------#
+#
+# /api/listings/export/ streams the whole catalogue without holding it in memory: rows are
+# read in keyset chunks (`WHERE id > <last id> ORDER BY id LIMIT n`), serialized through the
+# same fast path as list/search pages, encoded and handed to the response one chunk at a
+# time. Memory is bounded by LISTINGS_EXPORT_CHUNK_SIZE whatever the table size, and no
+# cursor stays open between chunks (a long-lived SQLite read cursor would block writers
+# for the whole download). Chunks are separate queries, so a listing written during an
+# export appears in it only if its id has not been passed yet.
+
+# format query parameter -> (Content-Type, file extension)
+EXPORT_FORMATS = {
+    'json': ('application/json', 'json'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+}
+
+
+def iter_listing_batches(listings, chunk_size=None):
+    """
+    Serialize listings chunk by chunk in id order.
+    Each chunk costs three queries: the listing rows, their price histories and their points.
+    Args:
+        listings (QuerySet): Listings to export, e.g. Listing.objects.filter(province='NS').
+        chunk_size (int, optional): Listings per chunk (default LISTINGS_EXPORT_CHUNK_SIZE).
+    Yields:
+        list[dict]: Up to `chunk_size` listings, shaped like ListingSerializer output.
+    """
+    chunk_size = chunk_size or settings.LISTINGS_EXPORT_CHUNK_SIZE
+    rows = listings.order_by('id').values(*LISTING_ROW_FIELDS)
+    last_id = 0
+    while True:
+        chunk = list(rows.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            return
+        last_id = chunk[-1]['id']
+        yield serialize_listing_rows(chunk)
+        if len(chunk) < chunk_size:  # a short chunk is the last one
+            return
+
+
+def json_array_chunks(batches):
+    """
+    Encode batches as one JSON array, byte-identical to rendering the concatenated list
+    with JSONRenderer.
+    Example:
+        >>> b''.join(json_array_chunks([[{'id': 1}], [{'id': 2}]]))
+        b'[{"id":1},{"id":2}]'
+    """
+    renderer = JSONRenderer()
+    yield b'['
+    separator = b''
+    for batch in batches:
+        yield separator + renderer.render(batch)[1:-1]  # one encoder call per chunk, brackets dropped
+        separator = b','
+    yield b']'
+
+
+def ndjson_chunks(batches):
+    """
+    Encode batches as newline-delimited JSON, one listing per line.
+    Example:
+        >>> b''.join(ndjson_chunks([[{'id': 1}, {'id': 2}]]))
+        b'{"id":1}\\n{"id":2}\\n'
+    """
+    renderer = JSONRenderer()
+    for batch in batches:
+        yield b''.join(renderer.render(item) + b'\n' for item in batch)
+
+
+def gzip_chunks(chunks, level=6):
+    """
+    Compress a byte stream on the fly into a single gzip member, yielding compressed
+    data as the compressor emits it.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip header and trailer
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(listings, export_format='json', compress=False, chunk_size=None):
+    """
+    The body of an export response as an iterator of bytes.
+    Args:
+        listings (QuerySet): Listings to export.
+        export_format (str): A key of EXPORT_FORMATS.
+        compress (bool): Gzip the encoded stream.
+        chunk_size (int, optional): Listings per database round trip.
+    Returns:
+        Iterator[bytes]: Lazily produced body chunks.
+    """
+    encode = json_array_chunks if export_format == 'json' else ndjson_chunks
+    chunks = encode(iter_listing_batches(listings, chunk_size))
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,54 @@
+from decimal import Decimal, InvalidOperation
+
+
+# Supported search query parameters: name -> (ORM lookup, value parser).
+# Which of them an index serves (composite indexes in Listing.Meta; the SQLite plans are
+# checked by ListingSearchFilterTests):
+#   - city_exact, alone or with province: listing_city_province_idx;
+#   - province, alone or with a price bound: listing_province_price_idx;
+#   - min_price with max_price: listing_price_bedrooms_idx. A one-sided price bound or
+#     min_bedrooms (listing_bedrooms_price_idx) is used only when the planner expects it to
+#     be selective; otherwise the table is scanned in id order, which also avoids a sort;
+#   - city (a substring match: /api/listings/search/text/ is the indexed alternative),
+#     min_bathrooms and min_sqft/max_sqft have no index. They narrow the rows the filters
+#     above find, or scan the table on their own.
+SEARCH_FILTERS = {
+    'city': ('city__icontains', str),
+    'city_exact': ('city', str),
+    'province': ('province', str),
+    'min_price': ('current_price__gte', Decimal),
+    'max_price': ('current_price__lte', Decimal),
+    'min_bedrooms': ('bedrooms__gte', int),
+    'min_bathrooms': ('bathrooms__gte', int),
+    'min_sqft': ('square_feet__gte', int),
+    'max_sqft': ('square_feet__lte', int),
+}
+
+
+def parse_search_filters(params):
+    """
+    Convert search query parameters into ORM filter keyword arguments.
+    Parameters that are missing or empty are ignored.
+    Args:
+        params (QueryDict): The request's query parameters (request.GET).
+    Returns:
+        dict: Keyword arguments ready for `Listing.objects.filter(**kwargs)`.
+    Raises:
+        ValueError: If a numeric parameter cannot be parsed.
+    Example:
+        >>> parse_search_filters({'province': 'BC', 'min_bedrooms': '3'})
+        {'province': 'BC', 'bedrooms__gte': 3}
+    """
+    lookups = {}
+    for name, (lookup, parse) in SEARCH_FILTERS.items():
+        raw = params.get(name)
+        if raw is None or raw.strip() == '':
+            continue
+        try:
+            value = parse(raw.strip())
+            if isinstance(value, Decimal) and not value.is_finite():
+                raise ValueError
+        except (ValueError, InvalidOperation):
+            raise ValueError(f"Invalid value for '{name}': {raw!r}")
+        lookups[lookup] = value
+    return lookups
@@ -0,0 +1,193 @@
+import csv
+import hashlib
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .changes import record_changes
+from .conditional import bump_versions
+from .models import Listing
+
+
+#----------------------------- Offline geocoding -----------------------------#
+#
+# Listings get coordinates from a local gazetteer file (no network calls; default
+# listings/data/gazetteer.csv, see LISTINGS_GAZETTEER_PATH). Rows are either an exact street
+# address or a city centre. An address found in the file gets its point. Any other listing
+# in a known city is placed near the centre, at a fixed pseudo-random offset derived from
+# its address (up to CITY_SCATTER_KM), so the listings of one city do not stack on a single
+# map pin and re-running the backfill yields the same points.
+# `python manage.py geocode_listings` backfills stored listings; populate_listings geocodes
+# the rows it writes.
+
+CITY_SCATTER_KM = 3.0
+
+KM_PER_DEGREE = 111.195  # along a meridian
+
+IGNORED_CHARACTERS = str.maketrans('', '', ".'\u2019")
+
+# Full province and territory names accepted in place of their postal codes
+PROVINCE_CODES = {
+    'alberta': 'ab', 'british columbia': 'bc', 'manitoba': 'mb', 'new brunswick': 'nb',
+    'newfoundland and labrador': 'nl', 'northwest territories': 'nt', 'nova scotia': 'ns',
+    'nunavut': 'nu', 'ontario': 'on', 'prince edward island': 'pe', 'quebec': 'qc',
+    'saskatchewan': 'sk', 'yukon': 'yt',
+}
+
+
+def normalize(value):
+    """
+    Matching form of an address part: case, periods, apostrophes and repeated whitespace
+    are ignored.
+    Example:
+        >>> normalize("  St. John's ")
+        'st johns'
+    """
+    return ' '.join((value or '').casefold().translate(IGNORED_CHARACTERS).split())
+
+
+def normalize_province(value):
+    value = normalize(value)
+    return PROVINCE_CODES.get(value, value)
+
+
+class Gazetteer:
+    """
+    In-memory lookup of place coordinates, loaded from a gazetteer CSV.
+    Example:
+        >>> gazetteer = Gazetteer.load('listings/data/gazetteer.csv')
+        >>> gazetteer.geocode('1 Main Street', 'Halifax', 'NS')
+        (44.65..., -63.57..., 'city')
+    """
+
+    def __init__(self, places):
+        """
+        Args:
+            places (Iterable[tuple[str, str, str, float, float]]): (street_address, city,
+                province, latitude, longitude); an empty street_address is a city centre.
+        """
+        self.addresses, self.cities = {}, {}
+        for street_address, city, province, latitude, longitude in places:
+            key = (normalize(city), normalize_province(province))
+            point = (float(latitude), float(longitude))
+            if normalize(street_address):
+                self.addresses[(normalize(street_address), *key)] = point
+            else:
+                self.cities[key] = point
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read a gazetteer CSV with the columns street_address, city, province, latitude and
+        longitude. Lines starting with "#" are comments.
+        Raises:
+            OSError: If the file cannot be read.
+            ValueError: If a row is missing a column or has invalid coordinates.
+        """
+        with open(path, newline='', encoding='utf-8') as f:
+            reader = csv.DictReader(line for line in f if not line.startswith('#'))
+            places = []
+            for line, row in enumerate(reader, start=2):
+                try:
+                    latitude, longitude = float(row['latitude']), float(row['longitude'])
+                    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                        raise ValueError
+                    places.append((row['street_address'], row['city'], row['province'], latitude, longitude))
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError(f"{path}: invalid gazetteer row {line}: {row}")
+        return cls(places)
+
+    def __len__(self):
+        return len(self.addresses) + len(self.cities)
+
+    def geocode(self, street_address, city, province):
+        """
+        Coordinates of an address.
+        Returns:
+            tuple[float, float, str] | None: (latitude, longitude, "address" | "city"), or None
+            when neither the address nor its city is in the gazetteer.
+        """
+        key = (normalize(city), normalize_province(province))
+        point = self.addresses.get((normalize(street_address), *key))
+        if point is not None:
+            return (*point, 'address')
+        centre = self.cities.get(key)
+        if centre is None:
+            return None
+        return (*scatter(centre, f'{normalize(street_address)}|{key[0]}|{key[1]}'), 'city')
+
+
+def scatter(centre, seed, radius_km=CITY_SCATTER_KM):
+    """
+    A point at a fixed pseudo-random offset of up to `radius_km` from `centre`, uniform over
+    the disc and the same for the same `seed`.
+    """
+    digest = hashlib.blake2b(seed.encode(), digest_size=8).digest()
+    u, v = int.from_bytes(digest[:4], 'big') / 2 ** 32, int.from_bytes(digest[4:], 'big') / 2 ** 32
+    distance, bearing = radius_km * math.sqrt(u), 2 * math.pi * v
+    latitude = centre[0] + distance * math.cos(bearing) / KM_PER_DEGREE
+    longitude = centre[1] + distance * math.sin(bearing) / (KM_PER_DEGREE * max(math.cos(math.radians(centre[0])), 0.01))
+    return round(max(-90.0, min(90.0, latitude)), 6), round(max(-180.0, min(180.0, longitude)), 6)
+
+
+@lru_cache(maxsize=None)
+def default_gazetteer():
+    """
+    The gazetteer at LISTINGS_GAZETTEER_PATH, loaded once per process.
+    """
+    return Gazetteer.load(settings.LISTINGS_GAZETTEER_PATH)
+
+
+def backfill_coordinates(gazetteer, overwrite=False, batch_size=5000):
+    """
+    Geocode stored listings, one transaction per batch.
+    Each batch reads the listings' addresses, then writes all coordinates with one prepared
+    UPDATE, records the listings in the change feed and bumps the listing version (a raw
+    UPDATE sends no signals).
+    Args:
+        gazetteer (Gazetteer): Where coordinates come from.
+        overwrite (bool): Also re-geocode listings that already have coordinates.
+        batch_size (int): Listings per batch.
+    Returns:
+        dict: {"address": n, "city": n, "unmatched": n} listing counts, plus "unmatched_places":
+              {(city, province): listings} for the places missing from the gazetteer.
+    Example:
+        >>> backfill_coordinates(default_gazetteer())
+        {"address": 0, "city": 100000, "unmatched": 12, "unmatched_places": {("Springfield", "IL"): 12}}
+    """
+    listings = Listing.objects.all() if overwrite else Listing.objects.filter(latitude__isnull=True)
+    listings = listings.order_by('id').values_list('id', 'street_address', 'city', 'province')
+    counts = {'address': 0, 'city': 0, 'unmatched': 0, 'unmatched_places': {}}
+    table = connection.ops.quote_name(Listing._meta.db_table)
+    last_id = 0
+    while True:
+        batch = list(listings.filter(pk__gt=last_id)[:batch_size])
+        if not batch:
+            return counts
+        last_id = batch[-1][0]
+
+        now = connection.ops.adapt_datetimefield_value(timezone.now())  # raw SQL: adapt as the ORM would
+        updates = []
+        for pk, street_address, city, province in batch:
+            found = gazetteer.geocode(street_address, city, province)
+            if found is None:
+                counts['unmatched'] += 1
+                counts['unmatched_places'][(city, province)] = counts['unmatched_places'].get((city, province), 0) + 1
+                continue
+            latitude, longitude, precision = found
+            counts[precision] += 1
+            updates.append((latitude, longitude, now, pk))
+
+        if updates:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.executemany(
+                        f"UPDATE {table} SET latitude = %s, longitude = %s, updated_at = %s WHERE id = %s", updates
+                    )
+                bump_versions(Listing)
+                record_changes(pk for *_, pk in updates)
+        if len(batch) < batch_size:  # a short batch is the last one
+            return counts
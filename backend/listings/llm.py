@@ -0,0 +1,166 @@
+import asyncio
+import hashlib
+import json
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, DefaultHttpxClient, OpenAI
+
+from .profiling import timed
+
+
+#----------------------------- Shared OpenAI clients -----------------------------#
+#
+# Creating an OpenAI client opens a new connection pool, so doing it per request
+# pays a fresh TCP/TLS handshake for every analysis. The clients below are created
+# once per process (the async one once per event loop, since httpx async pools are
+# bound to the loop they were created on) and reused with keep-alive.
+
+ANALYSIS_MODEL = "gpt-3.5-turbo"
+ANALYSIS_SYSTEM_PROMPT = "You are a real estate market analyst."
+ANALYSIS_PARAMS = {"max_tokens": 256, "temperature": 0.7}
+
+_lock = threading.Lock()
+_sync_client = None
+_async_clients = weakref.WeakKeyDictionary()  # event loop -> (AsyncOpenAI, asyncio.Semaphore)
+
+
+def _timeout():
+    return httpx.Timeout(settings.OPENAI_TIMEOUT, connect=settings.OPENAI_CONNECT_TIMEOUT)
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=settings.OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_messages(prompt):
+    """
+    Wrap a user prompt in the chat messages sent for a housing analysis.
+    """
+    return [
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def request_key(prompt):
+    """
+    Stable SHA-256 hex digest of everything that determines a completion: model,
+    sampling parameters and the rendered messages. Identical requests share a key.
+    Example:
+        >>> request_key("Analyze ...")
+        '9f2c...'
+    """
+    request = {"model": ANALYSIS_MODEL, "messages": build_messages(prompt), **ANALYSIS_PARAMS}
+    encoded = json.dumps(request, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def get_client():
+    """
+    Return the process-wide synchronous OpenAI client (thread-safe, pooled).
+    """
+    global _sync_client
+    with _lock:
+        if _sync_client is None:
+            _sync_client = OpenAI(
+                api_key=settings.OPENAI_API_KEY,
+                base_url=settings.OPENAI_BASE_URL,
+                timeout=_timeout(),
+                max_retries=settings.OPENAI_MAX_RETRIES,
+                http_client=DefaultHttpxClient(limits=_limits(), timeout=_timeout()),
+            )
+        return _sync_client
+
+
+def _get_async_entry():
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL,
+            timeout=_timeout(),
+            max_retries=settings.OPENAI_MAX_RETRIES,
+            http_client=DefaultAsyncHttpxClient(limits=_limits(), timeout=_timeout()),
+        )
+        entry = _async_clients[loop] = (client, asyncio.Semaphore(settings.OPENAI_MAX_CONCURRENCY))
+    return entry
+
+
+def get_async_client():
+    """
+    Return the pooled AsyncOpenAI client for the running event loop.
+    Must be called from within a coroutine.
+    """
+    return _get_async_entry()[0]
+
+
+def complete(prompt, max_retries=None):
+    """
+    Run a housing analysis completion with the shared sync client and return the text.
+    `max_retries` overrides OPENAI_MAX_RETRIES for this call (e.g. 0 when the caller retries itself).
+    """
+    client = get_client() if max_retries is None else get_client().with_options(max_retries=max_retries)
+    with timed('llm'):
+        response = client.chat.completions.create(
+            model=ANALYSIS_MODEL,
+            messages=build_messages(prompt),
+            **ANALYSIS_PARAMS,
+        )
+    return response.choices[0].message.content.strip()
+
+
+def stream(prompt):
+    """
+    Stream a housing analysis completion with the shared sync client.
+    Yields:
+        str: Text deltas in the order OpenAI produces them.
+    """
+    with timed('llm'):
+        response = get_client().chat.completions.create(
+            model=ANALYSIS_MODEL,
+            messages=build_messages(prompt),
+            stream=True,
+            **ANALYSIS_PARAMS,
+        )
+    try:
+        for chunk in response:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        response.close()
+
+
+async def acomplete(prompt):
+    """
+    Async counterpart of complete(). At most OPENAI_MAX_CONCURRENCY calls run at once
+    per event loop; further callers wait for a free slot instead of opening more connections.
+    """
+    client, semaphore = _get_async_entry()
+    with timed('llm'):
+        async with semaphore:
+            response = await client.chat.completions.create(
+                model=ANALYSIS_MODEL,
+                messages=build_messages(prompt),
+                **ANALYSIS_PARAMS,
+            )
+    return response.choices[0].message.content.strip()
+
+
+def reset_clients():
+    """
+    Drop the shared clients so the next call rebuilds them from current settings (used by tests).
+    """
+    global _sync_client
+    with _lock:
+        if _sync_client is not None:
+            _sync_client.close()
+        _sync_client = None
+        _async_clients.clear()
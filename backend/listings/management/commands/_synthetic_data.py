@@ -0,0 +1,163 @@
+import random
+import re
+import statistics
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from listings.changes import record_changes
+from listings.gazetteer import default_gazetteer
+from listings.models import Listing, PriceHistory, PricePoint
+
+from ._sample_data import sample_listings
+
+
+def build_price_history(current_price, rng, today=None):
+    """
+    Generate 3-6 historical price points for a listing over roughly the past year.
+    The most recent point is the current price; older points vary by -5% to +10%.
+    Args:
+        current_price (float): The listing's current price.
+        rng (random.Random): Random source, so histories are reproducible from a seed.
+        today (date, optional): Date of the most recent point's reference (defaults to today).
+    Returns:
+        list[dict]: [{"date": "YYYY-MM-DD", "price": 123.45}, ...] sorted oldest first.
+    """
+    today = today or date.today()
+    num_entries = rng.randint(3, 6)
+    price_history = []
+
+    for i in range(num_entries):
+        # Dates going back in time (30-90 days apart)
+        days_back = rng.randint(30, 90) * (i + 1)
+        entry_date = today - timedelta(days=days_back)
+
+        # First entry is the current price, older ones vary around it
+        price = current_price if i == 0 else current_price * rng.uniform(0.95, 1.1)
+
+        price_history.append({
+            'date': entry_date.isoformat(),
+            'price': round(price, 2)
+        })
+
+    # Sort by date (oldest first)
+    price_history.sort(key=lambda x: x['date'])
+    return price_history
+
+
+class SyntheticListingGenerator:
+    """
+    Produce realistic listing rows for load testing, with distributions derived from
+    the hand-written sample data: city/province frequency, per-city price per square
+    foot, bedroom counts, and the vocabulary of titles, streets, descriptions and images.
+    The same seed always yields the same sequence of listings.
+    Example:
+        >>> generator = SyntheticListingGenerator(seed=42)
+        >>> rows = [generator.listing(i) for i in range(3)]
+    """
+
+    def __init__(self, seed=None, samples=sample_listings):
+        self.rng = random.Random(seed)
+
+        locations = Counter((s['city'], s['province']) for s in samples)
+        self.locations = list(locations)
+        self.location_weights = list(locations.values())
+
+        price_per_sqft = defaultdict(list)
+        for s in samples:
+            price_per_sqft[s['city']].append(float(s['current_price']) / s['square_feet'])
+        self.city_price_per_sqft = {city: statistics.median(values) for city, values in price_per_sqft.items()}
+
+        self.descriptions = defaultdict(list)
+        for s in samples:
+            self.descriptions[s['city']].append(s['description'])
+
+        bedrooms = Counter(s['bedrooms'] for s in samples)
+        self.bedroom_choices = list(bedrooms)
+        self.bedroom_weights = list(bedrooms.values())
+        self.sqft_per_bedroom = statistics.median(s['square_feet'] / s['bedrooms'] for s in samples)
+
+        self.adjectives = sorted({s['title'].split()[0] for s in samples})
+        self.property_types = sorted({s['title'].split()[-1] for s in samples})
+        self.streets = sorted({re.sub(r'^\d+\s*', '', s['street_address']) for s in samples})
+        self.image_urls = sorted({s['image_url'] for s in samples})
+
+    def listing(self, index):
+        """
+        Return the field values for one synthetic Listing.
+        """
+        rng = self.rng
+        city, province = rng.choices(self.locations, weights=self.location_weights)[0]
+        bedrooms = rng.choices(self.bedroom_choices, weights=self.bedroom_weights)[0]
+        square_feet = max(400, int(rng.gauss(bedrooms * self.sqft_per_bedroom, self.sqft_per_bedroom * 0.3)))
+        price = square_feet * self.city_price_per_sqft[city] * rng.uniform(0.8, 1.25)
+
+        return {
+            'title': f"{rng.choice(self.adjectives)} {rng.choice(self.property_types)} #{index}",
+            'street_address': f"{rng.randint(1, 9999)} {rng.choice(self.streets)}",
+            'city': city,
+            'province': province,
+            'description': rng.choice(self.descriptions[city]),
+            'current_price': Decimal(str(round(price, -3))),
+            'bedrooms': bedrooms,
+            'bathrooms': max(1, min(bedrooms, bedrooms - 1 + rng.randint(0, 1))),
+            'square_feet': square_feet,
+            'image_url': rng.choice(self.image_urls),
+        }
+
+    def price_history(self, current_price, today=None):
+        """
+        Return a price history for a listing, drawn from this generator's seeded RNG.
+        """
+        return build_price_history(float(current_price), self.rng, today)
+
+
+def write_listings(batch):
+    """
+    Insert a batch of (listing fields, price history) pairs in one transaction using
+    bulk_create for listings, their PriceHistory rows and the PricePoint rows.
+    Listings without coordinates are geocoded from the offline gazetteer.
+    Args:
+        batch (list[tuple[dict, list[dict]]]): Listing field values and their price history.
+    Returns:
+        int: Number of price points written.
+    """
+    today = date.today()
+    gazetteer = default_gazetteer()
+    listings = [Listing(**listing_data) for listing_data, _ in batch]
+    for listing in listings:
+        if listing.latitude is None:
+            found = gazetteer.geocode(listing.street_address, listing.city, listing.province)
+            if found is not None:
+                listing.latitude, listing.longitude, _ = found
+    with transaction.atomic():
+        listings = Listing.objects.bulk_create(listings)
+        histories = PriceHistory.objects.bulk_create(
+            [PriceHistory(listing_id=listing.pk, date_recorded=today) for listing in listings]
+        )
+        # Plain ids instead of related instances keep per-object overhead low for large batches
+        points = [
+            PricePoint(listing_id=history.listing_id, price_history_id=history.pk, date=point['date'], price=point['price'])
+            for history, (_, price_history) in zip(histories, batch)
+            for point in price_history
+        ]
+        PricePoint.objects.bulk_create(points)
+        record_changes(listing.pk for listing in listings)  # bulk_create sends no signals
+    return len(points)
+
+
+def seed_listings(count, seed=None, batch_size=5000):
+    """
+    Generate and bulk-insert `count` synthetic listings with price histories.
+    Returns:
+        int: Number of listings written.
+    """
+    generator = SyntheticListingGenerator(seed)
+    for start in range(0, count, batch_size):
+        batch = []
+        for index in range(start, min(start + batch_size, count)):
+            listing_data = generator.listing(index)
+            batch.append((listing_data, generator.price_history(listing_data['current_price'])))
+        write_listings(batch)
+    return count
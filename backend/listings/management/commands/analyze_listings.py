@@ -0,0 +1,240 @@
+import contextlib
+import queue
+import random
+import threading
+import time
+
+import openai
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import OuterRef, Subquery
+from listings.analysis import expiry_cutoff, get_cached_analysis, store_analysis
+from listings.llm import complete, request_key
+from listings.models import AnalysisCache, Listing, PriceHistory
+from listings.views import OpenAIProxyAPIView
+
+# Upstream errors worth another attempt: throttling, timeouts, dropped connections and 5xx
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+# Listings whose prompts are rendered and checked against the cache per query
+PLAN_CHUNK_SIZE = 500
+
+
+class RateLimiter:
+    """
+    Spaces calls at least 1/rate seconds apart across all threads (rate <= 0 disables it).
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next, now)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate AI analyses for listings without a current AnalysisCache entry using a pool of workers. '
+        'Finished analyses are stored as they complete, so an interrupted run resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--city', help='Only listings in this city (case-insensitive)')
+        parser.add_argument('--province', help='Only listings in this province (case-insensitive)')
+        parser.add_argument('--ids', help='Comma-separated listing ids')
+        parser.add_argument('--limit', type=int, default=None, help='Analyze at most this many listings')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent OpenAI calls')
+        parser.add_argument('--rate', type=float, default=2.0, help='Max requests started per second (0 = unlimited)')
+        parser.add_argument('--max-retries', type=int, default=3, help='Retries per listing on throttling/5xx/network errors')
+        parser.add_argument('--backoff', type=float, default=1.0, help='Base seconds for exponential backoff between retries')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many listings would be analyzed')
+
+    def handle(self, *args, **options):
+        if not settings.OPENAI_API_KEY and not options['dry_run']:
+            raise CommandError('OpenAI API key not configured.')
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+
+        listings, pending = self.plan(self.candidate_listings(options), options['limit'])
+        self.stdout.write(f'{listings} listings need an analysis ({len(pending)} distinct prompts)')
+        if options['dry_run'] or not pending:
+            return
+
+        self.limiter = RateLimiter(options['rate'])
+        self.max_retries = options['max_retries']
+        self.backoff = options['backoff']
+        self.counts = {'analyzed': 0, 'cached': 0, 'failed': 0, 'retries': 0}
+        self.latencies = []
+        self._lock = threading.Lock()
+        # On SQLite workers overlap on OpenAI calls, not on the (short) cache reads and writes:
+        # it admits one writer at a time and would fail the others with "database is locked".
+        # Other databases handle concurrent connections themselves.
+        self._db_lock = threading.Lock() if connection.vendor == 'sqlite' else contextlib.nullcontext()
+
+        jobs = queue.Queue()
+        for job in pending:
+            jobs.put(job)
+        workers = [threading.Thread(target=self.work, args=(jobs,), daemon=True) for _ in range(options['workers'])]
+
+        start = last_report = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(0.05)
+                if time.perf_counter() - last_report >= 5:
+                    last_report = time.perf_counter()
+                    self.report(len(pending), start)
+        except KeyboardInterrupt:
+            # Stop handing out work; whatever finished is already stored, so a rerun resumes
+            self.drain(jobs)
+            for worker in workers:
+                worker.join()
+            self.stdout.write(self.style.WARNING('Interrupted; rerun the command to continue.'))
+        self.summary(start)
+
+    def candidate_listings(self, options):
+        """
+        The selected listings, annotated with the latest price history id that
+        analyze-housing would put in their prompt.
+        """
+        latest = PriceHistory.objects.filter(listing=OuterRef('pk')).order_by('-date_recorded').values('pk')[:1]
+        listings = Listing.objects.annotate(latest_history_id=Subquery(latest))
+
+        if options['city']:
+            listings = listings.filter(city__iexact=options['city'])
+        if options['province']:
+            listings = listings.filter(province__iexact=options['province'])
+        if options['ids']:
+            try:
+                ids = [int(pk) for pk in options['ids'].split(',') if pk.strip()]
+            except ValueError:
+                raise CommandError(f"Invalid value for '--ids': {options['ids']!r}")
+            listings = listings.filter(pk__in=ids)
+        return listings.order_by('id')
+
+    def plan(self, listings, limit=None):
+        """
+        Render each candidate's prompt and keep those with no unexpired AnalysisCache row
+        for its hash, i.e. what analyze-housing would miss on. Listings with identical
+        prompts become one job, since one stored analysis serves all of them.
+        Returns:
+            tuple[int, list[tuple]]: Listings needing an analysis, and the
+                                     (listing, price history, prompt) jobs (at most `limit`).
+        """
+        jobs, seen, needed, last_id = [], set(), 0, 0
+        while limit is None or len(jobs) < limit:
+            # Keyset chunks rather than one long-lived cursor, which would hold SQLite locks
+            chunk = list(listings.filter(pk__gt=last_id)[:PLAN_CHUNK_SIZE])
+            if not chunk:
+                break
+            last_id = chunk[-1].pk
+            histories = PriceHistory.objects.prefetch_related('points').in_bulk(
+                [listing.latest_history_id for listing in chunk if listing.latest_history_id]
+            )
+            rendered = []
+            for listing in chunk:
+                price_history = histories.get(listing.latest_history_id)
+                prompt = OpenAIProxyAPIView._generate_prompt(listing, price_history)
+                rendered.append((listing, price_history, prompt, request_key(prompt)))
+            cached = set(AnalysisCache.objects.filter(
+                prompt_hash__in=[key for *_, key in rendered], timestamp__gte=expiry_cutoff()
+            ).values_list('prompt_hash', flat=True))
+
+            for listing, price_history, prompt, key in rendered:
+                if key in cached:
+                    continue
+                if key not in seen:
+                    if limit is not None and len(jobs) == limit:
+                        break
+                    seen.add(key)
+                    jobs.append((listing, price_history, prompt))
+                needed += 1
+        return needed, jobs
+
+    def work(self, jobs):
+        try:
+            while True:
+                try:
+                    job = jobs.get_nowait()
+                except queue.Empty:
+                    return
+                outcome = self.analyze_one(*job)
+                with self._lock:
+                    self.counts[outcome] += 1
+        finally:
+            connection.close()  # Each worker thread has its own database connection
+
+    def analyze_one(self, listing, price_history, prompt):
+        # A web request may have analyzed it since the run started
+        with self._db_lock:
+            if get_cached_analysis(listing, price_history, prompt) is not None:
+                return 'cached'
+
+        try:
+            analysis = self.complete_with_retries(prompt)
+        except Exception as e:
+            self.stderr.write(f'Listing {listing.pk}: {e}')
+            return 'failed'
+        with self._db_lock:
+            store_analysis(listing, price_history, analysis, prompt)
+        return 'analyzed'
+
+    def complete_with_retries(self, prompt):
+        for attempt in range(self.max_retries + 1):
+            self.limiter.wait()
+            start = time.perf_counter()
+            try:
+                analysis = complete(prompt, max_retries=0)  # retries are handled here, not by the SDK
+            except RETRYABLE_ERRORS as e:
+                if attempt == self.max_retries:
+                    raise
+                with self._lock:
+                    self.counts['retries'] += 1
+                time.sleep(self.retry_delay(e, attempt))
+                continue
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+            return analysis
+
+    def retry_delay(self, error, attempt):
+        """Exponential backoff with jitter, never shorter than the server's Retry-After."""
+        delay = self.backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+        response = getattr(error, 'response', None)
+        try:
+            retry_after = float(response.headers.get('retry-after', 0)) if response is not None else 0.0
+        except ValueError:
+            retry_after = 0.0
+        return max(delay, retry_after)
+
+    @staticmethod
+    def drain(jobs):
+        while True:
+            try:
+                jobs.get_nowait()
+            except queue.Empty:
+                return
+
+    def report(self, total, start):
+        with self._lock:
+            done = sum(self.counts[key] for key in ('analyzed', 'cached', 'failed'))
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'  {done:,}/{total:,} listings ({done / elapsed * 60:,.1f}/min)')
+
+    def summary(self, start):
+        elapsed = time.perf_counter() - start
+        counts = self.counts
+        latency = f', mean OpenAI latency {sum(self.latencies) / len(self.latencies):.2f}s' if self.latencies else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Analyzed {counts['analyzed']} listings ({counts['cached']} already cached, {counts['failed']} failed, "
+            f"{counts['retries']} retries) in {elapsed:.1f}s: {counts['analyzed'] / max(elapsed, 1e-9) * 60:,.1f} analyses/min{latency}"
+        ))
@@ -0,0 +1,263 @@
+import itertools
+import json
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from listings import analysis, response_cache
+from listings.market import rebuild_market_stats
+from listings.models import Listing
+
+from ._synthetic_data import seed_listings
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the listings API hot paths on a seeded synthetic dataset and write machine-readable results. '
+        'The dataset is created inside a transaction that is rolled back at the end.'
+    )
+
+    WRITE_BATCH = 100  # listings written per request of the write:* cases
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help='Synthetic listings to seed')
+        parser.add_argument('--iterations', type=int, default=50, help='Timed requests per case')
+        parser.add_argument('--warmup', type=int, default=3, help='Untimed requests per case before measuring')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic dataset')
+        parser.add_argument('--llm-latency', type=float, default=0.0,
+                            help='Seconds the stubbed OpenAI call sleeps on analysis cache misses')
+        parser.add_argument('--cases', default='', help='Comma-separated case names to run (default: all)')
+        parser.add_argument('--output', default='', help='Write results as JSON to this path')
+        parser.add_argument('--compare', default='', help='Baseline results JSON to compare against')
+
+    def handle(self, *args, **options):
+        baseline = self.load_baseline(options['compare'])
+        client = Client()
+
+        with override_settings(ALLOWED_HOSTS=['testserver'], OPENAI_API_KEY=settings.OPENAI_API_KEY or 'sk-benchmark'), \
+                mock.patch('listings.analysis.complete', side_effect=self.stub_completion(options['llm_latency'])), \
+                transaction.atomic():
+            analysis.clear_memory()
+            response_cache.clear()
+            start = time.perf_counter()
+            seed_listings(options['rows'], options['seed'])
+            rebuild_market_stats()
+            self.stdout.write(f"Seeded {options['rows']} listings in {time.perf_counter() - start:.1f}s")
+
+            cases = self.build_cases(client, options['iterations'] + options['warmup'])
+            selected = [name.strip() for name in options['cases'].split(',') if name.strip()]
+            unknown = set(selected) - set(cases)
+            if unknown:
+                raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}. Available: {', '.join(cases)}")
+
+            results = {}
+            for name, request in cases.items():
+                if selected and name not in selected:
+                    continue
+                # Only the ":cached" cases read through the listing response cache
+                with override_settings(LISTINGS_RESPONSE_CACHE=name.endswith(':cached')):
+                    results[name] = self.run_case(request, options['iterations'], options['warmup'])
+                self.stdout.write(f"  {name:<28} p50 {results[name]['p50_ms']:>8.2f} ms  "
+                                  f"p95 {results[name]['p95_ms']:>8.2f} ms  "
+                                  f"{results[name]['queries_per_request']:>5.1f} queries")
+
+            # Nothing here is meant to persist
+            transaction.set_rollback(True)
+            analysis.clear_memory()
+            response_cache.clear()
+
+        report = {'metadata': self.metadata(options), 'results': results}
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if baseline:
+            self.print_comparison(baseline, results)
+
+    @staticmethod
+    def stub_completion(latency):
+        def complete(prompt):
+            if latency:
+                time.sleep(latency)
+            return 'Benchmark analysis.'
+        return complete
+
+    def build_cases(self, client, requests_needed):
+        """
+        Map case name -> zero-argument callable performing one request and returning the response.
+        """
+        ids = list(Listing.objects.order_by('id').values_list('id', flat=True))
+        hot_id = ids[0]
+        # Each stubbed miss analyzes a listing that has not been analyzed yet
+        miss_ids = iter(ids[1:requests_needed + 1])
+        list_url = reverse('listing-list')
+        search_url = reverse('listing-search')
+        text_search_url = reverse('listing-text-search')
+        within_url = reverse('listing-within')
+        analyze_url = reverse('analyze-housing')
+
+        def analyze(listing_id):
+            return client.post(analyze_url, {'listing_id': listing_id}, content_type='application/json')
+
+        def analyze_db_hit():
+            analysis.clear_memory()
+            return analyze(hot_id)
+
+        # Write cases: one "request" ingests WRITE_BATCH listings, one by one or through the bulk API
+        batches = itertools.count()
+
+        def feed_items(batch, prefix):
+            return [{
+                'external_id': f'{prefix}-{batch}-{i}', 'title': f'Feed Home {i}', 'street_address': f'{i} Feed Road',
+                'city': 'Halifax', 'province': 'NS', 'description': 'Imported from a partner feed.',
+                'current_price': '450000.00', 'bedrooms': 3, 'bathrooms': 2, 'square_feet': 1400,
+                'image_url': 'https://example.com/feed.jpg',
+            } for i in range(self.WRITE_BATCH)]
+
+        def create_per_row():
+            for item in feed_items(next(batches), 'row'):
+                response = client.post(reverse('listing-create'), item, content_type='application/json')
+            return response
+
+        def bulk_create():
+            return client.post(reverse('listing-bulk-upsert'), feed_items(next(batches), 'bulk'), content_type='application/json')
+
+        upserted = feed_items('upsert', 'bulk')
+        client.post(reverse('listing-bulk-upsert'), upserted, content_type='application/json')
+
+        def bulk_update():
+            return client.post(reverse('listing-bulk-upsert'), upserted, content_type='application/json')
+
+        def revalidate(url):
+            # A client polling with the ETag of its previous response (answered with 304)
+            etag = client.get(url)['ETag']
+            return lambda: client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        return {
+            'list:first_page': lambda: client.get(list_url),
+            'list:page_size_200': lambda: client.get(list_url, {'page_size': 200}),
+            'list:not_modified': revalidate(list_url),
+            'list:cached': lambda: client.get(list_url),
+            'detail': lambda: client.get(reverse('listing-detail', args=[hot_id])),
+            'detail:not_modified': revalidate(reverse('listing-detail', args=[hot_id])),
+            'comparables': lambda: client.get(reverse('listing-comparables', args=[hot_id])),
+            'trend': lambda: client.get(reverse('listing-trend', args=[hot_id])),
+            'trends:batch_100': lambda: client.get(reverse('listing-trends'), {'ids': ','.join(map(str, ids[:100]))}),
+            'market_stats': lambda: client.get(reverse('market-stats'), {'province': 'ON'}),
+            'search:city': lambda: client.get(search_url, {'city': 'tor'}),
+            'search:city:cached': lambda: client.get(search_url, {'city': 'tor'}),
+            'search:province_price': lambda: client.get(search_url, {'province': 'BC', 'min_price': 500000, 'max_price': 900000}),
+            'search:bedrooms_sqft': lambda: client.get(search_url, {'min_bedrooms': 4, 'min_sqft': 2500}),
+            'search:selective': lambda: client.get(search_url, {'city_exact': 'Yellowknife', 'min_price': 400000}),
+            'search:fulltext': lambda: client.get(text_search_url, {'q': 'modern kitchen'}),
+            # Map views over Toronto: downtown, the whole region (more listings than one response holds), a radius
+            'geo:bbox_downtown': lambda: client.get(within_url, {'bbox': '-79.42,43.63,-79.35,43.68'}),
+            'geo:bbox_region': lambda: client.get(within_url, {'bbox': '-80.0,43.4,-78.8,44.1'}),
+            'geo:radius_2km': lambda: client.get(within_url, {'lat': 43.6532, 'lng': -79.3832, 'radius_km': 2}),
+            # Clustered map views: the whole country, then the Toronto region (tiles cached after the first call)
+            'clusters:country': lambda: client.get(reverse('listing-clusters'), {'zoom': 4, 'bbox': '-141,41,-52,70'}),
+            'clusters:region': lambda: client.get(reverse('listing-clusters'), {'zoom': 10, 'bbox': '-80.0,43.4,-78.8,44.1'}),
+            'analyze:memory_hit': lambda: analyze(hot_id),
+            'analyze:db_hit': analyze_db_hit,
+            'analyze:stubbed_miss': lambda: analyze(next(miss_ids)),
+            f'write:per_row_x{self.WRITE_BATCH}': create_per_row,
+            f'write:bulk_create_x{self.WRITE_BATCH}': bulk_create,
+            f'write:bulk_update_x{self.WRITE_BATCH}': bulk_update,
+        }
+
+    @staticmethod
+    def run_case(request, iterations, warmup):
+        for _ in range(warmup):
+            request()
+
+        timings, queries, sizes, statuses = [], [], [], {}
+        total_start = time.perf_counter()
+        for _ in range(iterations):
+            reset_queries()
+            with CaptureQueriesContext(connection) as ctx:
+                start = time.perf_counter()
+                response = request()
+                timings.append((time.perf_counter() - start) * 1000)
+            queries.append(len(ctx.captured_queries))
+            sizes.append(len(response.content))
+            statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        total = time.perf_counter() - total_start
+
+        timings.sort()
+        return {
+            'iterations': iterations,
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p90_ms': round(percentile(timings, 90), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'max_ms': round(timings[-1], 3),
+            'throughput_rps': round(iterations / total, 1),
+            'queries_per_request': round(statistics.fmean(queries), 2),
+            'response_bytes': round(statistics.fmean(sizes)),
+            'status_codes': statuses,
+        }
+
+    @staticmethod
+    def metadata(options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'rows': options['rows'],
+            'iterations': options['iterations'],
+            'seed': options['seed'],
+            'llm_latency_s': options['llm_latency'],
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        }
+
+    @staticmethod
+    def load_baseline(path):
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read baseline {path}: {e}")
+
+    def print_comparison(self, baseline, results):
+        commit = baseline.get('metadata', {}).get('commit') or 'baseline'
+        self.stdout.write(f"\nComparison with {commit} (p50 / p95 ms, negative is faster)")
+        for name, current in results.items():
+            previous = baseline.get('results', {}).get(name)
+            if not previous:
+                self.stdout.write(f"  {name:<28} (new case)")
+                continue
+            deltas = []
+            for metric in ('p50_ms', 'p95_ms'):
+                change = (current[metric] - previous[metric]) / previous[metric] * 100 if previous[metric] else 0.0
+                deltas.append(f"{previous[metric]:.2f} -> {current[metric]:.2f} ({change:+.1f}%)")
+            queries = f"queries {previous['queries_per_request']:g} -> {current['queries_per_request']:g}"
+            self.stdout.write(f"  {name:<28} {'  '.join(deltas)}  {queries}")
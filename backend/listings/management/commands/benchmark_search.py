@@ -0,0 +1,108 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from listings.filters import parse_search_filters
+from listings.models import Listing
+from listings.search import ListingTextSearch, search_backend
+
+from ._synthetic_data import SyntheticListingGenerator
+
+
+# Representative /api/listings/search/ query strings: broad filters that match many
+# rows and selective ones where an unindexed search has to scan the whole table
+SEARCH_CASES = {
+    'city (common)': {'city_exact': 'Toronto'},
+    'city (rare)': {'city_exact': 'Yellowknife', 'province': 'NT'},
+    'province+price': {'province': 'BC', 'min_price': '500000', 'max_price': '900000'},
+    'narrow price': {'min_price': '500000', 'max_price': '502000'},
+    'luxury': {'min_price': '7000000'},
+    'bedrooms+price': {'min_bedrooms': '7', 'max_price': '450000'},
+}
+
+# /api/listings/search/text/?q= queries, timed on the full-text index and on icontains over every column
+TEXT_SEARCH_CASES = {
+    'common word': 'modern kitchen',
+    'rare word': 'wine cellar',
+    'street name': 'Granville',
+    'no match': 'waterslide',
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark listing search filters with and without the composite indexes (all changes are rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100_000, help='Number of synthetic listings to seed')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per search case')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic rows')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed_listings(options['rows'], options['seed'])
+            with_indexes = self.time_cases(options['repeat'])
+            text_search = self.time_text_cases(options['repeat'])
+            self.drop_indexes()
+            without_indexes = self.time_cases(options['repeat'])
+            # Nothing here is meant to persist: discard the rows and restore the indexes
+            transaction.set_rollback(True)
+
+        self.stdout.write(f"\nSearch benchmark over {options['rows']} listings (median of {options['repeat']} runs, ms)\n")
+        self.stdout.write(f"{'case':<20}{'no index':>12}{'indexed':>12}{'speedup':>10}")
+        for name in SEARCH_CASES:
+            before, after = without_indexes[name], with_indexes[name]
+            self.stdout.write(f"{name:<20}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+        self.stdout.write(f"\nFull-text search ({search_backend()}), first ranked page incl. count (median ms)\n")
+        self.stdout.write(f"{'case':<20}{'icontains':>12}{'full-text':>12}{'speedup':>10}")
+        for name, (naive, fulltext) in text_search.items():
+            self.stdout.write(f"{name:<20}{naive:>12.2f}{fulltext:>12.2f}{naive / fulltext:>9.1f}x")
+
+    def seed_listings(self, rows, seed):
+        """Bulk-insert `rows` synthetic listings (see _synthetic_data.py)."""
+        generator = SyntheticListingGenerator(seed)
+        for start in range(0, rows, 5000):
+            Listing.objects.bulk_create(
+                [Listing(**generator.listing(i)) for i in range(start, min(start + 5000, rows))]
+            )
+        # Refresh planner statistics, as autovacuum/ANALYZE would on a real database
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.stdout.write(f"Seeded {rows} listings")
+
+    def drop_indexes(self):
+        """Drop the Listing search indexes inside the current transaction."""
+        with connection.cursor() as cursor:
+            for index in Listing._meta.indexes:
+                cursor.execute(f"DROP INDEX {connection.ops.quote_name(index.name)}")
+
+    def time_cases(self, repeat):
+        """Run the query search_listings issues for the first page of each case and return median milliseconds."""
+        results = {}
+        for name, params in SEARCH_CASES.items():
+            queryset = Listing.objects.filter(**parse_search_filters(params)).order_by('id')
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                list(queryset[:51])
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = statistics.median(timings)
+        return results
+
+    def time_text_cases(self, repeat):
+        """Time the count and first page of each text query with both backends: name -> (icontains ms, full-text ms)."""
+        results = {}
+        for name, query in TEXT_SEARCH_CASES.items():
+            medians = []
+            for backend in ('icontains', search_backend()):
+                timings = []
+                for _ in range(repeat):
+                    search = ListingTextSearch(query, backend=backend)
+                    start = time.perf_counter()
+                    search.count()
+                    search[:50]
+                    timings.append((time.perf_counter() - start) * 1000)
+                medians.append(statistics.median(timings))
+            results[name] = tuple(medians)
+        return results
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from listings.gazetteer import Gazetteer, backfill_coordinates, default_gazetteer
+
+
+class Command(BaseCommand):
+    help = 'Set listing coordinates from an offline gazetteer file (no network access)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gazetteer', default=None,
+                            help='Gazetteer CSV to use instead of LISTINGS_GAZETTEER_PATH')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-geocode listings that already have coordinates')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Listings geocoded per transaction')
+
+    def handle(self, *args, **options):
+        try:
+            gazetteer = Gazetteer.load(options['gazetteer']) if options['gazetteer'] else default_gazetteer()
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Could not load the gazetteer: {e}')
+
+        start = time.perf_counter()
+        counts = backfill_coordinates(gazetteer, overwrite=options['all'], batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Geocoded {counts['address'] + counts['city']} listings "
+            f"({counts['address']} by address, {counts['city']} by city) in {elapsed:.1f}s"
+        ))
+        if counts['unmatched']:
+            places = sorted(counts['unmatched_places'].items(), key=lambda item: -item[1])
+            self.stdout.write(self.style.WARNING(
+                f"{counts['unmatched']} listings are in places missing from the gazetteer: "
+                + ', '.join(f'{city}, {province} ({count})' for (city, province), count in places[:10])
+            ))
@@ -1,87 +1,100 @@
-from django.core.management.base import BaseCommand
-from listings.models import Listing, PriceHistory
-import json
-from datetime import date, timedelta
 import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.management.color import no_style
 from django.db import connection
+from listings.analysis import clear_memory
+from listings.changes import record_reset
+from listings.conditional import bump_versions
+from listings.market import rebuild_market_stats
+from listings.models import AnalysisCache, Listing, MarketStats, PriceHistory, PricePoint
 
 # Import listings from your new data file
 from ._sample_data import sample_listings
+from ._synthetic_data import SyntheticListingGenerator, build_price_history, write_listings
 
 
 class Command(BaseCommand):
-    help = 'Create sample listings with price history data'
+    help = 'Create sample listings with price history data (or --count N synthetic listings for load testing)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=None,
+                            help='Generate this many synthetic listings instead of the hand-written samples')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Listings written per bulk_create batch / transaction')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Random seed for reproducible synthetic data and price histories')
 
     def handle(self, *args, **options):
         # Clear existing data
-        Listing.objects.all().delete()
-        PriceHistory.objects.all().delete()
-        self.reset_auto_increment()
-        
-        created_listings = []
-        
-        # Create listings
-        for listing_data in sample_listings:
-            listing = Listing.objects.create(**listing_data)
-            created_listings.append(listing)
-            self.stdout.write(
-                self.style.SUCCESS(f'Created listing: {listing.title}')
-            )
-        
-        # Create price history for each listing
-        for listing in created_listings:
-            # Generate 3-6 historical price points over the past year
-            num_entries = random.randint(3, 6)
-            # Start with current price and work backwards
-            current_price = float(listing.current_price)
-            price_history = []
-            
-            for i in range(num_entries):
-                # Generate dates going back in time (30-90 days apart)
-                days_back = random.randint(30, 90) * (i + 1)
-                entry_date = date.today() - timedelta(days=days_back)
-                
-                # Vary price by -5% to +10% from current price
-                if i == 0:
-                    # First entry is current price
-                    price = current_price
-                else:
-                    # Historical prices with some variation
-                    variation = random.uniform(0.95, 1.1)
-                    price = current_price * variation
-                
-                price_history.append({
-                    'date': entry_date.isoformat(),
-                    'price': round(price, 2)
-                })
-            
-            # Sort by date (oldest first)
-            price_history.sort(key=lambda x: x['date'])
-            
-            # Create PriceHistory entry
-            PriceHistory.objects.create(
-                listing=listing,
-                price_values=json.dumps(price_history),
-                date_recorded=date.today()
-            )
-            
-            self.stdout.write(
-                self.style.SUCCESS(f'Created price history for: {listing.title}')
+        self.reset_tables()
+        clear_memory()  # Listing ids are reused after the reset, so drop cached analyses
+
+        if options['count'] is None:
+            rng = random.Random(options['seed'])
+            rows = (
+                (listing_data, build_price_history(float(listing_data['current_price']), rng))
+                for listing_data in sample_listings
             )
-        
+            total = len(sample_listings)
+        else:
+            generator = SyntheticListingGenerator(options['seed'])
+            rows = self.synthetic_rows(generator, options['count'])
+            total = options['count']
+
+        start = last_report = time.perf_counter()
+        created, points = 0, 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == options['batch_size']:
+                points += write_listings(batch)
+                created += len(batch)
+                batch = []
+                # Progress summary every few seconds instead of a line per row
+                if time.perf_counter() - last_report >= 5:
+                    last_report = time.perf_counter()
+                    self.report_progress(created, total, start)
+        if batch:
+            points += write_listings(batch)
+            created += len(batch)
+
+        # bulk_create sends no signals, so the per-city statistics are rebuilt in one pass
+        # and the listing ETags are invalidated explicitly
+        markets = rebuild_market_stats()
+        bump_versions(Listing, PriceHistory)
+
+        elapsed = time.perf_counter() - start
         self.stdout.write(
             self.style.SUCCESS(
-                f'Successfully created {len(created_listings)} listings with price history'
+                f'Successfully created {created} listings with price history '
+                f'({points} price points, {markets} markets) in {elapsed:.1f}s ({created / max(elapsed, 1e-9):,.0f} listings/s)'
             )
         )
 
-    def reset_auto_increment(self):
-        """Reset auto-increment counters for SQLite database"""
-        with connection.cursor() as cursor:
-            # Reset auto-increment counters
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name='listings_listing';")
-            cursor.execute("DELETE FROM sqlite_sequence WHERE name='listings_pricehistory';")
-            
+    @staticmethod
+    def synthetic_rows(generator, count):
+        for index in range(count):
+            listing_data = generator.listing(index)
+            yield listing_data, generator.price_history(listing_data['current_price'])
+
+    def report_progress(self, created, total, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'  {created:,}/{total:,} listings ({created / max(elapsed, 1e-9):,.0f} listings/s)')
+
+    def reset_tables(self):
+        """Empty the listing tables and reset their id sequences on any supported database"""
+        models = [AnalysisCache, MarketStats, PricePoint, PriceHistory, Listing]
+        sql = connection.ops.sql_flush(
+            no_style(),
+            [model._meta.db_table for model in models],
+            reset_sequences=True,
+        )
+        connection.ops.execute_sql_flush(sql)
+        # Listing ids restart at 1, so change feed tokens issued so far must not be resumed
+        record_reset()
+
         self.stdout.write(
-            self.style.SUCCESS('Reset auto-increment counters')
+            self.style.SUCCESS('Cleared listings and reset auto-increment counters')
         )
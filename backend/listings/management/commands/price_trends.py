@@ -0,0 +1,38 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from listings.trends import iter_catalogue_trends, parse_horizon
+
+
+class Command(BaseCommand):
+    help = 'Compute the price trend of every listing in one pass and write them as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='File to write (default: standard output)')
+        parser.add_argument('--horizon-days', default=None,
+                            help='Forecast horizon (default LISTINGS_TREND_FORECAST_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=10_000,
+                            help='Listings read and computed per batch')
+
+    def handle(self, *args, **options):
+        try:
+            horizon = parse_horizon(options['horizon_days'], settings.LISTINGS_TREND_FORECAST_DAYS)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        start = time.perf_counter()
+        count = 0
+        out = open(options['output'], 'w', encoding='utf-8') if options['output'] else self.stdout
+        try:
+            for pk, trend in iter_catalogue_trends(horizon, batch_size=options['batch_size']):
+                out.write(json.dumps({'listing_id': pk, **trend}, separators=(',', ':')) + '\n')
+                count += 1
+        finally:
+            if out is not self.stdout:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(
+            f"Computed price trends of {count} listings in {time.perf_counter() - start:.1f}s"
+        ))
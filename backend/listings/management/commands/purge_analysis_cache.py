@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from listings.analysis import purge_analysis_cache
+
+
+class Command(BaseCommand):
+    help = 'Delete expired AnalysisCache rows and trim the table to the newest --max-rows rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-rows', type=int, default=None, help='Rows to keep (default: ANALYSIS_CACHE_MAX_ROWS)')
+
+    def handle(self, *args, **options):
+        deleted = purge_analysis_cache(options['max_rows'])
+        self.stdout.write(self.style.SUCCESS(f'Purged {deleted} analysis cache rows'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+from listings.market import rebuild_market_stats, refresh_stale_markets
+
+
+class Command(BaseCommand):
+    help = 'Recompute every MarketStats row from the listings and their price points'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stale', action='store_true',
+            help='Only recompute the markets written since their last refresh (cheap enough to schedule often)',
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        markets = refresh_stale_markets() if options['stale'] else rebuild_market_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f'Refreshed statistics for {markets} markets in {time.perf_counter() - start:.1f}s')
+        )
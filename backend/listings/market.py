@@ -0,0 +1,168 @@
+import statistics
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from .deferred import defer_until_commit
+from .models import Listing, MarketStats, PricePoint, StaleMarket
+
+
+#----------------------------- Market statistics -----------------------------#
+#
+# MarketStats holds one precomputed row per (city, province), so /api/listings/stats/
+# reads a handful of rows however many listings there are. A median cannot be updated
+# from a delta, and recomputing a market costs a pass over its listings, so writes do not
+# refresh rows themselves:
+#   - a transaction that wrote a Listing or PriceHistory marks the markets it touched stale
+#     after it commits (signals.py -> schedule_refresh): one INSERT, whatever the city size;
+#   - refresh_stale_markets() recomputes every marked market in one batch. The stats endpoint
+#     runs it before reading, so many writes to a city between two reads cost one refresh,
+#     and `python manage.py refresh_market_stats --stale` runs it from a scheduler;
+#   - `python manage.py refresh_market_stats` (and populate_listings) rebuilds every row
+#     in one pass, which also covers bulk writes that send no signals.
+
+TREND_WINDOW_DAYS = 365
+CENTS = Decimal('0.01')
+
+
+def _money(value):
+    return Decimal(value).quantize(CENTS, rounding=ROUND_HALF_UP)
+
+
+def compute_market_stats(listings, point_series):
+    """
+    Aggregate one market.
+    Args:
+        listings (list[tuple]): (current_price, square_feet, bedrooms, bathrooms) per listing.
+        point_series (Iterable[list[Decimal]]): Each listing's prices inside the trend window, oldest first.
+    Returns:
+        dict: MarketStats field values (without city/province), or None for an empty market.
+    Example:
+        >>> compute_market_stats([(Decimal('500000'), 1000, 2, 1)], [[Decimal('480000'), Decimal('500000')]])
+        {'listing_count': 1, 'median_price': Decimal('500000.00'), ..., 'price_change_1y': 4.17, 'trend_sample_size': 1}
+    """
+    if not listings:
+        return None
+    prices = [price for price, _, _, _ in listings]
+    per_sqft = [price / square_feet for price, square_feet, _, _ in listings if square_feet]
+
+    # Median of each listing's own change over the window (first vs latest price in it), so
+    # the trend is not skewed by which homes happened to be listed early vs late in the year
+    changes = [float(series[-1] / series[0] - 1) for series in point_series if len(series) > 1 and series[0]]
+
+    return {
+        'listing_count': len(listings),
+        'median_price': _money(statistics.median(prices)),
+        'average_price': _money(sum(prices) / len(prices)),
+        'median_price_per_sqft': _money(statistics.median(per_sqft)) if per_sqft else None,
+        'average_bedrooms': round(statistics.fmean(bedrooms for _, _, bedrooms, _ in listings), 2),
+        'average_bathrooms': round(statistics.fmean(bathrooms for _, _, _, bathrooms in listings), 2),
+        'price_change_1y': round(statistics.median(changes) * 100, 2) if changes else None,
+        'trend_sample_size': len(changes),
+    }
+
+
+def _trend_cutoff():
+    return date.today() - timedelta(days=TREND_WINDOW_DAYS)
+
+
+def refresh_market_stats(locations):
+    """
+    Recompute the MarketStats rows of the given (city, province) pairs from the database.
+    Cost is proportional to the listings in those cities, not the whole table.
+    """
+    for city, province in set(locations):
+        listings = Listing.objects.filter(city=city, province=province)
+        rows = list(listings.values_list('current_price', 'square_feet', 'bedrooms', 'bathrooms'))
+        series = defaultdict(list)
+        points = PricePoint.objects.filter(listing__in=listings, date__gte=_trend_cutoff()).order_by('listing_id', 'date', 'id')
+        for listing_id, price in points.values_list('listing_id', 'price'):
+            series[listing_id].append(price)
+
+        values = compute_market_stats(rows, series.values())
+        if values is None:
+            MarketStats.objects.filter(city=city, province=province).delete()
+        else:
+            MarketStats.objects.update_or_create(city=city, province=province, defaults=values)
+
+
+def rebuild_market_stats():
+    """
+    Recompute every MarketStats row in one pass over listings and last year's price points.
+    Returns:
+        int: Number of markets written.
+    """
+    started = timezone.now()
+    markets = defaultdict(list)
+    location_of = {}
+    for pk, city, province, *row in Listing.objects.values_list(
+        'id', 'city', 'province', 'current_price', 'square_feet', 'bedrooms', 'bathrooms'
+    ).iterator(chunk_size=10_000):
+        markets[(city, province)].append(tuple(row))
+        location_of[pk] = (city, province)
+
+    series = defaultdict(lambda: defaultdict(list))  # location -> listing id -> prices
+    points = PricePoint.objects.filter(date__gte=_trend_cutoff()).order_by('listing_id', 'date', 'id')
+    for listing_id, price in points.values_list('listing_id', 'price').iterator(chunk_size=10_000):
+        if listing_id in location_of:
+            series[location_of[listing_id]][listing_id].append(price)
+
+    stats = [
+        MarketStats(city=city, province=province, **compute_market_stats(rows, series[(city, province)].values()))
+        for (city, province), rows in markets.items()
+    ]
+    with transaction.atomic():
+        MarketStats.objects.all().delete()
+        MarketStats.objects.bulk_create(stats)
+        StaleMarket.objects.filter(marked_at__lte=started).delete()
+    return len(stats)
+
+
+def refresh_stale_markets():
+    """
+    Recompute the markets marked stale, then clear the marks this refresh covered.
+    Costs one query when no market is marked.
+    Returns:
+        int: Number of markets refreshed.
+    """
+    started = timezone.now()
+    stale = list(StaleMarket.objects.values_list('id', 'city', 'province'))
+    if not stale:
+        return 0
+    refresh_market_stats([(city, province) for _, city, province in stale])
+    # A write committed after `started` renewed its mark, which stays for the next refresh
+    StaleMarket.objects.filter(pk__in=[pk for pk, _, _ in stale], marked_at__lte=started).delete()
+    return len(stale)
+
+
+def schedule_refresh(city, province):
+    """
+    Mark a market stale once the current transaction commits (immediately in autocommit
+    mode). All markets a transaction wrote are marked with a single INSERT.
+    """
+    defer_until_commit(_mark_stale, (city, province))
+
+
+def schedule_listing_refresh(listing_id):
+    """
+    schedule_refresh() for the market of a listing that is not loaded: the listings noted in
+    a transaction are resolved to their markets with one query after it commits.
+    """
+    defer_until_commit(_mark_listings_stale, listing_id)
+
+
+def _mark_stale(locations):
+    now = timezone.now()
+    StaleMarket.objects.bulk_create(
+        [StaleMarket(city=city, province=province, marked_at=now) for city, province in locations],
+        update_conflicts=True, unique_fields=['city', 'province'], update_fields=['marked_at'],
+    )
+
+
+def _mark_listings_stale(listing_ids):
+    locations = set(Listing.objects.filter(pk__in=listing_ids).values_list('city', 'province'))
+    if locations:
+        _mark_stale(locations)
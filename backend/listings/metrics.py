@@ -0,0 +1,71 @@
+import threading
+
+from django.core.cache.backends.locmem import LocMemCache
+
+
+class CacheStats:
+    """
+    Thread-safe per-process hit/miss counters for a cache with one or more tiers
+    (or endpoints). snapshot() adds a `<tier>_hit_rate` for every tier.
+    Args:
+        tiers (Iterable[str]): Names that get `<name>_hits` / `<name>_misses` counters.
+        extra (Iterable[str]): Additional plain counters.
+    Example:
+        >>> stats = CacheStats(tiers=('memory', 'db'), extra=('db_evictions',))
+        >>> stats.incr('memory_hits')
+        >>> stats.snapshot()['memory_hit_rate']
+        1.0
+    """
+
+    def __init__(self, tiers, extra=()):
+        self.tiers = tuple(tiers)
+        self.fields = tuple(f'{tier}_{outcome}' for tier in self.tiers for outcome in ('hits', 'misses')) + tuple(extra)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, field, amount=1):
+        with self._lock:
+            self._counts[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            counts = dict(self._counts)
+        for tier in self.tiers:
+            lookups = counts[f'{tier}_hits'] + counts[f'{tier}_misses']
+            counts[f'{tier}_hit_rate'] = round(counts[f'{tier}_hits'] / lookups, 4) if lookups else None
+        return counts
+
+    def reset(self):
+        with self._lock:
+            self._counts = dict.fromkeys(self.fields, 0)
+
+
+_culled = {}  # cache LOCATION -> entries culled and not yet taken (shared like LocMemCache's storage)
+
+
+class CountingLocMemCache(LocMemCache):
+    """
+    LocMemCache that counts the entries its LRU cull drops when MAX_ENTRIES is reached,
+    which LocMemCache otherwise does silently. Use as a cache BACKEND.
+    Example:
+        >>> cache.set('key', 'value')
+        >>> cache.take_culled()  # entries culled by sets since the last call, in any thread
+        0
+    """
+
+    def __init__(self, name, params):
+        super().__init__(name, params)
+        self._name = name
+        _culled.setdefault(name, 0)
+
+    def _cull(self):
+        # Called by _set() with the location's lock held
+        size = len(self._cache)
+        super()._cull()
+        _culled[self._name] += size - len(self._cache)
+
+    def take_culled(self):
+        """Return the number of entries culled since the last call, and reset it."""
+        with self._lock:
+            count, _culled[self._name] = _culled[self._name], 0
+        return count
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0004_analysiscache'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['city', 'province'], name='listing_city_province_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['province', 'current_price'], name='listing_province_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['current_price', 'bedrooms'], name='listing_price_bedrooms_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['bedrooms', 'current_price'], name='listing_bedrooms_price_idx'),
+        ),
+    ]
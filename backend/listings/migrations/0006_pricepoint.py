@@ -0,0 +1,81 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:33
+
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def _parse_price_values(raw, end_date):
+    # Frozen copy of listings.models.parse_price_values as of this migration
+    if isinstance(raw, str):
+        raw = json.loads(raw) if raw.strip() else []
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+    end_date = end_date or date.today()
+
+    points = []
+    for i, item in enumerate(raw or []):
+        if isinstance(item, dict):
+            points.append((date.fromisoformat(str(item['date'])[:10]), Decimal(str(item['price']))))
+        else:
+            points.append((end_date - timedelta(days=30 * (len(raw) - 1 - i)), Decimal(str(item))))
+    return sorted(points, key=lambda point: point[0])
+
+
+def blobs_to_points(apps, schema_editor):
+    """Expand every PriceHistory.price_values blob into PricePoint rows."""
+    PriceHistory = apps.get_model('listings', 'PriceHistory')
+    PricePoint = apps.get_model('listings', 'PricePoint')
+
+    batch = []
+    for history in PriceHistory.objects.only('id', 'listing_id', 'price_values', 'date_recorded').iterator(chunk_size=2000):
+        for point_date, price in _parse_price_values(history.price_values, history.date_recorded):
+            batch.append(PricePoint(listing_id=history.listing_id, price_history_id=history.id, date=point_date, price=price))
+        if len(batch) >= 5000:
+            PricePoint.objects.bulk_create(batch)
+            batch = []
+    PricePoint.objects.bulk_create(batch)
+
+
+def points_to_blobs(apps, schema_editor):
+    """Rebuild the price_values blobs from PricePoint rows (reverse migration)."""
+    PriceHistory = apps.get_model('listings', 'PriceHistory')
+    PricePoint = apps.get_model('listings', 'PricePoint')
+
+    series = {}
+    for point in PricePoint.objects.order_by('price_history_id', 'date', 'id').iterator(chunk_size=2000):
+        series.setdefault(point.price_history_id, []).append({'date': point.date.isoformat(), 'price': float(point.price)})
+    for history_id, values in series.items():
+        PriceHistory.objects.filter(id=history_id).update(price_values=values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0005_listing_search_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PricePoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('listing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='price_points', to='listings.listing')),
+                ('price_history', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='points', to='listings.pricehistory')),
+            ],
+            options={
+                'ordering': ['date', 'id'],
+                'indexes': [models.Index(fields=['listing', 'date'], name='pricepoint_listing_date_idx')],
+            },
+        ),
+        migrations.RunPython(blobs_to_points, points_to_blobs),
+        migrations.RemoveField(
+            model_name='pricehistory',
+            name='price_values',
+        ),
+    ]
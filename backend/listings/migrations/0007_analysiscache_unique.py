@@ -0,0 +1,35 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:36
+
+from django.db import migrations, models
+
+
+def delete_duplicate_analyses(apps, schema_editor):
+    """Keep the newest AnalysisCache row per (listing, price_history) so the constraints can be added."""
+    AnalysisCache = apps.get_model('listings', 'AnalysisCache')
+    seen = set()
+    duplicates = []
+    for entry in AnalysisCache.objects.order_by('-timestamp', '-id').values('id', 'listing_id', 'price_history_id').iterator():
+        key = (entry['listing_id'], entry['price_history_id'])
+        if key in seen:
+            duplicates.append(entry['id'])
+        seen.add(key)
+    AnalysisCache.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0006_pricepoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_analyses, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='analysiscache',
+            constraint=models.UniqueConstraint(fields=('listing', 'price_history'), name='analysiscache_unique_listing_history'),
+        ),
+        migrations.AddConstraint(
+            model_name='analysiscache',
+            constraint=models.UniqueConstraint(condition=models.Q(('price_history__isnull', True)), fields=('listing',), name='analysiscache_unique_listing_no_history'),
+        ),
+    ]
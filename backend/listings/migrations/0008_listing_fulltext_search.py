@@ -0,0 +1,78 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:50
+
+from django.db import migrations
+from django.db.utils import OperationalError
+
+# SQL is frozen here on purpose; listings/search.py holds the live copy used at query time
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE listings_listing_fts USING fts5(
+        title, street_address, city, description, tokenize = 'porter unicode61'
+    )""",
+    """INSERT INTO listings_listing_fts(rowid, title, street_address, city, description)
+        SELECT id, title, street_address, city, description FROM listings_listing""",
+    """CREATE TRIGGER IF NOT EXISTS listings_listing_fts_insert AFTER INSERT ON listings_listing BEGIN
+        INSERT INTO listings_listing_fts(rowid, title, street_address, city, description)
+        VALUES (new.id, new.title, new.street_address, new.city, new.description);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS listings_listing_fts_update
+    AFTER UPDATE OF title, street_address, city, description ON listings_listing BEGIN
+        UPDATE listings_listing_fts
+        SET title = new.title, street_address = new.street_address, city = new.city, description = new.description
+        WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS listings_listing_fts_delete AFTER DELETE ON listings_listing BEGIN
+        DELETE FROM listings_listing_fts WHERE rowid = old.id;
+    END""",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS listings_listing_fts_insert",
+    "DROP TRIGGER IF EXISTS listings_listing_fts_update",
+    "DROP TRIGGER IF EXISTS listings_listing_fts_delete",
+    "DROP TABLE IF EXISTS listings_listing_fts",
+]
+
+POSTGRES_FORWARD = [
+    """CREATE INDEX listing_fulltext_idx ON listings_listing USING GIN ((
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(street_address, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(city, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'D')
+    ))""",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS listing_fulltext_idx",
+]
+
+
+def create_fulltext_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(SQLITE_FORWARD[0])
+        except OperationalError:
+            return  # SQLite built without FTS5: search falls back to icontains
+        for sql in SQLITE_FORWARD[1:]:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        for sql in POSTGRES_FORWARD:
+            schema_editor.execute(sql)
+
+
+def drop_fulltext_index(apps, schema_editor):
+    statements = {'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0007_analysiscache_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
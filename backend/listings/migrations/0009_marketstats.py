@@ -0,0 +1,37 @@
+# Generated by Django 4.2.21 on 2026-10-17 23:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_listing_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('province', models.CharField(max_length=100)),
+                ('listing_count', models.IntegerField()),
+                ('median_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('average_price', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('median_price_per_sqft', models.DecimalField(decimal_places=2, max_digits=12, null=True)),
+                ('average_bedrooms', models.FloatField()),
+                ('average_bathrooms', models.FloatField()),
+                ('price_change_1y', models.FloatField(null=True)),
+                ('trend_sample_size', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['province', 'city'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='marketstats',
+            constraint=models.UniqueConstraint(fields=('city', 'province'), name='marketstats_unique_location'),
+        ),
+    ]
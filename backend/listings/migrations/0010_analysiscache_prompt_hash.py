@@ -0,0 +1,37 @@
+# Generated by Django 4.2.21 on 2026-10-18 00:01
+
+from django.db import migrations, models
+
+
+def clear_analysis_cache(apps, schema_editor):
+    """
+    Existing rows cannot be attributed to the prompt they were generated from (the
+    listing may have been edited since), so they are dropped rather than risk keeping
+    stale analyses. The cache refills on demand or via `manage.py analyze_listings`.
+    """
+    apps.get_model('listings', 'AnalysisCache').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0009_marketstats'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_analysis_cache, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='analysiscache',
+            name='analysiscache_unique_listing_history',
+        ),
+        migrations.RemoveConstraint(
+            model_name='analysiscache',
+            name='analysiscache_unique_listing_no_history',
+        ),
+        migrations.AddField(
+            model_name='analysiscache',
+            name='prompt_hash',
+            field=models.CharField(default='', max_length=64, unique=True),
+            preserve_default=False,
+        ),
+    ]
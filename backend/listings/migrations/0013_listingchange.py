@@ -0,0 +1,34 @@
+# Generated by Django 4.2.21 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+def record_existing_listings(apps, schema_editor):
+    """
+    Start the feed with one upsert per existing listing, so syncing from the beginning
+    (no `since` token) returns the whole catalogue.
+    """
+    Listing = apps.get_model('listings', 'Listing')
+    ListingChange = apps.get_model('listings', 'ListingChange')
+    ids = Listing.objects.order_by('id').values_list('id', flat=True)
+    ListingChange.objects.bulk_create((ListingChange(listing_id=pk, kind='upsert') for pk in ids.iterator()), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0012_listing_external_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('listing_id', models.IntegerField(db_index=True, null=True)),
+                ('kind', models.CharField(choices=[('upsert', 'Upsert'), ('delete', 'Delete'), ('reset', 'Reset')], default='upsert', max_length=10)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.RunPython(record_existing_listings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,78 @@
+# Generated by Django 4.2.21 on 2026-10-18 00:37
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.utils import OperationalError
+
+# SQL is frozen here on purpose; listings/geo.py holds the live copy used at query time
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE listings_listing_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)",
+    """INSERT INTO listings_listing_rtree(id, min_lat, max_lat, min_lng, max_lng)
+        SELECT id, latitude, latitude, longitude, longitude FROM listings_listing
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL""",
+    """CREATE TRIGGER IF NOT EXISTS listings_listing_rtree_insert AFTER INSERT ON listings_listing
+    WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN
+        INSERT INTO listings_listing_rtree(id, min_lat, max_lat, min_lng, max_lng)
+        VALUES (new.id, new.latitude, new.latitude, new.longitude, new.longitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS listings_listing_rtree_update
+    AFTER UPDATE OF latitude, longitude ON listings_listing BEGIN
+        DELETE FROM listings_listing_rtree WHERE id = old.id;
+        INSERT INTO listings_listing_rtree(id, min_lat, max_lat, min_lng, max_lng)
+        SELECT new.id, new.latitude, new.latitude, new.longitude, new.longitude
+        WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS listings_listing_rtree_delete AFTER DELETE ON listings_listing BEGIN
+        DELETE FROM listings_listing_rtree WHERE id = old.id;
+    END""",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS listings_listing_rtree_insert",
+    "DROP TRIGGER IF EXISTS listings_listing_rtree_update",
+    "DROP TRIGGER IF EXISTS listings_listing_rtree_delete",
+    "DROP TABLE IF EXISTS listings_listing_rtree",
+]
+
+
+def create_spatial_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return  # other databases use listing_lat_lng_idx
+    try:
+        schema_editor.execute(SQLITE_FORWARD[0])
+    except OperationalError:
+        return  # SQLite built without R*Tree: geo queries fall back to listing_lat_lng_idx
+    for sql in SQLITE_FORWARD[1:]:
+        schema_editor.execute(sql)
+
+
+def drop_spatial_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for sql in SQLITE_BACKWARD:
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0013_listingchange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='latitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-90), django.core.validators.MaxValueValidator(90)]),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='longitude',
+            field=models.FloatField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(-180), django.core.validators.MaxValueValidator(180)]),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['latitude', 'longitude'], name='listing_lat_lng_idx'),
+        ),
+        migrations.RunPython(create_spatial_index, drop_spatial_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.21 on 2026-10-18 01:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0014_listing_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StaleMarket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('province', models.CharField(max_length=100)),
+                ('marked_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stalemarket',
+            constraint=models.UniqueConstraint(fields=('city', 'province'), name='stalemarket_unique_location'),
+        ),
+    ]
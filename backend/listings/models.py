@@ -1,7 +1,27 @@
-from django.db import models
+import json
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, transaction
 
 # Create your models here.
 
+class ListingQuerySet(models.QuerySet):
+    """
+    Query layer for Listing that knows which relations the API serializers read.
+    Views should build their querysets from here so that serializing N listings
+    costs a constant number of queries instead of one extra query per row.
+    """
+    def with_price_histories(self):
+        """
+        Prefetch the price history rows and their points used by ListingSerializer.price_histories.
+        Returns:
+            ListingQuerySet: The same queryset with `pricehistory_set` and each history's `points`
+            prefetched (one query per relation, independent of the number of listings).
+        """
+        return self.prefetch_related('pricehistory_set__points')
+
 class Listing(models.Model):
     """
     Django model representing a real estate property listing.
@@ -18,6 +38,12 @@ class Listing(models.Model):
         bathrooms (IntegerField): Number of bathrooms in the property
         square_feet (IntegerField): Total square footage of the property
         image_url (URLField): URL link to the main property image (max 500 characters)
+        external_id (CharField): Optional key of the listing in a partner feed; unique, used by
+                                 the bulk API to upsert (null for listings created by hand)
+        latitude / longitude (FloatField): WGS84 coordinates in degrees, set by the client or by
+                                           `manage.py geocode_listings` (null until geocoded)
+        updated_at (DateTimeField): When the listing or one of its price histories last changed
+                                    (the basis of the detail endpoint's ETag / Last-Modified)
     Methods:
         __str__(): Returns the listing title as the string representation of the object
     Example:
@@ -46,45 +72,129 @@ class Listing(models.Model):
     bathrooms = models.IntegerField()
     square_feet = models.IntegerField()
     image_url = models.URLField(max_length=500)
+    external_id = models.CharField(max_length=100, unique=True, null=True, blank=True)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ListingQuerySet.as_manager()
+
+    class Meta:
+        # Composite indexes backing the /api/listings/search/ filters (see listings/filters.py)
+        indexes = [
+            models.Index(fields=['city', 'province'], name='listing_city_province_idx'),
+            models.Index(fields=['province', 'current_price'], name='listing_province_price_idx'),
+            models.Index(fields=['current_price', 'bedrooms'], name='listing_price_bedrooms_idx'),
+            models.Index(fields=['bedrooms', 'current_price'], name='listing_bedrooms_price_idx'),
+            # Bounding-box fallback where the R*Tree index is unavailable (see listings/geo.py)
+            models.Index(fields=['latitude', 'longitude'], name='listing_lat_lng_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The market the row was read in, so saving it can tell whether it moved without
+        # reading it again (see listings/signals.py); unknown when city/province were deferred
+        if 'city' in instance.__dict__ and 'province' in instance.__dict__:
+            instance._loaded_market = (instance.city, instance.province)
+        return instance
 
     def __str__(self):
         return f"{self.title} - {self.city} - ${self.current_price}"
 
+def parse_price_values(raw, end_date=None):
+    """
+    Normalize a price history payload into a list of (date, price) pairs.
+    Accepts the formats that have been stored in PriceHistory.price_values over time:
+    a list of {"date": "YYYY-MM-DD", "price": 123.0} dicts, the same list JSON-encoded
+    as a string, or a bare list of prices. Bare prices carry no dates, so they are
+    placed 30 days apart ending at `end_date` (today if not given).
+    Args:
+        raw (list | str): The price history payload.
+        end_date (date, optional): Date of the last bare price.
+    Returns:
+        list[tuple[date, Decimal]]: Points sorted by date.
+    """
+    if isinstance(raw, str):
+        raw = json.loads(raw) if raw.strip() else []
+    if isinstance(end_date, datetime):
+        end_date = end_date.date()
+    end_date = end_date or date.today()
+
+    points = []
+    for i, item in enumerate(raw or []):
+        if isinstance(item, dict):
+            points.append((date.fromisoformat(str(item['date'])[:10]), Decimal(str(item['price']))))
+        else:
+            points.append((end_date - timedelta(days=30 * (len(raw) - 1 - i)), Decimal(str(item))))
+    return sorted(points, key=lambda point: point[0])
+
 class PriceHistory(models.Model):
     """
     Model to track price changes over time for property listings.
-    This model stores historical price data for listings, allowing tracking of 
-    price fluctuations and trends. Each record contains a list of price values
-    and the timestamp when the record was created.
+    This model groups a series of PricePoint rows recorded for a listing, allowing
+    tracking of price fluctuations and trends in SQL. The points are exposed through
+    the `price_values` property in the same shape the API has always returned.
     Attributes:
         listing (ForeignKey): Reference to the associated Listing object.
                              Cascade delete ensures price history is removed 
                              when the listing is deleted.
-        price_values (JSONField): List of numerical price values representing
-                                 the price progression over time. Defaults to
-                                 an empty list.
+        price_values (property): List of {"date", "price"} dicts built from the
+                                 related PricePoint rows. Assigning a list (or a
+                                 JSON string of one) replaces the points on save().
         date_recorded (DateTimeField): Timestamp when this price history record
                                       was created. Automatically set on creation.
+        updated_at (DateTimeField): When the row or its points were last saved.
     Returns:
         str: String representation showing the listing title and "Price History".
     Example:
         >>> history = PriceHistory.objects.create(
         ...     listing=some_listing,
-        ...     price_values=[450000, 460000, 470000]
+        ...     price_values=[{"date": "2024-01-01", "price": 450000}, {"date": "2024-06-01", "price": 470000}]
         ... )
         >>> str(history)
         'Beautiful Home - Price History'
     """
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
-    price_values = models.JSONField(default=list)  # e.g., [450000, 460000, 470000]
     date_recorded = models.DateField(blank=True, null=True)  # Removed auto_now_add=True
+    updated_at = models.DateTimeField(auto_now=True)
+
+    @property
+    def price_values(self):
+        """
+        Return the price points as [{"date": "YYYY-MM-DD", "price": 450000.0}, ...], oldest first.
+        Uses prefetched points when available (see ListingQuerySet.with_price_histories).
+        """
+        if getattr(self, '_pending_points', None) is not None:
+            points = self._pending_points
+        elif self.pk is None:
+            points = []
+        else:
+            points = [(point.date, point.price) for point in self.points.all()]
+        return [{'date': point_date.isoformat(), 'price': float(price)} for point_date, price in points]
+
+    @price_values.setter
+    def price_values(self, value):
+        # Stage the new points; they are written by save() once the row has a primary key
+        self._pending_points = parse_price_values(value, self.date_recorded)
 
     def save(self, *args, **kwargs):
         # Auto-populate date_recorded if not set
         if not self.date_recorded:
             from django.utils import timezone
             self.date_recorded = timezone.now()
-        super().save(*args, **kwargs)
+        # The row and its points commit together (and on_commit hooks see both)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+            pending = getattr(self, '_pending_points', None)
+            if pending is not None:
+                self.points.all().delete()
+                PricePoint.objects.bulk_create(
+                    PricePoint(listing_id=self.listing_id, price_history=self, date=point_date, price=price)
+                    for point_date, price in pending
+                )
+                self._pending_points = None
 
     def __str__(self):
         """
@@ -95,19 +205,153 @@ class PriceHistory(models.Model):
         """
         return f"{self.listing.title} - Price History"
 
+class PricePoint(models.Model):
+    """
+    A single dated price observation for a listing.
+    Points are stored one row each (instead of a JSON blob on PriceHistory) so that
+    trend queries such as "price change over the last year" can run in SQL.
+    Attributes:
+        listing (ForeignKey): The listing this price belongs to (denormalized for the (listing, date) index).
+        price_history (ForeignKey): The PriceHistory series this point was recorded in.
+        date (DateField): Date the price was observed.
+        price (DecimalField): The observed price.
+    """
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name='price_points')
+    price_history = models.ForeignKey(PriceHistory, on_delete=models.CASCADE, related_name='points')
+    date = models.DateField()
+    price = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        ordering = ['date', 'id']
+        indexes = [
+            models.Index(fields=['listing', 'date'], name='pricepoint_listing_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Points added through a PriceHistory (e.g. the admin inline) inherit its listing
+        if self.listing_id is None:
+            self.listing_id = self.price_history.listing_id
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.listing_id} - {self.date}: ${self.price}"
+
 class AnalysisCache(models.Model):
     """
     Model to cache AI analysis requests and results.
+    Rows are content-addressed: `prompt_hash` identifies the exact request sent to the AI
+    (model, parameters and rendered prompt), so editing a listing or its price history
+    yields a new key, and listings whose prompts are identical share one row.
     Fields:
         timestamp: When the request was made (auto_now_add)
-        listing: ForeignKey to Listing (indexed)
-        input_data: The input data sent to the AI (JSONField)
+        prompt_hash: SHA-256 of the request (listings.llm.request_key), unique
+        listing: ForeignKey to the Listing the analysis was first generated for (indexed)
+        price_history: The PriceHistory included in that prompt, if any
         analysis_result: The AI's response (TextField)
     """
     timestamp = models.DateTimeField(auto_now_add=True)
+    prompt_hash = models.CharField(max_length=64, unique=True)
     listing = models.ForeignKey('Listing', on_delete=models.CASCADE, related_name='analysis_caches')
     price_history = models.ForeignKey('PriceHistory', on_delete=models.SET_NULL, null=True, blank=True, related_name='analysis_caches')
     analysis_result = models.TextField()
 
     def __str__(self):
         return f"AnalysisCache for listing {self.listing_id} at {self.timestamp}"
+
+class MarketStats(models.Model):
+    """
+    Precomputed market aggregates for one city, maintained by listings/market.py.
+    Attributes:
+        city / province (CharField): The market, as stored on Listing.
+        listing_count (IntegerField): Number of listings in the market.
+        median_price / average_price (DecimalField): Of current_price.
+        median_price_per_sqft (DecimalField): Median of current_price / square_feet.
+        average_bedrooms / average_bathrooms (FloatField): Mean room counts.
+        price_change_1y (FloatField): Median per-listing price change over the last year, in percent
+                                      (null when no listing has two price points in that window).
+        trend_sample_size (IntegerField): Listings contributing to price_change_1y.
+        updated_at (DateTimeField): When the row was last recomputed.
+    """
+    city = models.CharField(max_length=100)
+    province = models.CharField(max_length=100)
+    listing_count = models.IntegerField()
+    median_price = models.DecimalField(max_digits=12, decimal_places=2)
+    average_price = models.DecimalField(max_digits=12, decimal_places=2)
+    median_price_per_sqft = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    average_bedrooms = models.FloatField()
+    average_bathrooms = models.FloatField()
+    price_change_1y = models.FloatField(null=True)
+    trend_sample_size = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['province', 'city']
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'province'], name='marketstats_unique_location'),
+        ]
+
+    def __str__(self):
+        return f"{self.city}, {self.province}: {self.listing_count} listings"
+
+class StaleMarket(models.Model):
+    """
+    A market whose MarketStats row no longer matches its listings. Writes only mark their
+    markets here (once per transaction); listings/market.py recomputes the marked markets
+    in one batch before the statistics are next read.
+    Attributes:
+        city / province (CharField): The market, as stored on Listing.
+        marked_at (DateTimeField): Latest write to the market. A refresh that started
+                                   earlier leaves the mark in place.
+    """
+    city = models.CharField(max_length=100)
+    province = models.CharField(max_length=100)
+    marked_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'province'], name='stalemarket_unique_location'),
+        ]
+
+    def __str__(self):
+        return f"{self.city}, {self.province} (stale since {self.marked_at})"
+
+class TableVersion(models.Model):
+    """
+    Change counter of one database table, bumped by the signal handlers in
+    listings/signals.py inside the transaction of every write to that table.
+    Collection endpoints build their ETags from these rows (see listings/conditional.py),
+    so checking whether anything changed is a primary-key read, not a table scan.
+    Attributes:
+        table (CharField): The model's db_table, e.g. "listings_listing".
+        version (BigIntegerField): Incremented on every save or delete.
+        updated_at (DateTimeField): Time of the latest bump.
+    """
+    table = models.CharField(max_length=100, primary_key=True)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.table} v{self.version}"
+
+class ListingChange(models.Model):
+    """
+    Entry of the incremental change feed (GET /api/listings/changes/, see listings/changes.py).
+    The auto-incrementing `id` is the change sequence: every write to a listing or its price
+    histories replaces the listing's entry with a new, higher one, so the table holds at most
+    one row per listing and a sync costs O(changes since the client's token).
+    Attributes:
+        listing_id (IntegerField): The changed listing (no foreign key: tombstones outlive it);
+                                   null for a reset.
+        kind (CharField): "upsert" (created or modified), "delete" (tombstone), or "reset"
+                          (the catalogue was rebuilt; older tokens must resync from scratch).
+        changed_at (DateTimeField): When the change was recorded.
+    """
+    UPSERT, DELETE, RESET = 'upsert', 'delete', 'reset'
+    KIND_CHOICES = [(UPSERT, 'Upsert'), (DELETE, 'Delete'), (RESET, 'Reset')]
+
+    listing_id = models.IntegerField(null=True, db_index=True)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, default=UPSERT)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.pk} {self.kind} {self.listing_id}"
@@ -0,0 +1,34 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class ListingCursorPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination for listing collections.
+    Pages are selected with `WHERE id > <cursor>` over the primary key index, so
+    fetching a deep page costs the same as fetching the first one.
+    Query Parameters:
+        cursor (str, optional): Opaque cursor taken from the previous response's `next`/`previous` link.
+        page_size (int, optional): Number of listings per page, capped at LISTINGS_MAX_PAGE_SIZE.
+    Response format:
+        {"next": "<url or null>", "previous": "<url or null>", "results": [...]}
+    """
+    ordering = 'id'
+    page_size = settings.LISTINGS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.LISTINGS_MAX_PAGE_SIZE
+
+
+class ListingSearchPagination(PageNumberPagination):
+    """
+    Page-number pagination for relevance-ranked results, which have no stable key to
+    put in a cursor (see listings.search.ListingTextSearch).
+    Query Parameters:
+        page (int, optional): 1-based page number.
+        page_size (int, optional): Number of listings per page, capped at LISTINGS_MAX_PAGE_SIZE.
+    Response format:
+        {"count": 123, "next": "<url or null>", "previous": "<url or null>", "results": [...]}
+    """
+    page_size = settings.LISTINGS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.LISTINGS_MAX_PAGE_SIZE
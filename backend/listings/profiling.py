@@ -0,0 +1,211 @@
+import contextvars
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+
+#----------------------------- Per-request metrics -----------------------------#
+#
+# The metrics of the request being served live in a context variable, so code deep in
+# the stack (SQL execution, serializers, the OpenAI client) can add to them without
+# having the request passed in. asgiref copies the context into sync_to_async threads,
+# so async views are measured too. Outside a profiled request every hook is a no-op.
+
+_current = contextvars.ContextVar('listings_request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Wall time, SQL and named spans (e.g. "serialize", "llm") recorded for one request.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.total = None
+        self.db_queries = 0
+        self.db_time = 0.0
+        self.spans = {}
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def server_timing(self):
+        """
+        Render the metrics as a Server-Timing header value (durations in milliseconds).
+        Example:
+            >>> metrics.server_timing()
+            'app;dur=12.4, db;dur=3.1;desc="4 queries", serialize;dur=2.0'
+        """
+        entries = [
+            f"app;dur={self.total * 1000:.1f}",
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.db_queries} queries"',
+        ]
+        entries += [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        return ', '.join(entries)
+
+    def as_dict(self):
+        data = {
+            'total_ms': round(self.total * 1000, 2),
+            'db_queries': self.db_queries,
+            'db_ms': round(self.db_time * 1000, 2),
+        }
+        data.update({f"{name}_ms": round(seconds * 1000, 2) for name, seconds in self.spans.items()})
+        return data
+
+
+def current_metrics():
+    """Return the RequestMetrics of the request being profiled, or None."""
+    return _current.get()
+
+
+@contextmanager
+def timed(name):
+    """
+    Add the time spent in the block to the current request's `name` span.
+    Example:
+        >>> with timed('llm'):
+        ...     response = client.chat.completions.create(...)
+    """
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add(name, time.perf_counter() - start)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries and SQL time for the current request.
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_queries += 1
+        metrics.db_time += time.perf_counter() - start
+
+
+def install_query_recorder(connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+#----------------------------- Profiling middleware -----------------------------#
+
+
+class RequestProfilingMiddleware:
+    """
+    Opt-in instrumentation for the listings API (REQUEST_PROFILING=True).
+    Every request under REQUEST_PROFILING_PATH_PREFIX gets a Server-Timing header and a
+    structured "request_profile" log line with wall time, query count, SQL time, and
+    serializer and LLM time. A REQUEST_PROFILING_SAMPLE_RATE fraction of synchronous
+    requests runs under cProfile; the profile is written to REQUEST_PROFILING_DIR when the
+    request took longer than REQUEST_PROFILING_SLOW_MS.
+    Streaming responses report the time to the first byte: spans recorded while the body
+    is streamed are not included.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.prefix = settings.REQUEST_PROFILING_PATH_PREFIX
+        self.slow = settings.REQUEST_PROFILING_SLOW_MS / 1000
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.profile_dir = settings.REQUEST_PROFILING_DIR
+        connection_created.connect(install_query_recorder, dispatch_uid='listings.profiling.record_query')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not request.path.startswith(self.prefix):
+            return self.get_response(request)
+
+        for connection in connections.all(initialized_only=True):
+            install_query_recorder(connection)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        profiler = cProfile.Profile() if self.sample_rate and random.random() < self.sample_rate else None
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+        finally:
+            metrics.finish()
+            _current.reset(token)
+        return self.report(request, response, metrics, profiler)
+
+    async def __acall__(self, request):
+        if not request.path.startswith(self.prefix):
+            return await self.get_response(request)
+
+        # No cProfile here: the event loop interleaves other requests into the same profile
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.finish()
+            _current.reset(token)
+        return self.report(request, response, metrics, None)
+
+    def report(self, request, response, metrics, profiler):
+        response['Server-Timing'] = metrics.server_timing()
+
+        record = {
+            'event': 'request_profile',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'streaming': response.streaming,
+            **metrics.as_dict(),
+        }
+        if metrics.total >= self.slow:
+            record['slow'] = True
+            if profiler is not None:
+                record['profile'] = self.dump_profile(request, metrics, profiler)
+        logger.info(json.dumps(record))
+        return response
+
+    def dump_profile(self, request, metrics, profiler):
+        """
+        Write the cProfile stats of a slow request and return the file path
+        (inspect with `python -m pstats <file>` or snakeviz).
+        """
+        os.makedirs(self.profile_dir, exist_ok=True)
+        slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{request.method}-{slug}-{metrics.total * 1000:.0f}ms.prof"
+        path = os.path.join(self.profile_dir, filename)
+        profiler.dump_stats(path)
+        return path
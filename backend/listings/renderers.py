@@ -0,0 +1,19 @@
+from rest_framework.renderers import BaseRenderer
+
+from .analysis import sse_event
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets views that stream server-sent events accept `Accept: text/event-stream`.
+    The stream itself is a StreamingHttpResponse; this renderer only formats ordinary
+    Response payloads (e.g. validation errors) as a single `error` event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_event('error', data).encode(self.charset)
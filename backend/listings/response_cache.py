@@ -0,0 +1,100 @@
+import hashlib
+import logging
+from functools import wraps
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from .conditional import collection_versions
+from .metrics import CacheStats
+
+logger = logging.getLogger(__name__)
+
+
+#----------------------------- Listing response cache -----------------------------#
+#
+# Serialized 200 responses of the list and search endpoints are kept in the Django cache
+# named by LISTINGS_CACHE_ALIAS (LocMemCache by default, Redis via LISTINGS_CACHE_BACKEND).
+# Keys combine the endpoint, its normalized query parameters and the TableVersion
+# counters that conditional GET already reads for the ETag. Every write through the API,
+# the admin or a price history save bumps those counters in its transaction (see
+# signals.py), so the next read computes a different key: entries are never served
+# after a committed write, in any worker process, and superseded ones expire after
+# LISTINGS_CACHE_TTL. Writes that send no signals must call conditional.bump_versions().
+
+stats = CacheStats(tiers=('list', 'search'), extra=('stores', 'errors'))
+
+
+def _cache():
+    return caches[settings.LISTINGS_CACHE_ALIAS]
+
+
+def normalize_params(query, names):
+    """
+    Canonical form of the query parameters a view reads: unknown and empty parameters
+    are dropped and the rest sorted, so equivalent URLs share one cache entry.
+    Example:
+        >>> normalize_params(QueryDict('page_size=10&city=Halifax&_=123&province='), ['city', 'province', 'page_size'])
+        'city=Halifax&page_size=10'
+    """
+    return urlencode(sorted(
+        (name, value.strip()) for name in names for value in query.getlist(name) if value.strip()
+    ))
+
+
+def response_key(name, request, params):
+    versions, _ = collection_versions(request)
+    # Pagination links in the body are absolute URLs, so scheme and host are part of the key
+    parts = [name, request.scheme, request.get_host(), normalize_params(request.GET, params), *versions]
+    return 'listings:response:' + hashlib.sha256('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def clear():
+    """
+    Drop every cached response (e.g. in tests, where rolled-back table versions repeat).
+    """
+    _cache().clear()
+
+
+def cached_listing_response(name, params):
+    """
+    Decorator for DRF GET views returning listing collections: answers with the stored
+    data of an equivalent earlier request, skipping the queries and serializers, or runs
+    the view and stores the data of its 200 response.
+    Cache backend errors are logged and the view is run as if caching were off.
+    Args:
+        name (str): The endpoint's name in keys and stats ("list" or "search").
+        params (Iterable[str]): Query parameters the view reads.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET' or not settings.LISTINGS_RESPONSE_CACHE:
+                return view(request, *args, **kwargs)
+
+            key = response_key(name, request, params)
+            try:
+                cached = _cache().get(key)
+            except Exception:
+                logger.warning("Listing response cache unavailable", exc_info=True)
+                stats.incr('errors')
+                return view(request, *args, **kwargs)
+            if cached is not None:
+                stats.incr(f'{name}_hits')
+                return Response(cached)
+
+            stats.incr(f'{name}_misses')
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200 or not isinstance(response, Response):
+                return response
+            try:
+                _cache().set(key, response.data)
+                stats.incr('stores')
+            except Exception:
+                logger.warning("Listing response cache unavailable", exc_info=True)
+                stats.incr('errors')
+            return response
+        return wrapper
+    return decorator
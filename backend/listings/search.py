@@ -0,0 +1,215 @@
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Listing
+
+
+#----------------------------- Full-text search -----------------------------#
+#
+# Free-text search over title, street address, city and description, ranked by relevance.
+#   SQLite:     FTS5 table listings_listing_fts (rowid = listing id), filled by triggers on
+#               listings_listing, ranked with bm25().
+#   PostgreSQL: GIN index on a weighted to_tsvector() expression over the same columns,
+#               ranked with ts_rank_cd(). The index is maintained by Postgres itself.
+# Other databases (or SQLite builds without FTS5) fall back to icontains on every column.
+# The index objects are created by migration 0008_listing_fulltext_search.
+
+FTS_TABLE = 'listings_listing_fts'
+SEARCH_FIELDS = ('title', 'street_address', 'city', 'description')
+
+# Relative weight of a match in each field, in SEARCH_FIELDS order (bm25 column weights)
+FTS5_WEIGHTS = (4.0, 3.0, 2.0, 1.0)
+
+# Must stay identical to the indexed expression for Postgres to use the GIN index
+POSTGRES_DOCUMENT = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(street_address, '')), 'B') || "
+    "setweight(to_tsvector('english', coalesce(city, '')), 'C') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'D')"
+)
+
+# Triggers keeping the FTS5 table in step with listings_listing (IF NOT EXISTS so they can be re-applied)
+FTS5_TRIGGERS = {
+    'listings_listing_fts_insert': f"""
+        CREATE TRIGGER IF NOT EXISTS listings_listing_fts_insert AFTER INSERT ON listings_listing BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, street_address, city, description)
+            VALUES (new.id, new.title, new.street_address, new.city, new.description);
+        END""",
+    'listings_listing_fts_update': f"""
+        CREATE TRIGGER IF NOT EXISTS listings_listing_fts_update
+        AFTER UPDATE OF title, street_address, city, description ON listings_listing BEGIN
+            UPDATE {FTS_TABLE}
+            SET title = new.title, street_address = new.street_address, city = new.city, description = new.description
+            WHERE rowid = old.id;
+        END""",
+    'listings_listing_fts_delete': f"""
+        CREATE TRIGGER IF NOT EXISTS listings_listing_fts_delete AFTER DELETE ON listings_listing BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END""",
+}
+
+_backends = {}  # database alias -> 'fts5' | 'postgres' | 'icontains'
+
+
+def search_backend(using='default'):
+    """
+    Return which full-text implementation serves the given database alias.
+    """
+    if using not in _backends:
+        connection = connections[using]
+        if connection.vendor == 'postgresql':
+            _backends[using] = 'postgres'
+        elif connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names():
+            _backends[using] = 'fts5'
+        else:
+            _backends[using] = 'icontains'
+    return _backends[using]
+
+
+def search_terms(query):
+    """
+    Split free text into search terms, dropping punctuation and FTS operators.
+    Example:
+        >>> search_terms('Finished basement, "waterfront"!')
+        ['Finished', 'basement', 'waterfront']
+    """
+    return re.findall(r'\w+', query or '')
+
+
+def ensure_fts5_triggers(using='default'):
+    """
+    Re-create missing FTS5 triggers and rebuild the index from listings_listing.
+    SQLite drops a table's triggers when a migration rebuilds the table (e.g. to add a
+    NOT NULL column), so this runs after every migrate (see signals.py).
+    Returns:
+        bool: True if the index had to be rebuilt.
+    """
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'listings_listing'")
+        existing = {row[0] for row in cursor.fetchall()}
+        if existing.issuperset(FTS5_TRIGGERS):
+            return False
+        for sql in FTS5_TRIGGERS.values():
+            cursor.execute(sql)
+        rebuild_fts5_index(cursor)
+    return True
+
+
+def rebuild_fts5_index(cursor):
+    cursor.execute(f"DELETE FROM {FTS_TABLE}")
+    cursor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, title, street_address, city, description) "
+        f"SELECT id, title, street_address, city, description FROM listings_listing"
+    )
+
+
+class ListingTextSearch:
+    """
+    Lazily evaluated, relevance-ordered listings matching a free-text query.
+    Supports count() and slicing, so it can be handed to Django's Paginator (and DRF's
+    page-number pagination): each page runs one ranked query for its ids plus the usual
+    listing and price-history queries. Each returned Listing has a `search_rank` attribute
+    (higher is more relevant; None on the icontains fallback).
+    Example:
+        >>> results = ListingTextSearch('finished basement')
+        >>> results.count()
+        12
+        >>> [listing.title for listing in results[:3]]
+    """
+
+    def __init__(self, query, using='default', backend=None):
+        self.terms = search_terms(query)
+        self.using = using
+        self.backend = backend or search_backend(using)
+
+    def filter(self, queryset):
+        """
+        Restrict a Listing queryset to the matches, keeping its own ordering (used by the admin).
+        """
+        if not self.terms:
+            return queryset.none()
+        if self.backend == 'icontains':
+            return queryset.filter(pk__in=self._fallback_queryset().values('pk'))
+        source, where, params = self._match()
+        column = 'rowid' if self.backend == 'fts5' else 'listings_listing.id'
+        return queryset.filter(pk__in=RawSQL(f"SELECT {column} FROM {source} WHERE {where}", params))
+
+    def count(self):
+        if not self.terms:
+            return 0
+        if self.backend == 'icontains':
+            return self._fallback_queryset().count()
+        source, where, params = self._match()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*) FROM {source} WHERE {where}", params)
+            return cursor.fetchone()[0]
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        if index.step is not None or (index.start or 0) < 0 or (index.stop is not None and index.stop < 0):
+            raise ValueError("ListingTextSearch supports only non-negative slices without a step")
+        offset = index.start or 0
+        limit = None if index.stop is None else max(index.stop - offset, 0)
+        if not self.terms or limit == 0:
+            return []
+
+        if self.backend == 'icontains':
+            listings = list(self._fallback_queryset().with_price_histories()[offset:index.stop])
+            for listing in listings:
+                listing.search_rank = None
+            return listings
+
+        ranks = self._ranked_ids(limit, offset)
+        listings = Listing.objects.using(self.using).with_price_histories().in_bulk([pk for pk, _ in ranks])
+        results = []
+        for pk, rank in ranks:
+            if pk in listings:
+                listings[pk].search_rank = rank
+                results.append(listings[pk])
+        return results
+
+    def _match(self):
+        """Return (FROM clause, WHERE clause, params) selecting the matching listings."""
+        # Every term must match; the last one as a prefix, so "granville st" finds "Granville Street"
+        if self.backend == 'fts5':
+            terms = [f'"{term}"' for term in self.terms]
+            return FTS_TABLE, f"{FTS_TABLE} MATCH %s", [' '.join(terms) + '*']
+        return (
+            "listings_listing, to_tsquery('english', %s) query",
+            f"({POSTGRES_DOCUMENT}) @@ query",
+            [' & '.join(self.terms) + ':*'],
+        )
+
+    def _ranked_ids(self, limit, offset):
+        """(listing id, rank) pairs for one page, best match first."""
+        source, where, params = self._match()
+        if self.backend == 'fts5':
+            weights = ', '.join(str(weight) for weight in FTS5_WEIGHTS)
+            columns = f"rowid, -bm25({FTS_TABLE}, {weights}) AS rank"  # bm25 is lower-is-better
+        else:
+            columns = f"id, ts_rank_cd({POSTGRES_DOCUMENT}, query) AS rank"
+        sql = f"SELECT {columns} FROM {source} WHERE {where} ORDER BY rank DESC, 1 LIMIT %s OFFSET %s"
+        # An open-ended slice means no limit: -1 on SQLite, NULL on Postgres
+        params += [limit if limit is not None else (-1 if self.backend == 'fts5' else None), offset]
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(sql, params)
+            return [(pk, float(rank)) for pk, rank in cursor.fetchall()]
+
+    def _fallback_queryset(self):
+        condition = Q()
+        for term in self.terms:
+            term_condition = Q()
+            for field in SEARCH_FIELDS:
+                term_condition |= Q(**{f"{field}__icontains": term})
+            condition &= term_condition
+        return Listing.objects.using(self.using).filter(condition).order_by('id')
@@ -1,7 +1,14 @@
+import json
+from decimal import InvalidOperation
+
 from rest_framework import serializers
-from .models import Listing, PriceHistory
+from .models import Listing, MarketStats, PriceHistory, PricePoint, parse_price_values
+from .profiling import timed
 
 class PriceHistorySerializer(serializers.ModelSerializer):
+    # Built from the normalized PricePoint rows; accepts a list (or JSON string) of {"date", "price"} on write
+    price_values = serializers.JSONField(default=list)
+
     class Meta:
         model = PriceHistory
         fields = ['id', 'price_values', 'date_recorded']
@@ -16,5 +23,123 @@ class ListingSerializer(serializers.ModelSerializer):
             # Basic information
             'id', 'title', 'street_address', 'city', 'province', 
             'description', 'current_price', 'bedrooms', 'bathrooms', 
-            'square_feet', 'image_url', 'price_histories'
-        ]
\ No newline at end of file
+            'square_feet', 'image_url', 'latitude', 'longitude', 'external_id', 'price_histories'
+        ]
+
+    def validate(self, data):
+        # A point needs both coordinates (a partial update keeps the stored one it omits)
+        current = self.instance if self.partial else None
+        latitude = data.get('latitude', getattr(current, 'latitude', None))
+        longitude = data.get('longitude', getattr(current, 'longitude', None))
+        if (latitude is None) != (longitude is None):
+            raise serializers.ValidationError('Provide both latitude and longitude, or neither.')
+        return data
+
+    def to_representation(self, instance):
+        # Counted in the request's "serialize" Server-Timing span when profiling is on
+        with timed('serialize'):
+            return super().to_representation(instance)
+
+
+class BulkListingSerializer(ListingSerializer):
+    """
+    Validates one item of POST /api/listings/bulk/ (see listings/bulk.py): a full listing,
+    optionally keyed by `external_id`, plus an optional `price_values` series that is
+    recorded as a new price history of the listing.
+    """
+    # Declared without the model's UniqueValidator: an existing key means "update", and the
+    # validator would cost a query per item
+    external_id = serializers.CharField(max_length=100, required=False, allow_null=True)
+    price_values = serializers.JSONField(required=False, write_only=True)
+
+    class Meta(ListingSerializer.Meta):
+        fields = ListingSerializer.Meta.fields + ['price_values']
+
+    def validate_price_values(self, value):
+        # Normalized to [(date, Decimal), ...] here so invalid series are reported per item
+        try:
+            return parse_price_values(value)
+        except (KeyError, TypeError, ValueError, InvalidOperation, json.JSONDecodeError):
+            raise serializers.ValidationError('Expected a list of {"date": "YYYY-MM-DD", "price": number} objects.')
+
+
+class BulkDeleteSerializer(serializers.Serializer):
+    """
+    Body of POST /api/listings/bulk/delete/: listings to delete by id and/or external_id.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+    external_ids = serializers.ListField(child=serializers.CharField(max_length=100), required=False, default=list)
+
+    def validate(self, data):
+        if not data['ids'] and not data['external_ids']:
+            raise serializers.ValidationError('Provide "ids" and/or "external_ids".')
+        return data
+
+
+#----------------------------- Fast read path -----------------------------#
+#
+# Read-only equivalent of ListingSerializer(many=True) for the collection endpoints.
+# Building a field tree and calling to_representation per field and per row costs far
+# more than the queries on large pages, so rows are fetched with .values(), price
+# histories are attached in a single pass over two flat queries, and the resulting plain
+# dicts/lists/str render through JSONRenderer's C-accelerated encoder. The output is
+# byte-for-byte what ListingSerializer renders (see FastListingSerializationTests);
+# keep the two in sync when a field is added.
+
+# Listing columns of ListingSerializer, in its output order (price_histories is appended)
+LISTING_ROW_FIELDS = tuple(field for field in ListingSerializer.Meta.fields if field != 'price_histories')
+
+
+def serialize_listing_rows(rows):
+    """
+    Serialize listings fetched as `queryset.values(*LISTING_ROW_FIELDS)`.
+    Runs two queries (price histories and their points) however many rows are given.
+    Args:
+        rows (Iterable[dict]): Listing rows, e.g. a page from the paginator.
+    Returns:
+        list[dict]: The same data as ListingSerializer(listings, many=True).data.
+    Example:
+        >>> serialize_listing_rows(Listing.objects.filter(city='Halifax').values(*LISTING_ROW_FIELDS))
+        [{"id": 1, "title": "...", "current_price": "450000.00", ..., "price_histories": [...]}]
+    """
+    rows = list(rows)
+    histories = {row['id']: [] for row in rows}
+    if not histories:
+        return []
+
+    points = {}
+    for history_id, listing_id, date_recorded in PriceHistory.objects.filter(listing_id__in=histories).order_by(
+        'listing_id', 'id'
+    ).values_list('id', 'listing_id', 'date_recorded'):
+        points[history_id] = []
+        histories[listing_id].append({
+            'id': history_id,
+            'price_values': points[history_id],
+            'date_recorded': date_recorded.isoformat() if date_recorded else None,
+        })
+    if points:
+        # PricePoint.Meta.ordering (date, id), as in the prefetch ListingSerializer reads
+        for history_id, point_date, price in PricePoint.objects.filter(price_history_id__in=points).values_list(
+            'price_history_id', 'date', 'price'
+        ):
+            points[history_id].append({'date': point_date.isoformat(), 'price': float(price)})
+
+    # Counted in the request's "serialize" Server-Timing span, like ListingSerializer
+    with timed('serialize'):
+        data = []
+        for row in rows:
+            item = dict(row)
+            item['current_price'] = '{:f}'.format(row['current_price'])  # DecimalField(coerce_to_string)
+            item['price_histories'] = histories[row['id']]
+            data.append(item)
+        return data
+
+
+class MarketStatsSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = MarketStats
+        fields = [
+            'city', 'province', 'listing_count', 'median_price', 'average_price', 'median_price_per_sqft',
+            'average_bedrooms', 'average_bathrooms', 'price_change_1y', 'trend_sample_size', 'updated_at'
+        ]
@@ -0,0 +1,95 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import changes, comparables, market
+from .conditional import bump_versions
+from .geo import ensure_rtree_triggers
+from .models import Listing, ListingChange, PriceHistory
+from .search import ensure_fts5_triggers
+
+
+# Keep the comparables feature matrix current without rebuilding it. It is process-wide and
+# outside the database, so it only follows writes once they commit (a rolled-back save must
+# not leave a row behind).
+
+@receiver(post_save, sender=Listing)
+def update_comparables_index(sender, instance, **kwargs):
+    transaction.on_commit(partial(comparables.index.upsert, instance))
+
+
+@receiver(post_delete, sender=Listing)
+def remove_from_comparables_index(sender, instance, **kwargs):
+    transaction.on_commit(partial(comparables.index.remove, instance.pk))  # pk is cleared after the delete
+
+
+@receiver(post_migrate)
+def restore_index_triggers(sender, using, **kwargs):
+    # SQLite drops triggers when a migration rebuilds listings_listing; put them back
+    if sender.name == 'listings':
+        ensure_fts5_triggers(using)
+        ensure_rtree_triggers(using)
+
+
+# Mark the markets a write touched stale once its transaction commits (see listings/market.py)
+
+@receiver(pre_save, sender=Listing)
+def remember_market_before_update(sender, instance, **kwargs):
+    if not instance._state.adding and not hasattr(instance, '_loaded_market'):
+        # Only when city/province were deferred; rows read normally remember their market
+        instance._loaded_market = Listing.objects.filter(pk=instance.pk).values_list('city', 'province').first()
+
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def refresh_listing_market(sender, instance, **kwargs):
+    location = (instance.city, instance.province)
+    before = getattr(instance, '_loaded_market', None)
+    if before and before != location:
+        market.schedule_refresh(*before)  # the listing moved out of this market
+    market.schedule_refresh(*location)
+    instance._loaded_market = location
+
+
+@receiver(post_save, sender=PriceHistory)
+@receiver(post_delete, sender=PriceHistory)
+def refresh_price_history_market(sender, instance, **kwargs):
+    if PriceHistory.listing.is_cached(instance):
+        market.schedule_refresh(instance.listing.city, instance.listing.province)
+    else:
+        market.schedule_listing_refresh(instance.listing_id)
+
+
+# Keep the validators of the conditional GET endpoints current (see listings/conditional.py)
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+def bump_listing_version(sender, instance, **kwargs):
+    bump_versions(Listing)
+
+
+
+# Feed the incremental change log (see listings/changes.py)
+
+@receiver(post_save, sender=Listing)
+def record_listing_change(sender, instance, **kwargs):
+    changes.record_changes([instance.pk])
+
+
+@receiver(post_delete, sender=Listing)
+def record_listing_deletion(sender, instance, **kwargs):
+    # Sent after the cascade has deleted the price histories, so the tombstone is the last change
+    changes.record_changes([instance.pk], kind=ListingChange.DELETE)
+
+
+# Price histories are serialized inside their listing, so its detail ETag, the PriceHistory
+# version and the change feed follow them, once per transaction. PricePoint has no receivers:
+# points are written with their history (PriceHistory.save(), the admin inline, bulk.py),
+# and cascades delete them with one query instead of loading each row.
+
+@receiver(post_save, sender=PriceHistory)
+@receiver(post_delete, sender=PriceHistory)
+def record_price_history_change(sender, instance, **kwargs):
+    changes.schedule_price_history_change(instance.listing_id)
@@ -1,3 +1,2243 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import importlib.util
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import analysis, changes, clusters, comparables, geo, llm, market, response_cache, trends
+from .gazetteer import Gazetteer, backfill_coordinates, scatter
+from .models import AnalysisCache, Listing, ListingChange, MarketStats, PriceHistory, PricePoint, StaleMarket
+from .filters import parse_search_filters
+from .pagination import ListingCursorPagination
+from .serializer import LISTING_ROW_FIELDS, ListingSerializer, serialize_listing_rows
+from .search import ListingTextSearch, ensure_fts5_triggers, search_backend
+
+
+def make_listing(**overrides):
+    """
+    Create a Listing with sensible defaults for tests, overriding any field by keyword.
+    """
+    data = {
+        'title': 'Test Home',
+        'street_address': '1 Test Street',
+        'city': 'Toronto',
+        'province': 'ON',
+        'description': 'A home used in tests.',
+        'current_price': Decimal('500000.00'),
+        'bedrooms': 3,
+        'bathrooms': 2,
+        'square_feet': 1500,
+        'image_url': 'https://example.com/home.jpg',
+    }
+    data.update(overrides)
+    return Listing.objects.create(**data)
+
+
+def make_listings(count, with_history=True, **overrides):
+    """
+    Create `count` listings, each with one PriceHistory row unless `with_history` is False.
+    """
+    listings = []
+    for i in range(count):
+        listing = make_listing(title=f'Test Home {i}', **overrides)
+        if with_history:
+            PriceHistory.objects.create(
+                listing=listing,
+                price_values=[{'date': '2024-01-01', 'price': 480000.0}, {'date': '2024-06-01', 'price': 500000.0}],
+            )
+        listings.append(listing)
+    return listings
+
+
+class FakeOpenAIServer:
+    """
+    Minimal OpenAI-compatible HTTP server for tests, serving POST /v1/chat/completions
+    on a local port. Each completion waits `delay` seconds and answers with `reply`;
+    streamed completions ("stream": true) send `reply` word by word, `token_delay`
+    seconds apart. `failures` lists HTTP statuses (e.g. [429, 500]) answered, in order, to the
+    first requests instead. Use as a context manager; `calls` counts the requests served.
+    """
+
+    def __init__(self, reply='Fake analysis.', delay=0.0, token_delay=0.0, failures=()):
+        self.reply = reply
+        self.failures = list(failures)
+        self.delay = delay
+        self.token_delay = token_delay
+        self.calls = 0
+        self.requests = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server._lock:
+                    server.calls += 1
+                    server.requests.append(body)
+                    failure = server.failures.pop(0) if server.failures else None
+                if failure:
+                    return self.fail(failure)
+                time.sleep(server.delay)
+                if body.get('stream'):
+                    return self.stream_reply(body)
+                payload = json.dumps({
+                    'id': 'chatcmpl-fake',
+                    'object': 'chat.completion',
+                    'created': 0,
+                    'model': body.get('model'),
+                    'choices': [{'index': 0, 'finish_reason': 'stop', 'message': {'role': 'assistant', 'content': server.reply}}],
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def fail(self, status):
+                payload = json.dumps({'error': {'message': f'Injected {status}', 'type': 'fake_error'}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                if status == 429:
+                    self.send_header('Retry-After', '0')
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream_reply(self, body):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                self.close_connection = True
+                words = server.reply.split(' ')
+                for i, word in enumerate(words):
+                    chunk = {
+                        'id': 'chatcmpl-fake',
+                        'object': 'chat.completion.chunk',
+                        'created': 0,
+                        'model': body.get('model'),
+                        'choices': [{'index': 0, 'finish_reason': None, 'delta': {'content': word if i == 0 else ' ' + word}}],
+                    }
+                    self.wfile.write(f'data: {json.dumps(chunk)}\n\n'.encode())
+                    self.wfile.flush()
+                    time.sleep(server.token_delay)
+                self.wfile.write(b'data: [DONE]\n\n')
+                self.wfile.flush()
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.httpd.server_port}/v1'
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        self._settings = override_settings(OPENAI_API_KEY='sk-test', OPENAI_BASE_URL=self.base_url, OPENAI_MAX_RETRIES=0)
+        self._settings.enable()
+        llm.reset_clients()
+        return self
+
+    def __exit__(self, *exc):
+        self._settings.disable()
+        llm.reset_clients()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeRedisServer:
+    """
+    Minimal Redis-protocol server for tests, keeping string keys in memory on a local
+    port. Speaks RESP2, or RESP3 after a `HELLO 3` handshake (only nulls differ). Implements the commands Django's RedisCache sends for get/set/add/delete/
+    get_many/has_key/incr/touch/clear; expiry times are accepted but ignored.
+    Use as a context manager; `commands` lists the command names received, in order.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.commands = []
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                resp3 = False
+                while line := self.rfile.readline():
+                    args = []
+                    for _ in range(int(line[1:])):  # *<count>, then $<size> + payload per argument
+                        size = int(self.rfile.readline()[1:])
+                        args.append(self.rfile.read(size + 2)[:-2])
+                    name = args[0].decode().upper()
+                    resp3 = resp3 or (name == 'HELLO' and args[1:2] == [b'3'])
+                    reply = server.execute(name, args[1:])
+                    self.wfile.write(reply.replace(b'$-1\r\n', b'_\r\n') if resp3 and reply.startswith((b'$-1', b'*')) else reply)
+
+        self.tcp = socketserver.ThreadingTCPServer(('127.0.0.1', 0), Handler)
+        self.tcp.daemon_threads = True
+
+    @staticmethod
+    def bulk(value):
+        return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+    def execute(self, name, args):
+        with self._lock:
+            self.commands.append(name)
+            data = self.data
+            if name in ('PING',):
+                return b'+PONG\r\n'
+            if name in ('SELECT', 'CLIENT'):
+                return b'+OK\r\n'
+            if name == 'HELLO':  # protocol handshake: a map with the negotiated version
+                return b'%%1\r\n$5\r\nproto\r\n:%s\r\n' % (args[0] if args else b'2')
+            if name == 'GET':
+                return self.bulk(data.get(args[0]))
+            if name == 'MGET':
+                return b'*%d\r\n' % len(args) + b''.join(self.bulk(data.get(key)) for key in args)
+            if name == 'SET':
+                if b'NX' in (arg.upper() for arg in args[2:]) and args[0] in data:
+                    return b'$-1\r\n'
+                data[args[0]] = args[1]
+                return b'+OK\r\n'
+            if name == 'DEL':
+                return b':%d\r\n' % sum(data.pop(key, None) is not None for key in args)
+            if name == 'EXISTS':
+                return b':%d\r\n' % sum(key in data for key in args)
+            if name == 'INCRBY':
+                data[args[0]] = b'%d' % (int(data.get(args[0], b'0')) + int(args[1]))
+                return b':%s\r\n' % data[args[0]]
+            if name in ('EXPIRE', 'PERSIST'):
+                return b':%d\r\n' % (args[0] in data)
+            if name == 'FLUSHDB':
+                data.clear()
+                return b'+OK\r\n'
+            return b'-ERR unknown command\r\n'
+
+    @property
+    def url(self):
+        return f'redis://127.0.0.1:{self.tcp.server_address[1]}/0'
+
+    def __enter__(self):
+        threading.Thread(target=self.tcp.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.tcp.shutdown()
+        self.tcp.server_close()
+
+
+#----------------------------- Query count regression tests -----------------------------#
+
+
+class ListingQueryCountTests(TestCase):
+    """
+    Listing responses must cost a constant number of queries regardless of how many
+    listings are serialized (no per-row `pricehistory_set` lookups).
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def assert_flat_query_count(self, url):
+        make_listings(3)
+        small = self.count_queries(url)
+        make_listings(30)
+        large = self.count_queries(url)
+        self.assertEqual(small, large)
+
+    def test_list_query_count_is_flat(self):
+        self.assert_flat_query_count(reverse('listing-list'))
+
+    def test_search_query_count_is_flat(self):
+        self.assert_flat_query_count(reverse('listing-search') + '?city=toronto')
+
+    def test_detail_query_count(self):
+        listing = make_listings(1)[0]
+        with self.assertNumQueries(4):  # ETag validator, listing, price histories, points
+            response = self.client.get(reverse('listing-detail', args=[listing.pk]))
+        self.assertEqual(len(response.data['price_histories']), 1)
+
+
+#----------------------------- Conditional GET tests -----------------------------#
+
+
+class ConditionalGetTests(TestCase):
+    """
+    Listing read endpoints send validators and answer matching conditional requests with 304.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.listing = make_listings(2)[0]
+        self.detail_url = reverse('listing-detail', args=[self.listing.pk])
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_detail_is_304_without_serializing(self):
+        first = self.client.get(self.detail_url)
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(first['ETag'].startswith('"'))
+        self.assertIn('Last-Modified', first)
+        self.assertIn('must-revalidate', first['Cache-Control'])
+
+        with self.assertNumQueries(1), mock.patch.object(ListingSerializer, 'to_representation') as serialize:
+            second = self.revalidate(self.detail_url, first)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second.content, b'')
+        serialize.assert_not_called()
+
+        modified_since = self.client.get(self.detail_url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(modified_since.status_code, 304)
+
+    def test_detail_etag_changes_with_listing_and_price_history(self):
+        first = self.client.get(self.detail_url)
+        self.listing.current_price = Decimal('510000.00')
+        self.listing.save()
+        second = self.revalidate(self.detail_url, first)
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+        history = self.listing.pricehistory_set.get()
+        history.price_values = [{'date': '2024-01-01', 'price': 1.0}]
+        with self.captureOnCommitCallbacks(execute=True):  # listings are touched once the write commits
+            history.save()
+        third = self.revalidate(self.detail_url, second)
+        self.assertEqual(third.status_code, 200)
+        self.assertEqual(third.data['price_histories'][0]['price_values'], [{'date': '2024-01-01', 'price': 1.0}])
+
+    def test_collection_etags_track_writes_and_query(self):
+        list_url = reverse('listing-list')
+        search_url = reverse('listing-search') + '?city=toronto'
+        first_list = self.client.get(list_url)
+        first_search = self.client.get(search_url)
+        self.assertNotEqual(first_list['ETag'], first_search['ETag'])
+        self.assertEqual(self.revalidate(list_url, first_list).status_code, 304)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.revalidate(search_url, first_search).status_code, 304)
+
+        make_listing(title='New')
+        self.assertEqual(self.revalidate(list_url, first_list).status_code, 200)
+        self.assertEqual(self.revalidate(search_url, first_search).status_code, 200)
+
+        second_list = self.client.get(list_url)
+        history = self.listing.pricehistory_set.get()
+        history.price_values = history.price_values[1:]
+        with self.captureOnCommitCallbacks(execute=True):
+            history.save()
+        self.assertEqual(self.revalidate(list_url, second_list).status_code, 200)
+
+    def test_errors_carry_no_validators(self):
+        self.assertNotIn('ETag', self.client.get(reverse('listing-detail', args=[999999])))
+        self.assertNotIn('ETag', self.client.get(reverse('listing-search') + '?min_price=abc'))
+        self.assertNotIn('ETag', self.client.get(reverse('listing-search') + '?city=nowhere'))
+
+
+#----------------------------- Listing response cache tests -----------------------------#
+
+
+class ListingResponseCacheTests(TestCase):
+    """
+    List and search responses are cached per normalized query until a listing write.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        response_cache.stats.reset()
+        self.client = APIClient()
+        self.listing = make_listings(3)[0]
+        self.list_url = reverse('listing-list')
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_repeat_reads_skip_queries_and_serialization(self):
+        url = reverse('listing-search') + '?city=toronto&page_size=2'
+        first = self.get(url)
+        with self.assertNumQueries(1), mock.patch('listings.views.serialize_listing_rows') as serialize:
+            second = self.get(url)
+        serialize.assert_not_called()
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+        counters = self.get(reverse('listing-cache-stats')).data
+        self.assertEqual((counters['search_hits'], counters['search_misses'], counters['stores']), (1, 1, 1))
+        self.assertEqual(counters['search_hit_rate'], 0.5)
+
+    def test_equivalent_query_strings_share_an_entry(self):
+        self.get(reverse('listing-search') + '?city=toronto&page_size=2')
+        self.get(reverse('listing-search') + '?page_size=2&province=&city=toronto&_=1700000000')
+        self.get(reverse('listing-search') + '?city=toronto&page_size=3')
+        self.assertEqual(response_cache.stats.snapshot()['search_hits'], 1)
+
+    def test_writes_through_the_api_invalidate(self):
+        self.get(self.list_url)
+        created = self.client.post(reverse('listing-create'), {
+            'title': 'Created', 'street_address': '2 Test Street', 'city': 'Toronto', 'province': 'ON',
+            'description': 'New.', 'current_price': '400000.00', 'bedrooms': 2, 'bathrooms': 1,
+            'square_feet': 900, 'image_url': 'https://example.com/new.jpg',
+        }, format='json')
+        self.assertEqual(created.status_code, 201)
+        self.assertIn(created.data['id'], [item['id'] for item in self.get(self.list_url).data['results']])
+
+        self.client.patch(reverse('listing-update', args=[created.data['id']]), {'title': 'Renamed'}, format='json')
+        self.assertIn('Renamed', [item['title'] for item in self.get(self.list_url).data['results']])
+
+        history = self.listing.pricehistory_set.get()
+        history.price_values = [{'date': '2024-02-02', 'price': 1.0}]
+        with self.captureOnCommitCallbacks(execute=True):
+            history.save()
+        self.assertEqual(self.get(self.list_url).data['results'][0]['price_histories'][0]['price_values'],
+                         [{'date': '2024-02-02', 'price': 1.0}])
+
+        self.client.delete(reverse('listing-delete', args=[created.data['id']]))
+        self.assertNotIn(created.data['id'], [item['id'] for item in self.get(self.list_url).data['results']])
+        self.assertEqual(response_cache.stats.snapshot()['list_hits'], 0)
+
+    def test_non_200_responses_are_not_cached(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get(reverse('listing-search') + '?city=nowhere').status_code, 404)
+        self.assertEqual(response_cache.stats.snapshot()['stores'], 0)
+
+    def test_cache_outage_falls_back_to_the_database(self):
+        with mock.patch.object(response_cache, '_cache', side_effect=ConnectionError('down')), \
+                self.assertLogs('listings.response_cache', 'WARNING'):
+            self.assertEqual(len(self.get(self.list_url).data['results']), 3)
+        self.assertEqual(response_cache.stats.snapshot()['errors'], 1)
+
+    @override_settings(LISTINGS_RESPONSE_CACHE=False)
+    def test_can_be_disabled(self):
+        self.get(self.list_url)
+        self.get(self.list_url)
+        self.assertEqual(response_cache.stats.snapshot()['list_misses'], 0)
+
+    @skipUnless(importlib.util.find_spec('redis'), 'redis client library not installed')
+    def test_redis_backend(self):
+        with FakeRedisServer() as redis_server:
+            redis_cache = {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': redis_server.url}
+            with override_settings(CACHES={**settings.CACHES, 'listings': redis_cache}):
+                first = self.get(self.list_url)
+                second = self.get(self.list_url)
+                make_listing(title='Another')
+                third = self.get(self.list_url)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(len(third.data['results']), 4)
+        self.assertEqual(redis_server.commands.count('SET'), 2)
+        self.assertEqual(len(redis_server.data), 2)  # one entry per table version
+        self.assertEqual(response_cache.stats.snapshot()['list_hits'], 1)
+
+
+#----------------------------- Cursor pagination tests -----------------------------#
+
+
+class ListingPaginationTests(TestCase):
+    """
+    List and search endpoints return cursor pages instead of the whole table.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.listings = make_listings(7, with_history=False)
+
+    def collect_ids(self, url):
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_list_walks_all_pages_in_id_order(self):
+        ids = self.collect_ids(reverse('listing-list') + '?page_size=3')
+        self.assertEqual(ids, [listing.id for listing in self.listings])
+
+    def test_search_walks_all_pages(self):
+        ids = self.collect_ids(reverse('listing-search') + '?city=toronto&page_size=2')
+        self.assertEqual(ids, [listing.id for listing in self.listings])
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(ListingCursorPagination, 'max_page_size', 4):
+            response = self.client.get(reverse('listing-list') + '?page_size=100000')
+        self.assertEqual(len(response.data['results']), 4)
+        self.assertIsNotNone(response.data['next'])
+
+    def test_deep_page_uses_keyset_filter(self):
+        first = self.client.get(reverse('listing-list') + '?page_size=3')
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first.data['next'])
+        listing_sql = ctx.captured_queries[1]['sql']  # after the ETag validator read
+        self.assertIn('"listings_listing"."id" >', listing_sql)
+        self.assertNotIn('OFFSET', listing_sql)
+
+    def test_search_without_matches_returns_404(self):
+        response = self.client.get(reverse('listing-search') + '?city=nowhere')
+        self.assertEqual(response.status_code, 404)
+
+
+#----------------------------- Search filter tests -----------------------------#
+
+
+class ListingSearchFilterTests(TestCase):
+    """
+    /api/listings/search/ combines every provided filter in one query.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        self.cheap = make_listing(title='Cheap', city='Calgary', province='AB', current_price=Decimal('300000'), bedrooms=2, bathrooms=1, square_feet=900)
+        self.family = make_listing(title='Family', city='Calgary', province='AB', current_price=Decimal('650000'), bedrooms=4, bathrooms=3, square_feet=2400)
+        self.coastal = make_listing(title='Coastal', city='Vancouver', province='BC', current_price=Decimal('1200000'), bedrooms=3, bathrooms=2, square_feet=1800)
+
+    def search(self, query):
+        response = self.client.get(reverse('listing-search') + query)
+        if response.status_code != 200:
+            return response.status_code, []
+        return response.status_code, sorted(item['title'] for item in response.data['results'])
+
+    def test_price_range(self):
+        self.assertEqual(self.search('?min_price=250000&max_price=700000'), (200, ['Cheap', 'Family']))
+
+    def test_bedroom_and_bathroom_minimums(self):
+        self.assertEqual(self.search('?min_bedrooms=3&min_bathrooms=3'), (200, ['Family']))
+
+    def test_square_feet_range(self):
+        self.assertEqual(self.search('?min_sqft=1000&max_sqft=2000'), (200, ['Coastal']))
+
+    def test_province_and_exact_city(self):
+        self.assertEqual(self.search('?province=AB&city_exact=Calgary&max_price=400000'), (200, ['Cheap']))
+        self.assertEqual(self.search('?city_exact=calgary')[0], 404)
+
+    def test_city_remains_case_insensitive_contains(self):
+        self.assertEqual(self.search('?city=vanc'), (200, ['Coastal']))
+
+    @skipUnless(connection.vendor == 'sqlite', 'query plan format is SQLite-specific')
+    def test_query_plans_match_the_documented_indexes(self):
+        def plan(**params):
+            return Listing.objects.filter(**parse_search_filters(params)).order_by('-id').explain()
+
+        self.assertIn('listing_city_province_idx', plan(city_exact='Calgary'))
+        self.assertIn('listing_city_province_idx (city=? AND province=?)', plan(city_exact='Calgary', province='AB'))
+        self.assertIn('listing_province_price_idx', plan(province='AB'))
+        self.assertIn('listing_province_price_idx (province=? AND current_price>?)', plan(province='AB', min_price='1'))
+        self.assertIn('listing_price_bedrooms_idx', plan(min_price='1', max_price='2'))
+        for params in ({'city': 'cal'}, {'min_bathrooms': '2'}, {'min_sqft': '1000'}, {'max_sqft': '2000'}):
+            self.assertNotIn('INDEX', plan(**params), params)
+
+    def test_invalid_number_returns_400(self):
+        response = self.client.get(reverse('listing-search') + '?min_price=cheap')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('min_price', response.data['error'])
+
+
+#----------------------------- Full-text search tests -----------------------------#
+
+
+class ListingTextSearchTests(TestCase):
+    """
+    /api/listings/search/text/ ranks listings by a full-text match over title, address, city and description.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.waterfront = make_listing(title='Waterfront Cottage', street_address='12 Harbour Road',
+                                       description='Private dock and a finished basement.')
+        self.basement = make_listing(title='Family Home', street_address='40 Granville Street',
+                                     description='Renovated kitchen, finished basements and a waterfront view.')
+        self.condo = make_listing(title='Downtown Condo', street_address='7 Bay Street',
+                                  description='Rooftop terrace.')
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('listing-text-search'), {'q': query, **params})
+        titles = [item['title'] for item in response.data.get('results', [])] if response.status_code == 200 else []
+        return response.status_code, titles
+
+    def test_index_is_available_on_sqlite(self):
+        self.assertEqual(search_backend(), 'fts5')
+
+    def test_ranks_title_matches_first_and_stems_words(self):
+        self.assertEqual(self.search('waterfront'), (200, ['Waterfront Cottage', 'Family Home']))
+        self.assertEqual(self.search('finished basement'), (200, ['Waterfront Cottage', 'Family Home']))
+        response = self.client.get(reverse('listing-text-search'), {'q': 'waterfront'})
+        ranks = [item['search_rank'] for item in response.data['results']]
+        self.assertEqual(ranks, sorted(ranks, reverse=True))
+        self.assertEqual(response.data['count'], 2)
+
+    def test_street_names_prefixes_and_punctuation(self):
+        self.assertEqual(self.search('granville st'), (200, ['Family Home']))
+        self.assertEqual(self.search('harb'), (200, ['Waterfront Cottage']))
+        self.assertEqual(self.search('"bay" (street*)!'), (200, ['Downtown Condo']))
+
+    def test_index_follows_saves_and_deletes(self):
+        self.condo.description = 'Waterfront rooftop terrace.'
+        self.condo.save()
+        self.waterfront.delete()
+        self.assertEqual(sorted(self.search('waterfront')[1]), ['Downtown Condo', 'Family Home'])
+        Listing.objects.filter(pk=self.condo.pk).update(title='Lakeside Condo')
+        self.assertEqual(self.search('lakeside'), (200, ['Lakeside Condo']))
+
+    def test_pagination_and_query_count(self):
+        make_listings(5, description='Waterfront lot.')
+        first = self.client.get(reverse('listing-text-search'), {'q': 'lot', 'page_size': 3})
+        self.assertEqual((first.data['count'], len(first.data['results'])), (5, 3))
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get(first.data['next'])
+        self.assertEqual(len(second.data['results']), 2)
+        self.assertIsNone(second.data['next'])
+        # count, ranked ids, listings, price histories, price points
+        self.assertEqual(len(queries), 5)
+
+    def test_missing_query_and_no_matches(self):
+        self.assertEqual(self.search('  !! ')[0], 400)
+        self.assertEqual(self.search('helipad')[0], 404)
+
+    def test_icontains_fallback_matches_the_same_listings(self):
+        fallback = ListingTextSearch('finished basement', backend='icontains')
+        self.assertEqual([listing.title for listing in fallback[:10]], ['Waterfront Cottage', 'Family Home'])
+        self.assertEqual(fallback.count(), 2)
+        self.assertEqual(ListingTextSearch('granville', backend='icontains').filter(Listing.objects.all()).get(), self.basement)
+
+    def test_admin_search_uses_index(self):
+        from django.contrib import admin as django_admin
+        from .admin import ListingAdmin
+
+        model_admin = ListingAdmin(Listing, django_admin.site)
+        queryset, may_have_duplicates = model_admin.get_search_results(None, Listing.objects.order_by('id'), 'waterfront')
+        self.assertEqual(list(queryset), [self.waterfront, self.basement])
+        self.assertFalse(may_have_duplicates)
+
+    def test_rebuilds_dropped_triggers(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER listings_listing_fts_insert")
+        make_listing(title='Orphan Waterfront')
+        self.assertTrue(ensure_fts5_triggers())
+        self.assertFalse(ensure_fts5_triggers())
+        self.assertIn('Orphan Waterfront', self.search('orphan')[1])
+
+
+#----------------------------- Comparables tests -----------------------------#
+
+
+class ListingComparablesTests(TestCase):
+    """
+    /api/listings/<pk>/comparables/ ranks listings with the in-memory NumPy feature matrix.
+    """
+
+    def setUp(self):
+        comparables.index.invalidate()
+        self.client = APIClient()
+        home = dict(current_price=Decimal('500000'), bedrooms=3, bathrooms=2, square_feet=1500)
+        self.subject = make_listing(title='Subject', city='Calgary', province='AB', **home)
+        self.close = make_listing(title='Close', city='Calgary', province='AB', current_price=Decimal('510000'),
+                                  bedrooms=3, bathrooms=2, square_feet=1550)
+        self.other_city = make_listing(title='Other City', city='Edmonton', province='AB', **home)
+        self.other_province = make_listing(title='Other Province', city='Vancouver', province='BC', **home)
+        self.mansion = make_listing(title='Mansion', city='Calgary', province='AB', current_price=Decimal('2500000'),
+                                    bedrooms=6, bathrooms=5, square_feet=4800)
+
+    def comparables(self, listing, **params):
+        response = self.client.get(reverse('listing-comparables', args=[listing.pk]), params)
+        return response, [item['title'] for item in response.data.get('comparables', [])]
+
+    def test_ranks_by_features_and_location(self):
+        response, titles = self.comparables(self.subject)
+        self.assertEqual(titles, ['Close', 'Other City', 'Other Province', 'Mansion'])
+        distances = [item['distance'] for item in response.data['comparables']]
+        self.assertEqual(distances, sorted(distances))
+        self.assertEqual(self.comparables(self.subject, k=2)[1], ['Close', 'Other City'])
+        self.assertEqual(self.comparables(self.subject, same_city='true')[1], ['Close', 'Mansion'])
+
+    def test_index_is_updated_in_place_by_signals(self):
+        comparables.index.nearest(self.subject)  # build
+        with self.captureOnCommitCallbacks(execute=True):
+            twin = make_listing(title='Twin', city='Calgary', province='AB', current_price=Decimal('500000'),
+                                bedrooms=3, bathrooms=2, square_feet=1500)
+            self.close.delete()
+            self.mansion.city = 'Edmonton'
+            self.mansion.save()
+        with self.assertNumQueries(0):
+            nearest = comparables.index.nearest(self.subject, k=10)
+        self.assertEqual(nearest[0], (twin.pk, 0.0))
+        self.assertNotIn(self.close.pk, [pk for pk, _ in nearest])
+        self.assertEqual(len(nearest), 4)
+        self.assertNotIn(self.mansion.pk, [pk for pk, _ in comparables.index.nearest(self.subject, same_city=True)])
+
+    def test_rolled_back_writes_leave_the_index_unchanged(self):
+        before = comparables.index.nearest(self.subject, k=10)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                make_listing(title='Twin', city='Calgary', province='AB', current_price=Decimal('500000'),
+                             bedrooms=3, bathrooms=2, square_feet=1500)
+                self.close.current_price = Decimal('2500000')
+                self.close.save()
+                self.mansion.delete()
+                raise IntegrityError('rolled back')
+        self.assertEqual(comparables.index.nearest(self.subject, k=10), before)
+
+    def test_grows_past_initial_capacity(self):
+        comparables.index.nearest(self.subject)
+        with mock.patch.object(comparables.ComparablesIndex, 'INITIAL_CAPACITY', 1):
+            comparables.index.invalidate()
+            comparables.index.nearest(self.subject)
+            with self.captureOnCommitCallbacks(execute=True):
+                make_listings(3, city='Calgary', province='AB')
+        self.assertEqual(len(comparables.index.nearest(self.subject, k=50)), 7)
+
+    def test_query_count_and_errors(self):
+        self.comparables(self.subject)
+        # subject, comparables and their (empty) price histories; no per-row queries
+        with self.assertNumQueries(3):
+            self.comparables(self.subject)
+        self.assertEqual(self.comparables(self.subject, k='abc')[0].status_code, 400)
+        self.assertEqual(self.comparables(self.subject, k=0)[0].status_code, 400)
+        self.assertEqual(self.client.get(reverse('listing-comparables', args=[999999])).status_code, 404)
+
+
+#----------------------------- Market statistics tests -----------------------------#
+
+
+class MarketStatsTests(TestCase):
+    """
+    MarketStats rows follow Listing/PriceHistory writes and are served by /api/listings/stats/.
+    """
+
+    def add(self, city='Calgary', province='AB', price='500000', square_feet=1000, bedrooms=3, bathrooms=2, history=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = make_listing(city=city, province=province, current_price=Decimal(price),
+                                   square_feet=square_feet, bedrooms=bedrooms, bathrooms=bathrooms)
+            if history:
+                PriceHistory.objects.create(listing=listing, price_values=[
+                    {'date': (date.today() - timedelta(days=days_ago)).isoformat(), 'price': value}
+                    for days_ago, value in history
+                ])
+        return listing
+
+    def stats(self, city='Calgary'):
+        market.refresh_stale_markets()
+        return MarketStats.objects.get(city=city)
+
+    def test_aggregates_follow_listing_writes(self):
+        self.add(price='400000', square_feet=1000, bedrooms=2, history=[(500, 300000), (300, 400000), (10, 440000)])
+        cheap = self.add(price='600000', square_feet=2000, bedrooms=4, history=[(200, 600000), (20, 570000)])
+        self.add(price='900000', square_feet=1500, bedrooms=3)
+
+        stats = self.stats()
+        self.assertEqual((stats.listing_count, stats.median_price, stats.average_price), (3, Decimal('600000.00'), Decimal('633333.33')))
+        self.assertEqual(stats.median_price_per_sqft, Decimal('400.00'))
+        self.assertEqual(stats.average_bedrooms, 3.0)
+        # +10% and -5%: the point from 500 days ago is outside the one-year window
+        self.assertEqual((stats.price_change_1y, stats.trend_sample_size), (2.5, 2))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.city = 'Edmonton'
+            cheap.save()
+        self.assertEqual(self.stats().listing_count, 2)
+        self.assertEqual(self.stats('Edmonton').median_price, Decimal('600000.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cheap.delete()
+        market.refresh_stale_markets()
+        self.assertFalse(MarketStats.objects.filter(city='Edmonton').exists())
+
+    def test_writes_mark_markets_and_reads_refresh_them_once(self):
+        with mock.patch('listings.market.refresh_market_stats', wraps=market.refresh_market_stats) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                make_listings(3, city='Calgary', province='AB')
+                make_listing(city='Regina', province='SK')
+            with self.captureOnCommitCallbacks(execute=True):
+                make_listing(city='Calgary', province='AB')
+            self.assertEqual(refresh.call_count, 0)
+            self.assertEqual(set(StaleMarket.objects.values_list('city', 'province')), {('Calgary', 'AB'), ('Regina', 'SK')})
+            APIClient().get(reverse('market-stats'))
+        self.assertEqual(refresh.call_count, 1)
+        self.assertEqual(set(refresh.call_args.args[0]), {('Calgary', 'AB'), ('Regina', 'SK')})
+        self.assertFalse(StaleMarket.objects.exists())
+        self.assertEqual(MarketStats.objects.get(city='Calgary').listing_count, 4)
+
+    def test_writes_neither_recompute_markets_nor_reread_listings(self):
+        for _ in range(5):
+            self.add(history=[(30, 400000)])
+        listing = Listing.objects.first()
+        history = PriceHistory(listing_id=listing.pk, price_values=[{'date': '2024-01-01', 'price': 1}])
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            listing.current_price += 1
+            listing.save()
+            history.save()
+        sql = [query['sql'] for query in queries]
+        self.assertFalse([query for query in sql if 'listings_marketstats' in query or query.startswith('SELECT') and 'listings_pricepoint' in query])
+        # The listing's previous market comes from the loaded row; the history's from one query at commit
+        self.assertEqual(len([query for query in sql if query.startswith('SELECT') and '"listings_listing"."city"' in query]), 1)
+        self.assertEqual(list(StaleMarket.objects.values_list('city', flat=True)), ['Calgary'])
+
+    def test_a_refresh_keeps_marks_renewed_while_it_runs(self):
+        self.add()
+        self.assertEqual(market.refresh_stale_markets(), 1)
+        original = market.refresh_market_stats
+
+        def refresh_during_a_write(locations):
+            original(locations)
+            with self.captureOnCommitCallbacks(execute=True):
+                self.add(price='900000')
+
+        self.add(city='Regina', province='SK')
+        with mock.patch('listings.market.refresh_market_stats', side_effect=refresh_during_a_write):
+            market.refresh_stale_markets()
+        self.assertEqual(set(StaleMarket.objects.values_list('city', flat=True)), {'Calgary'})
+        self.assertEqual(self.stats().listing_count, 2)
+
+    def test_listing_moved_after_a_deferred_load_leaves_its_market(self):
+        self.add(price='400000')
+        listing = Listing.objects.only('id', 'title').get()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.city, listing.province = 'Edmonton', 'AB'
+            listing.save()
+        self.assertEqual(self.stats('Edmonton').listing_count, 1)
+        self.assertFalse(MarketStats.objects.filter(city='Calgary').exists())
+
+    def test_rebuild_matches_incremental_rows(self):
+        self.add(price='400000', history=[(300, 380000), (5, 400000)])
+        self.add(city='Vancouver', province='BC', price='1200000', square_feet=1100)
+        fields = ['city', 'province', 'listing_count', 'median_price', 'median_price_per_sqft', 'price_change_1y']
+        market.refresh_stale_markets()
+        incremental = list(MarketStats.objects.values_list(*fields))
+        out = StringIO()
+        call_command('refresh_market_stats', stdout=out)
+        self.assertEqual(list(MarketStats.objects.values_list(*fields)), incremental)
+        self.assertIn('2 markets', out.getvalue())
+
+    def test_endpoint_filters_with_one_query(self):
+        self.add()
+        self.add(city='Vancouver', province='BC', price='1200000')
+        self.add(city='Victoria', province='BC', price='800000')
+        client = APIClient()
+        market.refresh_stale_markets()
+        with self.assertNumQueries(2):  # no stale markets, then the rows
+            response = client.get(reverse('market-stats'), {'province': 'bc'})
+        self.assertEqual([row['city'] for row in response.data['results']], ['Vancouver', 'Victoria'])
+        self.assertEqual(response.data['results'][0]['median_price'], '1200000.00')
+        self.assertEqual(len(client.get(reverse('market-stats')).data['results']), 3)
+        self.assertEqual(client.get(reverse('market-stats'), {'city': 'calgary'}).data['results'][0]['province'], 'AB')
+
+
+#----------------------------- Price point tests -----------------------------#
+
+
+class PricePointTests(TestCase):
+    """
+    PriceHistory.price_values is backed by normalized PricePoint rows.
+    """
+
+    def setUp(self):
+        self.listing = make_listing()
+
+    def test_price_values_are_stored_as_points(self):
+        history = PriceHistory.objects.create(
+            listing=self.listing,
+            price_values=[{'date': '2024-06-01', 'price': 510000}, {'date': '2024-01-01', 'price': 490000.5}],
+        )
+        points = list(PricePoint.objects.filter(listing=self.listing).values_list('date', 'price'))
+        self.assertEqual([str(point_date) for point_date, _ in points], ['2024-01-01', '2024-06-01'])
+        self.assertEqual(PriceHistory.objects.get(pk=history.pk).price_values, [
+            {'date': '2024-01-01', 'price': 490000.5},
+            {'date': '2024-06-01', 'price': 510000.0},
+        ])
+
+    def test_legacy_json_string_is_decoded(self):
+        history = PriceHistory.objects.create(
+            listing=self.listing,
+            price_values='[{"date": "2024-01-22", "price": 750000.0}]',
+        )
+        self.assertEqual(history.points.count(), 1)
+        self.assertEqual(history.points.get().price, Decimal('750000.00'))
+
+    def test_reassigning_replaces_points(self):
+        history = PriceHistory.objects.create(listing=self.listing, price_values=[{'date': '2024-01-01', 'price': 1}])
+        history.price_values = [{'date': '2024-02-01', 'price': 2}, {'date': '2024-03-01', 'price': 3}]
+        history.save()
+        self.assertEqual(list(history.points.values_list('price', flat=True)), [Decimal('2.00'), Decimal('3.00')])
+
+    def test_deleting_a_listing_does_not_load_its_points(self):
+        def delete_queries(points):
+            listing = make_listing()
+            PriceHistory.objects.create(listing=listing, price_values=[
+                {'date': str(date(2024, 1, 1) + timedelta(days=day)), 'price': 400000 + day} for day in range(points)
+            ])
+            with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+                listing.delete()
+            self.assertFalse(PricePoint.objects.filter(listing_id=listing.pk).exists())
+            return len(queries)
+
+        delete_queries(1)  # creates the version counters
+        self.assertEqual(delete_queries(5), delete_queries(50))
+
+    def test_serializer_output_is_a_decoded_list(self):
+        PriceHistory.objects.create(listing=self.listing, price_values=[{'date': '2024-01-01', 'price': 480000}])
+        response = APIClient().get(reverse('listing-detail', args=[self.listing.pk]))
+        self.assertEqual(response.data['price_histories'][0]['price_values'], [{'date': '2024-01-01', 'price': 480000.0}])
+
+
+#----------------------------- Fast serialization tests -----------------------------#
+
+
+class FastListingSerializationTests(TestCase):
+    """
+    serialize_listing_rows must render exactly the bytes ListingSerializer renders.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        self.client = APIClient()
+        make_listings(2)
+        make_listing(title='Sans historique \u2028 \u00e9t\u00e9 \U0001F3E0', current_price=Decimal('0.50'), description='')
+        many = make_listing(title='Two histories', current_price=Decimal('1234567890.10'))
+        PriceHistory.objects.create(listing=many, price_values=[{'date': '2023-03-01', 'price': 1.25}, {'date': '2022-01-01', 'price': 99}])
+        empty = PriceHistory.objects.create(listing=many, price_values=[])
+        PriceHistory.objects.filter(pk=empty.pk).update(date_recorded=None)
+
+    def assert_same_bytes(self, rows, listings):
+        renderer = JSONRenderer()
+        self.assertEqual(
+            renderer.render(serialize_listing_rows(rows)),
+            renderer.render(ListingSerializer(listings, many=True).data),
+        )
+
+    def test_rows_render_identically(self):
+        listings = Listing.objects.with_price_histories().order_by('id')
+        self.assert_same_bytes(Listing.objects.order_by('id').values(*LISTING_ROW_FIELDS), listings)
+        self.assertEqual(serialize_listing_rows([]), [])
+
+    def test_list_and_search_pages_match_serializer(self):
+        for url in (reverse('listing-list'), reverse('listing-search') + '?province=ON'):
+            response = self.client.get(url, {'page_size': 3})
+            self.assertEqual(response.status_code, 200)
+            ids = [item['id'] for item in response.data['results']]
+            self.assertEqual(len(ids), 3)
+            expected = JSONRenderer().render(ListingSerializer(
+                Listing.objects.with_price_histories().filter(pk__in=ids).order_by('id'), many=True
+            ).data)
+            self.assertIn(b'"results":' + expected, response.content)
+
+    def test_query_count_is_flat(self):
+        make_listings(30)
+        with self.assertNumQueries(4):  # table versions, listings, price histories, points
+            response = self.client.get(reverse('listing-list'), {'page_size': 200})
+        self.assertEqual(len(response.data['results']), 34)
+
+
+#----------------------------- Bulk write API tests -----------------------------#
+
+
+def feed_item(external_id=None, **overrides):
+    """
+    One bulk API item with every required listing field.
+    """
+    item = {
+        'title': 'Feed Home', 'street_address': '9 Feed Road', 'city': 'Halifax', 'province': 'NS',
+        'description': 'Imported from a partner feed.', 'current_price': '450000.00',
+        'bedrooms': 3, 'bathrooms': 2, 'square_feet': 1400, 'image_url': 'https://example.com/feed.jpg',
+    }
+    if external_id is not None:
+        item['external_id'] = external_id
+    item.update(overrides)
+    return item
+
+
+class BulkListingApiTests(TestCase):
+    """
+    /api/listings/bulk/ upserts arrays of listings in one transaction; /bulk/delete/ removes many.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        analysis.clear_memory()
+        self.client = APIClient()
+
+    def upsert(self, items, expected_status=200):
+        response = self.client.post(reverse('listing-bulk-upsert'), items, format='json')
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.data
+
+    def test_creates_listings_with_price_histories(self):
+        data = self.upsert([
+            feed_item('feed-1', price_values=[{'date': '2024-06-01', 'price': 450000}, {'date': '2024-01-01', 'price': 430000}]),
+            feed_item('feed-2'),
+            feed_item(title='No key'),
+        ])
+        self.assertEqual((data['created'], data['updated'], data['failed']), (3, 0, 0))
+        self.assertEqual([result['status'] for result in data['results']], ['created'] * 3)
+        first = Listing.objects.get(external_id='feed-1')
+        self.assertEqual(data['results'][0]['id'], first.pk)
+        self.assertEqual(first.pricehistory_set.get().price_values, [
+            {'date': '2024-01-01', 'price': 430000.0}, {'date': '2024-06-01', 'price': 450000.0},
+        ])
+        self.assertFalse(Listing.objects.get(external_id='feed-2').pricehistory_set.exists())
+        self.assertIsNone(Listing.objects.get(title='No key').external_id)
+
+    def test_existing_external_id_is_updated(self):
+        created = self.upsert([feed_item('feed-1'), feed_item('feed-2')])['results']
+        before = Listing.objects.get(external_id='feed-1').updated_at
+        data = self.upsert([
+            feed_item('feed-1', current_price='470000.00', price_values=[{'date': '2024-09-01', 'price': 470000}]),
+            feed_item('feed-3'),
+        ])
+        self.assertEqual((data['created'], data['updated']), (1, 1))
+        self.assertEqual(data['results'][0], {'index': 0, 'status': 'updated', 'id': created[0]['id'], 'external_id': 'feed-1'})
+        listing = Listing.objects.get(external_id='feed-1')
+        self.assertEqual(listing.current_price, Decimal('470000.00'))
+        self.assertGreater(listing.updated_at, before)
+        self.assertEqual(listing.pricehistory_set.count(), 1)
+        self.assertEqual(Listing.objects.count(), 3)
+
+    def test_invalid_items_are_reported_and_valid_ones_written(self):
+        data = self.upsert([
+            feed_item('feed-1'),
+            feed_item('feed-2', current_price='cheap'),
+            feed_item('feed-1'),
+            'not an object',
+            feed_item('feed-3', price_values=[{'price': 1}]),
+        ])
+        self.assertEqual((data['created'], data['failed']), (1, 4))
+        statuses = [result['status'] for result in data['results']]
+        self.assertEqual(statuses, ['created', 'invalid', 'invalid', 'invalid', 'invalid'])
+        self.assertIn('current_price', data['results'][1]['errors'])
+        self.assertIn('Duplicate', data['results'][2]['errors']['external_id'][0])
+        self.assertIn('price_values', data['results'][4]['errors'])
+        self.assertEqual(list(Listing.objects.values_list('external_id', flat=True)), ['feed-1'])
+
+    def test_malformed_body_is_400(self):
+        self.assertIn('error', self.upsert({'title': 'not a list'}, expected_status=400))
+        with override_settings(LISTINGS_BULK_MAX_ITEMS=2):
+            self.assertIn('error', self.upsert([feed_item()] * 3, expected_status=400))
+
+    def test_query_count_does_not_grow_with_batch_size(self):
+        def count(items):
+            with CaptureQueriesContext(connection) as ctx:
+                self.upsert(items)
+            return len(ctx.captured_queries)
+
+        make_listing(external_id='old-1')
+        make_listing(external_id='old-2')
+        self.upsert([feed_item('warm-up')])  # table version rows exist from here on
+        prices = [{'date': '2024-01-01', 'price': 400000}, {'date': '2024-06-01', 'price': 410000}]
+        # Each batch creates listings with price histories and updates one existing listing
+        small = count([feed_item(f'small-{i}', price_values=prices) for i in range(2)] + [feed_item('old-1')])
+        large = count([feed_item(f'large-{i}', price_values=prices) for i in range(40)] + [feed_item('old-2')])
+        self.assertEqual(small, large)
+
+    def test_side_effects_of_signals_are_applied(self):
+        listing = make_listing(external_id='feed-1', city='Toronto', province='ON')
+        analysis.remember_analysis(listing, 'Old analysis.', timezone.now())
+        etag = self.client.get(reverse('listing-list'))['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upsert([feed_item('feed-1'), feed_item('feed-2')])
+        self.assertNotEqual(self.client.get(reverse('listing-list'))['ETag'], etag)
+        self.assertIsNone(analysis.get_memory_analysis(Listing.objects.get(pk=listing.pk)))  # updated_at moved
+        market.refresh_stale_markets()
+        self.assertEqual(MarketStats.objects.get(city='Halifax').listing_count, 2)
+        self.assertFalse(MarketStats.objects.filter(city='Toronto').exists())  # its only listing moved away
+
+    def test_bulk_delete(self):
+        kept, by_id = make_listings(2)
+        self.upsert([feed_item('feed-1', price_values=[{'date': '2024-01-01', 'price': 1}])])
+        response = self.client.post(reverse('listing-bulk-delete'), {
+            'ids': [by_id.pk, 999999], 'external_ids': ['feed-1', 'feed-404'],
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['deleted'], 2)
+        self.assertEqual([result['status'] for result in response.data['results']], ['deleted', 'not_found', 'deleted', 'not_found'])
+        self.assertEqual(list(Listing.objects.values_list('pk', flat=True)), [kept.pk])
+        self.assertFalse(PricePoint.objects.exclude(listing=kept).exists())
+
+        response = self.client.post(reverse('listing-bulk-delete'), {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.data)
+
+    def test_single_create_rejects_taken_external_id(self):
+        make_listing(external_id='feed-1')
+        response = self.client.post(reverse('listing-create'), feed_item('feed-1'), format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('external_id', response.data)
+
+
+#----------------------------- Change feed tests -----------------------------#
+
+
+class ListingChangeFeedTests(TestCase):
+    """
+    /api/listings/changes/?since= returns what changed after a token, one entry per listing.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings = make_listings(3)
+
+    def sync(self, since=None, expected_status=200, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(reverse('listing-changes'), params)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.data
+
+    def test_initial_sync_then_nothing_new(self):
+        first = self.sync()
+        self.assertFalse(first['reset'] or first['has_more'])
+        self.assertEqual([item['id'] for item in first['upserted']], [listing.pk for listing in self.listings])
+        self.assertEqual(first['upserted'][0], dict(ListingSerializer(Listing.objects.get(pk=self.listings[0].pk)).data))
+        self.assertEqual(first['deleted'], [])
+
+        again = self.sync(first['next'])
+        self.assertEqual((again['upserted'], again['deleted'], again['next']), ([], [], first['next']))
+
+    def test_only_changed_listings_are_returned_once(self):
+        token = self.sync()['next']
+        listing = self.listings[1]
+        listing.title = 'Renamed'
+        listing.save()
+        listing.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(listing=listing, date_recorded=date(2024, 9, 1), price_values=[{'date': '2024-09-01', 'price': 1}])
+
+        delta = self.sync(token)
+        self.assertEqual([item['id'] for item in delta['upserted']], [listing.pk])
+        self.assertEqual(delta['upserted'][0]['title'], 'Renamed')
+        self.assertEqual(len(delta['upserted'][0]['price_histories']), 2)
+        self.assertGreater(int(delta['next']), int(token))
+        self.assertEqual(ListingChange.objects.filter(listing_id=listing.pk).count(), 1)
+
+    def test_price_history_writes_are_one_change_per_transaction(self):
+        token = self.sync()['next']
+        listing = self.listings[0]
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            for day in range(1, 4):
+                PriceHistory.objects.create(listing=listing, price_values=[
+                    {'date': f'2024-10-0{day}', 'price': 1}, {'date': f'2024-11-0{day}', 'price': 2},
+                ])
+        changed = [query['sql'] for query in queries if 'listings_listingchange' in query['sql'] and 'INSERT' in query['sql']]
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(ListingChange.objects.filter(pk__gt=token).count(), 1)
+        self.assertEqual([item['id'] for item in self.sync(token)['upserted']], [listing.pk])
+
+    def test_deletions_are_tombstones(self):
+        token = self.sync()['next']
+        doomed = self.listings[0]
+        self.assertEqual(self.client.delete(reverse('listing-delete', args=[doomed.pk])).status_code, 204)
+        delta = self.sync(token)
+        self.assertEqual((delta['upserted'], delta['deleted']), ([], [doomed.pk]))
+        self.assertNotIn(doomed.pk, [item['id'] for item in self.sync()['upserted']])
+        self.assertEqual(self.sync()['deleted'], [doomed.pk])
+
+    def test_bulk_writes_are_recorded(self):
+        token = self.sync()['next']
+        self.client.post(reverse('listing-bulk-upsert'), [feed_item('feed-1')], format='json')
+        delta = self.sync(token)
+        self.assertEqual([item['external_id'] for item in delta['upserted']], ['feed-1'])
+
+    def test_pages_follow_tokens(self):
+        page = self.sync(limit=2)
+        self.assertTrue(page['has_more'])
+        rest = self.sync(page['next'], limit=2)
+        self.assertFalse(rest['has_more'])
+        self.assertEqual([item['id'] for item in page['upserted'] + rest['upserted']], [listing.pk for listing in self.listings])
+
+    def test_cost_depends_on_changes_not_catalogue(self):
+        make_listings(20)
+        latest = self.sync()['next']
+        with self.assertNumQueries(3):  # validators, reset check, changes (nothing to serialize)
+            self.assertEqual(self.sync(latest)['upserted'], [])
+        self.listings[0].save()
+        with self.assertNumQueries(6):  # ... plus the changed listing, its price histories and points
+            delta = self.sync(latest)
+        self.assertEqual([item['id'] for item in delta['upserted']], [self.listings[0].pk])
+
+    def test_rebuilt_catalogue_resets_older_tokens(self):
+        token = self.sync()['next']
+        Listing.objects.all().delete()
+        changes.record_reset()
+        fresh = make_listing(title='After reset')
+        delta = self.sync(token)
+        self.assertTrue(delta['reset'])
+        self.assertEqual(([item['id'] for item in delta['upserted']], delta['deleted']), ([fresh.pk], []))
+        self.assertFalse(self.sync(delta['next'])['reset'])
+
+    def test_unchanged_poll_is_304_and_bad_tokens_are_400(self):
+        url = reverse('listing-changes') + '?since=' + self.sync()['next']
+        first = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        for params in ({'since': 'abc'}, {'since': '-1'}, {'limit': '0'}):
+            self.assertIn('error', self.sync(expected_status=400, **params))
+
+
+#----------------------------- Catalogue export tests -----------------------------#
+
+
+def bulk_listings(count):
+    """
+    Insert `count` listings, each with one two-point price history, in a few bulk queries.
+    """
+    listings = Listing.objects.bulk_create(
+        Listing(title=f'Bulk Home {i}', street_address=f'{i} Bulk Street', city='Toronto', province='ON',
+                description='A home used in export tests. ' * 4, current_price=Decimal('500000.00') + i,
+                bedrooms=3, bathrooms=2, square_feet=1500, image_url='https://example.com/home.jpg')
+        for i in range(count)
+    )
+    histories = PriceHistory.objects.bulk_create(
+        PriceHistory(listing=listing, date_recorded=date(2024, 6, 1)) for listing in listings
+    )
+    PricePoint.objects.bulk_create(
+        PricePoint(listing_id=history.listing_id, price_history=history, date=point_date, price=Decimal('480000.00'))
+        for history in histories for point_date in (date(2024, 1, 1), date(2024, 6, 1))
+    )
+
+
+class ListingExportTests(TestCase):
+    """
+    /api/listings/export/ streams the catalogue in chunks, as JSON or NDJSON, optionally gzipped.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        make_listings(4)
+        make_listing(title='Halifax Home', city='Halifax', province='NS')
+
+    def export(self, **params):
+        response = self.client.get(reverse('listing-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def expected(self, listings=None):
+        listings = (listings or Listing.objects.all()).with_price_histories().order_by('id')
+        return ListingSerializer(listings, many=True).data
+
+    @override_settings(LISTINGS_EXPORT_CHUNK_SIZE=2)
+    def test_json_export_matches_serializer_across_chunks(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertIn('filename="listings.json"', response['Content-Disposition'])
+        self.assertEqual(body, JSONRenderer().render(self.expected()))
+
+    @override_settings(LISTINGS_EXPORT_CHUNK_SIZE=2)
+    def test_ndjson_export_has_one_listing_per_line(self):
+        response, body = self.export(format='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], json.loads(JSONRenderer().render(self.expected())))
+
+    def test_gzip_export_decompresses_to_plain_export(self):
+        _, plain = self.export(format='ndjson')
+        response, compressed = self.export(format='ndjson', gzip='true')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed), plain)
+
+    def test_filters_and_empty_export(self):
+        _, body = self.export(province='NS')
+        self.assertEqual(body, JSONRenderer().render(self.expected(Listing.objects.filter(province='NS'))))
+        self.assertEqual(self.export(city='Nowhere')[1], b'[]')
+        self.assertEqual(self.export(city='Nowhere', format='ndjson')[1], b'')
+
+    def test_invalid_parameters_are_400(self):
+        for params in ({'format': 'xml'}, {'min_price': 'cheap'}):
+            response = self.client.get(reverse('listing-export'), params)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('error', response.json())
+
+    @override_settings(LISTINGS_EXPORT_CHUNK_SIZE=2)
+    def test_reads_in_chunks(self):
+        response = self.client.get(reverse('listing-export'))
+        # 3 chunks of (rows, price histories, points); the last listing has no history, so no points query
+        with self.assertNumQueries(3 + 3 + 2):
+            b''.join(response.streaming_content)
+
+    @override_settings(LISTINGS_EXPORT_CHUNK_SIZE=50)
+    def test_peak_memory_does_not_grow_with_catalogue_size(self):
+        def peak_while_streaming():
+            response = self.client.get(reverse('listing-export'), {'format': 'ndjson'})
+            tracemalloc.start()
+            try:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+                return size, tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        bulk_listings(200)
+        small_size, small_peak = peak_while_streaming()
+        bulk_listings(1800)
+        large_size, large_peak = peak_while_streaming()
+        self.assertGreater(large_size, 9 * small_size)
+        self.assertLess(large_peak, 1.5 * small_peak)
+
+
+#----------------------------- Geo search tests -----------------------------#
+
+
+class ListingGeoSearchTests(TestCase):
+    """
+    /api/listings/within/ answers bounding-box and radius queries from the spatial index.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        # Downtown Halifax, Dartmouth across the harbour (~3 km), Truro (~80 km), and one not geocoded
+        self.downtown = make_listing(title='Downtown', city='Halifax', province='NS', latitude=44.6488, longitude=-63.5752)
+        self.harbour = make_listing(title='Harbour', city='Dartmouth', province='NS', latitude=44.6713, longitude=-63.5772,
+                                    current_price=Decimal('350000.00'), bedrooms=2)
+        self.truro = make_listing(title='Truro', city='Truro', province='NS', latitude=45.3650, longitude=-63.2800)
+        self.unknown = make_listing(title='Nowhere')
+
+    def within(self, expected_status=200, **params):
+        response = self.client.get(reverse('listing-within'), params)
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.data
+
+    def test_sqlite_uses_rtree_index(self):
+        self.assertEqual(geo.spatial_backend(), 'rtree')
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {geo.RTREE_TABLE} ORDER BY id")
+            self.assertEqual([row[0] for row in cursor.fetchall()], [self.downtown.pk, self.harbour.pk, self.truro.pk])
+
+    def test_bbox_returns_compact_markers_inside_the_box(self):
+        data = self.within(bbox='-63.7,44.6,-63.5,44.7')
+        self.assertEqual(data['count'], 2)
+        self.assertFalse(data['truncated'])
+        self.assertEqual(data['results'][0], {
+            'id': self.downtown.pk, 'lat': 44.6488, 'lng': -63.5752, 'price': 500000.0,
+            'bedrooms': 3, 'bathrooms': 2, 'title': 'Downtown',
+        })
+        self.assertEqual([item['id'] for item in data['results']], [self.downtown.pk, self.harbour.pk])
+
+    def test_bbox_edges_are_inclusive_and_exact(self):
+        # R*Tree boxes are rounded outwards; the exact columns decide
+        self.assertEqual(self.within(bbox='-63.5752,44.6488,-63.5752,44.6488')['count'], 1)
+        self.assertEqual(self.within(bbox='-63.5751,44.6488,-63.5,44.6489')['count'], 0)
+
+    def test_search_filters_limit_and_truncation(self):
+        data = self.within(bbox='-64,44,-63,46', max_price='400000')
+        self.assertEqual([item['id'] for item in data['results']], [self.harbour.pk])
+        data = self.within(bbox='-64,44,-63,46', limit=2)
+        self.assertEqual((data['count'], data['truncated']), (2, True))
+
+    def test_radius_returns_nearest_first_with_distances(self):
+        data = self.within(lat=44.6488, lng=-63.5752, radius_km=5)
+        self.assertEqual([item['id'] for item in data['results']], [self.downtown.pk, self.harbour.pk])
+        self.assertEqual(data['results'][0]['distance_km'], 0.0)
+        self.assertAlmostEqual(data['results'][1]['distance_km'], 2.5, delta=0.1)
+        self.assertEqual(self.within(lat=44.6488, lng=-63.5752, radius_km=100)['count'], 3)
+
+    def test_radius_excludes_the_corners_of_its_bounding_box(self):
+        # ~4.9 km north and ~4.9 km east of downtown: inside the 5 km box, ~6.9 km away
+        corner = make_listing(latitude=44.6929, longitude=-63.5132)
+        data = self.within(lat=44.6488, lng=-63.5752, radius_km=5)
+        self.assertNotIn(corner.pk, [item['id'] for item in data['results']])
+        data = self.within(lat=44.6488, lng=-63.5752, radius_km=5, limit=1)
+        self.assertEqual(([item['id'] for item in data['results']], data['truncated']), ([self.downtown.pk], True))
+
+    def test_index_follows_updates_and_deletes(self):
+        Listing.objects.filter(pk=self.truro.pk).update(latitude=44.65, longitude=-63.58)
+        self.unknown.delete()
+        self.downtown.delete()
+        data = self.within(bbox='-63.7,44.6,-63.5,44.7')
+        self.assertEqual([item['id'] for item in data['results']], [self.harbour.pk, self.truro.pk])
+        Listing.objects.filter(pk=self.truro.pk).update(latitude=None, longitude=None)
+        self.assertEqual(self.within(bbox='-63.7,44.6,-63.5,44.7')['count'], 1)
+
+    def test_btree_fallback_matches_rtree(self):
+        queries = [('-63.7,44.6,-63.5,44.7', None), (None, (44.6488, -63.5752, 100))]
+        expected = [geo.listings_in_bbox(*geo.parse_bbox(queries[0][0]), limit=10), geo.listings_within_radius(*queries[1][1], limit=10)]
+        with mock.patch.dict(geo._backends, {'default': 'btree'}):
+            actual = [geo.listings_in_bbox(*geo.parse_bbox(queries[0][0]), limit=10), geo.listings_within_radius(*queries[1][1], limit=10)]
+        self.assertEqual(actual, expected)
+
+    def test_query_cost(self):
+        with self.assertNumQueries(4):  # ETag versions, candidates in a quarter of the radius, then all, markers
+            self.within(lat=44.6488, lng=-63.5752, radius_km=5)
+        with self.assertNumQueries(3):  # the quarter circle (5 km) already holds more than `limit` listings
+            data = self.within(lat=44.6488, lng=-63.5752, radius_km=20, limit=1)
+        self.assertEqual(([item['id'] for item in data['results']], data['truncated']), ([self.downtown.pk], True))
+        with self.assertNumQueries(2):  # ETag versions, markers
+            response = self.client.get(reverse('listing-within'), {'bbox': '-63.7,44.6,-63.5,44.7'})
+        with self.assertNumQueries(1):
+            again = self.client.get(reverse('listing-within'), {'bbox': '-63.7,44.6,-63.5,44.7'},
+                                    HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+
+    def test_invalid_parameters(self):
+        for params in [{}, {'bbox': '1,2,3'}, {'bbox': '-63,44,-64,45'}, {'bbox': '-63,44,-62,nan'},
+                       {'lat': '44'}, {'lat': '44', 'lng': '-63', 'radius_km': '100000'},
+                       {'bbox': '-64,44,-63,45', 'limit': '0'}, {'bbox': '-64,44,-63,45', 'min_price': 'x'}]:
+            self.assertIn('error', self.within(expected_status=400, **params), params)
+
+    def test_listing_api_reads_and_validates_coordinates(self):
+        self.assertEqual(self.client.get(reverse('listing-detail', args=[self.downtown.pk])).data['latitude'], 44.6488)
+        url = reverse('listing-update', args=[self.downtown.pk])
+        self.assertEqual(self.client.patch(url, {'latitude': 44.7}, format='json').status_code, 200)
+        self.assertEqual(self.within(bbox='-63.6,44.69,-63.5,44.71')['results'][0]['id'], self.downtown.pk)
+        self.assertEqual(self.client.patch(reverse('listing-update', args=[self.unknown.pk]), {'latitude': 44.7},
+                                           format='json').status_code, 400)
+        self.assertEqual(self.client.patch(url, {'longitude': 200}, format='json').status_code, 400)
+
+
+class GazetteerTests(TestCase):
+    """
+    Offline geocoding from a gazetteer file: `manage.py geocode_listings`.
+    """
+
+    def setUp(self):
+        self.gazetteer = Gazetteer([
+            ('', 'Halifax', 'NS', 44.6488, -63.5752),
+            ('1 Spring Garden Road', 'Halifax', 'NS', 44.6430, -63.5780),
+            ('', "St. John's", 'NL', 47.5615, -52.7126),
+        ])
+
+    def test_address_then_city_matches(self):
+        self.assertEqual(self.gazetteer.geocode('1 spring garden road ', 'HALIFAX', 'Nova Scotia'), (44.6430, -63.5780, 'address'))
+        latitude, longitude, precision = self.gazetteer.geocode('9 Barrington St', 'Halifax', 'NS')
+        self.assertEqual(precision, 'city')
+        self.assertEqual(self.gazetteer.geocode('9 Barrington St', 'halifax', 'ns'), (latitude, longitude, 'city'))
+        self.assertIsNotNone(self.gazetteer.geocode('1 Water St', "st johns", 'NL'))
+        self.assertIsNone(self.gazetteer.geocode('1 Main St', 'Springfield', 'IL'))
+
+    def test_city_matches_are_scattered_near_the_centre(self):
+        points = {scatter((44.6488, -63.5752), f'{n} Main St') for n in range(200)}
+        self.assertEqual(len(points), 200)
+        distances = geo.haversine_km(44.6488, -63.5752, *map(list, zip(*points)))
+        self.assertLessEqual(distances.max(), 3.0 + 1e-3)
+        self.assertGreater(distances.mean(), 1.0)
+
+    def test_bundled_gazetteer_covers_the_sample_data(self):
+        from .management.commands._sample_data import sample_listings
+
+        gazetteer = Gazetteer.load(settings.LISTINGS_GAZETTEER_PATH)
+        for sample in sample_listings:
+            self.assertIsNotNone(gazetteer.geocode(sample['street_address'], sample['city'], sample['province']), sample)
+
+    def test_load_rejects_bad_rows(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('# comment\nstreet_address,city,province,latitude,longitude\n,Halifax,NS,44.6,-63.5\n,Oops,NS,95,0\n')
+        self.addCleanup(os.remove, f.name)
+        with self.assertRaisesMessage(ValueError, 'row 3'):
+            Gazetteer.load(f.name)
+
+    def test_backfill_sets_coordinates_and_records_changes(self):
+        placed = make_listing(latitude=1.0, longitude=2.0)
+        halifax = make_listings(3, city='Halifax', province='NS')
+        lost = make_listing(city='Springfield', province='IL')
+        token = changes.changes_since(0, 100)['next']
+
+        counts = backfill_coordinates(self.gazetteer, batch_size=2)
+        self.assertEqual((counts['city'], counts['unmatched'], counts['unmatched_places']), (3, 1, {('Springfield', 'IL'): 1}))
+        self.assertFalse(Listing.objects.filter(pk__in=[l.pk for l in halifax], latitude__isnull=True).exists())
+        self.assertEqual(Listing.objects.values_list('latitude', 'longitude').get(pk=placed.pk), (1.0, 2.0))
+        self.assertIsNone(Listing.objects.get(pk=lost.pk).latitude)
+        feed = changes.changes_since(int(token), 100)
+        self.assertEqual([item['id'] for item in feed['upserted']], [l.pk for l in halifax])
+        self.assertEqual(geo.listings_in_bbox(-64, 44, -63, 45, limit=10)[0][0]['id'], halifax[0].pk)
+
+    def test_command_reports_unmatched_places(self):
+        make_listings(2, city='Halifax', province='NS')
+        make_listing(city='Springfield', province='IL')
+        out = StringIO()
+        call_command('geocode_listings', stdout=out)
+        self.assertIn('Geocoded 2 listings', out.getvalue())
+        self.assertIn('Springfield, IL (1)', out.getvalue())
+        with self.assertRaises(CommandError):
+            call_command('geocode_listings', gazetteer='/nonexistent.csv', stdout=StringIO())
+
+
+#----------------------------- Map cluster tests -----------------------------#
+
+
+class ListingClusterTests(TestCase):
+    """
+    /api/listings/clusters/ aggregates the listings of map tiles into grid cells, cached per tile.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()  # rolled-back change tokens repeat between tests
+        clusters.grid.invalidate()
+        clusters.stats.reset()
+        # Four listings within ~150 m in downtown Toronto, one in Scarborough (~15 km), one in Ottawa
+        self.downtown = [
+            make_listing(title=f'Downtown {i}', city='Toronto', latitude=43.6532 + i * 0.0002,
+                         longitude=-79.3832 + i * 0.0003, current_price=Decimal(price))
+            for i, price in enumerate(['400000.00', '700000.00', '500000.00', '600000.00'])
+        ]
+        self.scarborough = make_listing(title='Scarborough', city='Toronto', latitude=43.7764, longitude=-79.2318,
+                                        current_price=Decimal('450000.00'))
+        self.ottawa = make_listing(title='Ottawa', city='Ottawa', latitude=45.4215, longitude=-75.6972)
+        self.unknown = make_listing(title='Nowhere')
+
+    def tile(self, z, x, y, expected_status=200):
+        response = self.client.get(reverse('listing-cluster-tile', args=[z, x, y]))
+        self.assertEqual(response.status_code, expected_status, response.content)
+        return response.data
+
+    def test_tile_math(self):
+        x, y = clusters.tile_coordinates(np.array([43.6532]), np.array([-79.3832]), 10)
+        self.assertEqual((int(x[0]), int(y[0])), (286, 373))
+        self.assertEqual(clusters.tiles_in_bbox(-79.5, 43.6, -79.2, 43.8, 10), [(285, 373), (286, 373)])
+        self.assertEqual(clusters.tiles_in_bbox(-180, -85, 180, 85, 1), [(0, 0), (1, 0), (0, 1), (1, 1)])
+        self.assertEqual(int(clusters.morton_codes(np.array([0b11]), np.array([0b01]))[0]), 0b0111)
+        low, high = clusters.tile_code_range(10, 286, 373)
+        code = int(clusters.grid_codes(np.array([43.6532]), np.array([-79.3832]))[0])
+        self.assertTrue(low <= code < high)
+
+    def test_tile_aggregates_cells(self):
+        data = self.tile(10, 286, 373)
+        self.assertEqual((data['zoom'], data['tiles'], data['count']), (10, 1, 5))
+        downtown, scarborough = sorted(data['clusters'], key=lambda cluster: -cluster['count'])
+        self.assertEqual(
+            {key: downtown[key] for key in ('count', 'price_min', 'price_median', 'price_max')},
+            {'count': 4, 'price_min': 400000.0, 'price_median': 550000.0, 'price_max': 700000.0},
+        )
+        self.assertAlmostEqual(downtown['lat'], 43.6535, places=6)
+        self.assertAlmostEqual(downtown['lng'], -79.38275, places=6)
+        self.assertNotIn('id', downtown)
+        self.assertEqual(scarborough, {
+            'lat': 43.7764, 'lng': -79.2318, 'count': 1, 'price_min': 450000.0,
+            'price_median': 450000.0, 'price_max': 450000.0, 'id': self.scarborough.pk,
+        })
+        # Zoomed in far enough, every downtown listing is its own cell
+        self.assertEqual(len(self.client.get(reverse('listing-clusters'), {'zoom': 19, 'bbox': '-79.384,43.653,-79.382,43.654'}).data['clusters']), 4)
+
+    def test_viewport_covers_every_tile(self):
+        data = self.client.get(reverse('listing-clusters'), {'zoom': 1, 'bbox': '-180,-85,180,85'}).data
+        self.assertEqual((data['tiles'], data['count']), (4, 6))
+        self.assertEqual(len(data['clusters']), 1)  # at zoom 1 one cell holds Toronto and Ottawa
+        self.assertEqual(len(self.client.get(reverse('listing-clusters'), {'zoom': 2, 'bbox': '-180,-85,180,85'}).data['clusters']), 2)
+        self.assertEqual(self.client.get(reverse('listing-clusters'), {'zoom': 6, 'bbox': '-76,45,-75,46'}).data['count'], 1)
+
+    def test_cached_tiles_are_served_without_reading_listings(self):
+        self.tile(10, 286, 373)
+        with self.assertNumQueries(2):  # ETag versions, change token
+            self.tile(10, 286, 373)
+        snapshot = clusters.stats.snapshot()
+        self.assertEqual((snapshot['tile_hits'], snapshot['tile_misses'], snapshot['rebuilds']), (1, 1, 1))
+        self.assertEqual(self.client.get(reverse('listing-cache-stats')).data['clusters']['tile_hits'], 1)
+
+    def test_writes_are_applied_incrementally(self):
+        self.tile(10, 286, 373)
+        self.downtown[0].delete()
+        Listing.objects.filter(pk=self.downtown[1].pk).update(current_price=Decimal('1.00'))  # no signal: not seen
+        listing = self.downtown[2]
+        listing.latitude, listing.longitude = 45.4216, -75.6973  # moves to Ottawa
+        listing.save()
+        data = self.tile(10, 286, 373)
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(max(cluster['price_max'] for cluster in data['clusters']), 700000.0)
+        ottawa = self.client.get(reverse('listing-clusters'), {'zoom': 10, 'bbox': '-75.7,45.42,-75.69,45.43'}).data
+        self.assertEqual(ottawa['count'], 2)
+        self.assertEqual(clusters.stats.snapshot()['updates'], 1)
+        self.assertEqual(clusters.stats.snapshot()['rebuilds'], 1)
+
+    def test_reset_rebuilds_the_grid(self):
+        self.tile(10, 286, 373)
+        Listing.objects.filter(pk=self.scarborough.pk).update(latitude=43.78)
+        changes.record_reset()
+        self.assertEqual(self.tile(10, 286, 373)['count'], 5)
+        self.assertEqual(clusters.stats.snapshot()['rebuilds'], 2)
+
+    def test_cache_errors_fall_back_to_the_grid(self):
+        with mock.patch.object(clusters, '_cache', side_effect=ConnectionError('down')), \
+                self.assertLogs('listings.clusters', 'WARNING') as logs:
+            self.assertEqual(self.tile(10, 286, 373)['count'], 5)
+        self.assertEqual(clusters.stats.snapshot()['errors'], 1)
+        self.assertEqual([record.getMessage() for record in logs.records], ['Listing cluster cache unavailable'])
+
+    def test_invalid_parameters(self):
+        self.tile(22, 0, 0, expected_status=400)
+        self.tile(1, 2, 0, expected_status=400)
+        for params in [{}, {'zoom': 5}, {'bbox': '-80,43,-79,44'}, {'zoom': 'x', 'bbox': '-80,43,-79,44'},
+                       {'zoom': 12, 'bbox': '-80,43,-79,44'}, {'zoom': 5, 'bbox': '-79,43,-80,44'}]:
+            response = self.client.get(reverse('listing-clusters'), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('error', response.data)
+
+
+#----------------------------- Price trend tests -----------------------------#
+
+
+class ListingTrendTests(TestCase):
+    """
+    Price trend statistics are computed from PricePoint rows with grouped numpy reductions.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        response_cache.clear()
+        self.listing = make_listing(title='Trending')
+        PriceHistory.objects.create(listing=self.listing, price_values=[
+            {'date': '2023-01-01', 'price': 400000}, {'date': '2024-01-01', 'price': 420000},
+        ])
+        self.flat = make_listing(title='One point')
+        PriceHistory.objects.create(listing=self.flat, price_values=[{'date': '2024-03-01', 'price': 300000}])
+        self.bare = make_listing(title='No history')
+
+    def test_statistics_of_one_series(self):
+        trend = trends.listing_trends([self.listing.pk], 365)[self.listing.pk]
+        self.assertEqual(trend, {
+            'points': 2, 'first_date': '2023-01-01', 'last_date': '2024-01-01',
+            'first_price': 400000.0, 'last_price': 420000.0, 'percent_change': 5.0,
+            'annualized_growth': 5.0, 'volatility': None, 'trend_slope_per_year': 20013.7,
+            'forecast': {'date': '2024-12-31', 'price': 440000.0},
+        })
+
+    def test_short_series_leave_statistics_undefined(self):
+        result = trends.listing_trends([self.flat.pk, self.bare.pk], 365)
+        self.assertEqual((result[self.flat.pk]['percent_change'], result[self.flat.pk]['annualized_growth'],
+                          result[self.flat.pk]['trend_slope_per_year'], result[self.flat.pk]['forecast']),
+                         (0.0, None, None, None))
+        self.assertEqual(result[self.bare.pk], trends.empty_trend())
+        # Two points a month apart: a percent change, but no annualized rate
+        month = trends.compute_trends(np.array([1, 1]), np.array([0, 30]), np.array([100.0, 110.0]), 30)[1]
+        self.assertEqual((month['percent_change'], month['annualized_growth']), (10.0, None))
+
+    def test_volatility_matches_a_direct_computation(self):
+        days, prices = np.array([0, 30, 90, 100, 200]), np.array([100.0, 104.0, 101.0, 103.0, 110.0])
+        returns = np.log(prices[1:] / prices[:-1]) / np.sqrt(np.diff(days) / trends.DAYS_PER_YEAR)
+        slope = np.polyfit(days, prices, 1)[0]
+        trend = trends.compute_trends(np.full(5, 9), days, prices, 100)[9]
+        self.assertAlmostEqual(trend['volatility'], np.std(returns, ddof=1) * 100, places=2)
+        self.assertAlmostEqual(trend['trend_slope_per_year'], slope * trends.DAYS_PER_YEAR, places=2)
+        self.assertAlmostEqual(trend['forecast']['price'], np.polyval(np.polyfit(days, prices, 1), 300), places=2)
+
+    def test_batch_matches_one_listing_at_a_time(self):
+        rng = np.random.default_rng(7)
+        counts = [1, 2, 5, 3, 8]
+        ids = np.repeat(np.arange(len(counts)), counts)
+        days = np.concatenate([np.sort(rng.choice(2000, size=n, replace=False)) for n in counts])
+        prices = rng.uniform(1e5, 1e6, size=len(ids))
+        together = trends.compute_trends(ids, days, prices, 365)
+        for pk in range(len(counts)):
+            self.assertEqual(together[pk], trends.compute_trends(ids[ids == pk], days[ids == pk], prices[ids == pk], 365)[pk])
+
+    def test_histories_are_merged_in_date_order(self):
+        PriceHistory.objects.create(listing=self.listing, price_values=[{'date': '2023-06-01', 'price': 380000}])
+        trend = trends.listing_trends([self.listing.pk], 365)[self.listing.pk]
+        self.assertEqual((trend['points'], trend['first_price'], trend['last_price']), (3, 400000.0, 420000.0))
+        self.assertIsNotNone(trend['volatility'])
+
+    def test_trend_endpoint(self):
+        url = reverse('listing-trend', args=[self.listing.pk])
+        with self.assertNumQueries(3):  # ETag, listing exists, points
+            response = self.client.get(url, {'horizon_days': 730})
+        self.assertEqual(response.data['listing_id'], self.listing.pk)
+        self.assertEqual(response.data['forecast'], {'date': '2025-12-31', 'price': 460000.0})
+        again = self.client.get(url, {'horizon_days': 730}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(again.status_code, 304)
+        # The forecast depends on the horizon, so each horizon has its own ETag
+        other = self.client.get(url, {'horizon_days': 365}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(other.status_code, 200)
+        self.assertEqual(other.data['forecast']['date'], '2024-12-31')
+        self.assertNotEqual(other['ETag'], response['ETag'])
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(listing=self.listing, price_values=[{'date': '2024-06-01', 'price': 430000}])
+        self.assertEqual(self.client.get(url, {'horizon_days': 730}, HTTP_IF_NONE_MATCH=response['ETag']).data['points'], 3)
+
+        self.assertEqual(self.client.get(reverse('listing-trend', args=[999999])).status_code, 404)
+        for horizon in ['0', '4000', 'x']:
+            self.assertEqual(self.client.get(url, {'horizon_days': horizon}).status_code, 400)
+
+    def test_batch_endpoint(self):
+        ids = f'{self.bare.pk},{self.listing.pk},999999,{self.listing.pk}'
+        with self.assertNumQueries(3):  # ETag versions, existing ids, points
+            data = self.client.get(reverse('listing-trends'), {'ids': ids}).data
+        self.assertEqual([item['listing_id'] for item in data['results']], [self.bare.pk, self.listing.pk])
+        self.assertEqual((data['count'], data['not_found']), (2, [999999]))
+        self.assertEqual(data['results'][1]['percent_change'], 5.0)
+        for params in [{}, {'ids': '1,x'}, {'ids': '1', 'horizon_days': '-1'}]:
+            self.assertEqual(self.client.get(reverse('listing-trends'), params).status_code, 400, params)
+        with override_settings(LISTINGS_TREND_MAX_IDS=2):
+            self.assertEqual(self.client.get(reverse('listing-trends'), {'ids': '1,2,3'}).status_code, 400)
+
+    def test_catalogue_command_writes_every_listing(self):
+        out = StringIO()
+        call_command('price_trends', batch_size=2, stdout=out, stderr=StringIO())
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([row['listing_id'] for row in rows], [self.listing.pk, self.flat.pk, self.bare.pk])
+        self.assertEqual(rows[0]['annualized_growth'], 5.0)
+        self.assertEqual(rows[2]['points'], 0)
+        with self.assertRaises(CommandError):
+            call_command('price_trends', horizon_days='0', stdout=StringIO())
+
+
+#----------------------------- AI analysis proxy tests -----------------------------#
+
+
+class AnalyzeHousingTests(TestCase):
+    """
+    Sync and async analyze-housing endpoints against a local fake OpenAI server.
+    """
+
+    def setUp(self):
+        analysis.clear_memory()
+        self.listing = make_listings(1)[0]
+
+    def test_sync_view_uses_shared_client_and_caches(self):
+        with FakeOpenAIServer(reply='Prices are rising.') as server:
+            client = APIClient()
+            first = client.post(reverse('analyze-housing'), {'listing_id': self.listing.pk}, format='json')
+            second = client.post(reverse('analyze-housing'), {'listing_id': self.listing.pk}, format='json')
+            self.assertIs(llm.get_client(), llm.get_client())
+        self.assertEqual(first.data, {'analysis': 'Prices are rising.', 'cached': False})
+        self.assertEqual(second.data, {'analysis': 'Prices are rising.', 'cached': True})
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(server.requests[0]['model'], llm.ANALYSIS_MODEL)
+
+    async def test_async_view_returns_analysis(self):
+        with FakeOpenAIServer(reply='Stable market.') as server:
+            response = await AsyncClient().post(
+                reverse('analyze-housing-async'), {'listing_id': self.listing.pk}, content_type='application/json'
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'analysis': 'Stable market.', 'cached': False})
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(await AnalysisCache.objects.filter(listing=self.listing).acount(), 1)
+
+    async def test_async_view_validates_input(self):
+        client = AsyncClient()
+        missing = await client.post(reverse('analyze-housing-async'), {}, content_type='application/json')
+        unknown = await client.post(reverse('analyze-housing-async'), {'listing_id': 999999}, content_type='application/json')
+        self.assertEqual((missing.status_code, unknown.status_code), (400, 400))
+
+    async def test_async_calls_overlap_on_one_event_loop(self):
+        listings = [self.listing] + await sync_to_async(make_listings)(3, city='Halifax')
+        with FakeOpenAIServer(delay=0.5) as server:
+            client = AsyncClient()
+            start = time.perf_counter()
+            responses = await asyncio.gather(*(
+                client.post(reverse('analyze-housing-async'), {'listing_id': listing.pk}, content_type='application/json')
+                for listing in listings
+            ))
+            elapsed = time.perf_counter() - start
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(server.calls, 4)
+        # Four 0.5s upstream calls served concurrently, not back to back
+        self.assertLess(elapsed, 1.5)
+
+
+#----------------------------- Prompt-keyed analysis cache tests -----------------------------#
+
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class AnalysisPromptCacheTests(TestCase):
+    """
+    AnalysisCache rows are keyed by the hash of the rendered request, not the listing.
+    """
+
+    def setUp(self):
+        analysis.clear_memory()
+        self.listing = make_listings(1)[0]
+        self.url = reverse('analyze-housing')
+
+    def post(self, listing):
+        return APIClient().post(self.url, {'listing_id': listing.pk}, format='json')
+
+    def test_request_key_covers_model_and_parameters(self):
+        key = llm.request_key('prompt')
+        self.assertEqual(len(key), 64)
+        self.assertEqual(key, llm.request_key('prompt'))
+        self.assertNotEqual(key, llm.request_key('prompt '))
+        with mock.patch.object(llm, 'ANALYSIS_MODEL', 'gpt-4o-mini'):
+            self.assertNotEqual(key, llm.request_key('prompt'))
+        with mock.patch.dict(llm.ANALYSIS_PARAMS, temperature=0.2):
+            self.assertNotEqual(key, llm.request_key('prompt'))
+
+    def test_editing_a_listing_invalidates_its_analysis(self):
+        with FakeOpenAIServer(reply='Before.') as server:
+            self.assertEqual(self.post(self.listing).data['analysis'], 'Before.')
+            response = APIClient().patch(reverse('listing-update', args=[self.listing.pk]),
+                                         {'current_price': '450000.00'}, format='json')
+            self.assertEqual(response.status_code, 200)
+            server.reply = 'After.'
+            self.assertEqual(self.post(self.listing).data, {'analysis': 'After.', 'cached': False})
+            self.assertEqual(self.post(self.listing).data, {'analysis': 'After.', 'cached': True})
+        self.assertEqual(server.calls, 2)
+        self.assertEqual(AnalysisCache.objects.filter(listing=self.listing).count(), 2)
+
+    def test_identical_prompts_share_one_analysis(self):
+        twin = make_listings(1)[0]  # same title, details and price history
+        with FakeOpenAIServer(reply='Shared.') as server:
+            self.assertEqual(self.post(self.listing).data['cached'], False)
+            self.assertEqual(self.post(twin).data, {'analysis': 'Shared.', 'cached': True})
+        self.assertEqual(server.calls, 1)
+        self.assertEqual(AnalysisCache.objects.count(), 1)
+
+
+#----------------------------- Single-flight analysis tests -----------------------------#
+
+
+class AnalyzeHousingSingleFlightTests(TransactionTestCase):
+    """
+    Concurrent cache misses for the same listing produce exactly one upstream call and one cache row.
+    Uses TransactionTestCase so request threads see committed rows.
+    """
+
+    def setUp(self):
+        analysis.clear_memory()
+        self.listing = make_listings(1)[0]
+
+    def test_concurrent_sync_requests_share_one_call(self):
+        responses = []
+
+        def request():
+            response = APIClient().post(reverse('analyze-housing'), {'listing_id': self.listing.pk}, format='json')
+            responses.append(response)
+
+        with FakeOpenAIServer(reply='Shared.', delay=0.5) as server:
+            threads = [threading.Thread(target=request) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(server.calls, 1)
+        self.assertEqual([response.status_code for response in responses], [200] * 8)
+        self.assertTrue(all(response.data['analysis'] == 'Shared.' for response in responses))
+        self.assertEqual(AnalysisCache.objects.filter(listing=self.listing).count(), 1)
+
+    async def test_concurrent_async_requests_share_one_call(self):
+        with FakeOpenAIServer(reply='Shared.', delay=0.5) as server:
+            client = AsyncClient()
+            responses = await asyncio.gather(*(
+                client.post(reverse('analyze-housing-async'), {'listing_id': self.listing.pk}, content_type='application/json')
+                for _ in range(8)
+            ))
+        self.assertEqual(server.calls, 1)
+        self.assertTrue(all(response.json()['analysis'] == 'Shared.' for response in responses))
+        self.assertEqual(await AnalysisCache.objects.filter(listing=self.listing).acount(), 1)
+
+    def test_duplicate_prompt_rows_are_rejected(self):
+        AnalysisCache.objects.create(listing=self.listing, prompt_hash='a' * 64, analysis_result='a')
+        with self.assertRaises(IntegrityError):
+            AnalysisCache.objects.create(listing=self.listing, prompt_hash='a' * 64, analysis_result='b')
+
+
+class AnalyzeListingsCommandTests(TransactionTestCase):
+    """
+    analyze_listings fills in missing analyses through a worker pool against a fake OpenAI server.
+    Uses TransactionTestCase so worker threads see committed rows.
+    """
+
+    def setUp(self):
+        analysis.clear_memory()
+        self.listings = make_listings(4)
+
+    def run_command(self, **options):
+        options = {'workers': 3, 'rate': 0, 'backoff': 0.01, **options}
+        out, err = StringIO(), StringIO()
+        call_command('analyze_listings', stdout=out, stderr=err, **options)
+        return out.getvalue() + err.getvalue()
+
+    def test_analyzes_listings_missing_an_analysis(self):
+        cached = self.listings[0]
+        analysis.store_analysis(cached, cached.pricehistory_set.get(), 'Existing.')
+        with FakeOpenAIServer(reply='Batch analysis.') as server:
+            output = self.run_command()
+        self.assertEqual(server.calls, 3)
+        self.assertIn('3 listings need an analysis', output)
+        self.assertIn('Analyzed 3 listings', output)
+        for listing in self.listings[1:]:
+            row = AnalysisCache.objects.get(listing=listing)
+            self.assertEqual(row.analysis_result, 'Batch analysis.')
+            self.assertEqual(row.price_history, listing.pricehistory_set.get())
+        self.assertEqual(AnalysisCache.objects.get(listing=cached).analysis_result, 'Existing.')
+        # Prompts come from the same builder analyze-housing uses
+        self.assertEqual(server.requests[0]['messages'][-1]['content'][:50],
+                         analysis.generate_prompt(self.listings[1], self.listings[1].pricehistory_set.get())[:50])
+
+    def test_rerun_resumes_and_stale_history_is_reanalyzed(self):
+        with FakeOpenAIServer() as server:
+            self.run_command(limit=2)
+            self.assertEqual(server.calls, 2)
+            self.run_command()
+            self.assertEqual(server.calls, 4)
+            self.assertIn('0 listings need an analysis', self.run_command())
+            self.assertEqual(server.calls, 4)
+
+            PriceHistory.objects.create(listing=self.listings[0], date_recorded=date.today() + timedelta(days=1), price_values=[{'date': '2024-09-01', 'price': 510000.0}])
+            self.run_command()
+            self.assertEqual(server.calls, 5)
+
+            # Prompts are rendered from the current data, so even edits that send no signals count
+            Listing.objects.filter(pk=self.listings[1].pk).update(description='Renovated kitchen.')
+            self.run_command()
+        self.assertEqual(server.calls, 6)
+
+    def test_retries_throttling_and_server_errors(self):
+        with FakeOpenAIServer(failures=[429, 500, 503]) as server:
+            output = self.run_command(ids=str(self.listings[0].pk), max_retries=3)
+        self.assertEqual(server.calls, 4)
+        self.assertIn('Analyzed 1 listings', output)
+        self.assertIn('3 retries', output)
+        self.assertTrue(AnalysisCache.objects.filter(listing=self.listings[0]).exists())
+
+    def test_gives_up_after_max_retries(self):
+        with FakeOpenAIServer(failures=[500, 500]) as server:
+            output = self.run_command(ids=str(self.listings[0].pk), max_retries=1)
+        self.assertEqual(server.calls, 2)
+        self.assertIn('1 failed', output)
+        self.assertFalse(AnalysisCache.objects.exists())
+
+    def test_filters_and_dry_run(self):
+        Listing.objects.filter(pk=self.listings[0].pk).update(city='Moncton')
+        with FakeOpenAIServer() as server:
+            self.assertIn('1 listings need an analysis', self.run_command(city='moncton', dry_run=True))
+            self.assertEqual(server.calls, 0)
+            self.run_command(city='moncton')
+        self.assertEqual(list(AnalysisCache.objects.values_list('listing_id', flat=True)), [self.listings[0].pk])
+
+    def test_cache_access_is_serialized_only_on_sqlite(self):
+        from .management.commands.analyze_listings import Command
+
+        for listing, vendor, serialized in ((self.listings[0], 'sqlite', True), (self.listings[1], 'postgresql', False)):
+            command = Command(stdout=StringIO(), stderr=StringIO())
+            with FakeOpenAIServer(), mock.patch.object(connection, 'vendor', vendor):
+                call_command(command, ids=str(listing.pk), workers=1, rate=0)
+            self.assertEqual(isinstance(command._db_lock, type(threading.Lock())), serialized)
+            self.assertTrue(AnalysisCache.objects.filter(listing=listing).exists())
+
+    def test_rate_limiter_spaces_calls(self):
+        from .management.commands.analyze_listings import RateLimiter
+
+        limiter = RateLimiter(rate=50)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 5 / 50 - 0.01)
+
+
+#----------------------------- Streaming analysis tests -----------------------------#
+
+
+def parse_sse(chunks):
+    """
+    Decode server-sent event chunks into a list of (event, data) tuples.
+    """
+    events = []
+    for block in b''.join(chunks).decode().split('\n\n'):
+        if block.strip():
+            fields = dict(line.split(': ', 1) for line in block.split('\n'))
+            events.append((fields['event'], json.loads(fields['data'])))
+    return events
+
+
+class AnalyzeHousingStreamTests(TestCase):
+    """
+    analyze-housing streaming mode relays tokens as server-sent events.
+    """
+
+    def setUp(self):
+        analysis.clear_memory()
+        self.listing = make_listings(1)[0]
+        self.url = reverse('analyze-housing')
+
+    def test_tokens_are_relayed_before_completion_finishes(self):
+        with FakeOpenAIServer(reply='Prices will rise steadily', token_delay=0.2):
+            start = time.perf_counter()
+            response = APIClient().post(self.url, {'listing_id': self.listing.pk, 'stream': True}, format='json')
+            chunks = iter(response.streaming_content)
+            first = next(chunks)
+            first_at = time.perf_counter() - start
+            rest = list(chunks)
+            total = time.perf_counter() - start
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertLess(first_at, total - 0.4)
+        events = parse_sse([first] + rest)
+        self.assertEqual([data['delta'] for event, data in events if event == 'token'], ['Prices', ' will', ' rise', ' steadily'])
+        self.assertEqual(events[-1], ('analysis', {'analysis': 'Prices will rise steadily', 'cached': False}))
+        self.assertEqual(AnalysisCache.objects.get(listing=self.listing).analysis_result, 'Prices will rise steadily')
+
+    def test_cache_hit_is_a_single_event(self):
+        analysis.store_analysis(self.listing, self.listing.pricehistory_set.get(), 'Cached text.')
+        analysis.clear_memory()
+        with FakeOpenAIServer() as server:
+            response = APIClient().post(self.url, {'listing_id': self.listing.pk}, format='json', HTTP_ACCEPT='text/event-stream')
+            events = parse_sse(response.streaming_content)
+        self.assertEqual(events, [('analysis', {'analysis': 'Cached text.', 'cached': True})])
+        self.assertEqual(server.calls, 0)
+
+    def test_upstream_failure_is_an_error_event(self):
+        with override_settings(OPENAI_API_KEY='sk-test', OPENAI_BASE_URL='http://127.0.0.1:9/v1', OPENAI_MAX_RETRIES=0):
+            llm.reset_clients()
+            try:
+                with self.assertLogs('listings', 'ERROR') as logs:
+                    response = APIClient().post(self.url, {'listing_id': self.listing.pk, 'stream': 'true'}, format='json')
+                    events = parse_sse(response.streaming_content)
+            finally:
+                llm.reset_clients()
+        self.assertEqual(events[-1][0], 'error')
+        self.assertEqual(logs.records[0].getMessage(), f'OpenAI streaming analysis failed for listing {self.listing.pk}')
+        self.assertIsNotNone(logs.records[0].exc_info)
+        self.assertFalse(AnalysisCache.objects.exists())
+
+
+#----------------------------- Two-tier analysis cache tests -----------------------------#
+
+
+@override_settings(OPENAI_API_KEY='sk-test')
+class AnalysisCacheTierTests(TestCase):
+    """
+    Memory tier in front of AnalysisCache, TTL expiry, purging and counters.
+    """
+
+    def setUp(self):
+        analysis.clear_memory()
+        self.listing = make_listings(1)[0]
+        self.history = self.listing.pricehistory_set.get()
+        analysis.stats.reset()
+        self.url = reverse('analyze-housing')
+
+    def post(self):
+        return APIClient().post(self.url, {'listing_id': self.listing.pk}, format='json')
+
+    def test_memory_hit_only_reads_the_listing(self):
+        analysis.store_analysis(self.listing, self.history, 'From DB.')
+        analysis.clear_memory()
+        self.assertEqual(self.post().data, {'analysis': 'From DB.', 'cached': True})
+        with self.assertNumQueries(1):
+            response = self.post()
+        self.assertEqual(response.data, {'analysis': 'From DB.', 'cached': True})
+        counters = APIClient().get(reverse('analysis-cache-stats')).data
+        self.assertEqual((counters['memory_hits'], counters['memory_misses'], counters['db_hits']), (1, 1, 1))
+
+    def test_price_history_change_misses_memory(self):
+        analysis.store_analysis(self.listing, self.history, 'Old.')
+        self.post()
+        with self.captureOnCommitCallbacks(execute=True):
+            PriceHistory.objects.create(listing=self.listing, price_values=[{'date': '2025-01-01', 'price': 1}])
+        self.listing.refresh_from_db()
+        self.assertIsNone(analysis.get_memory_analysis(self.listing))
+
+    def test_writes_by_another_worker_miss_memory(self):
+        # No signal runs in this process: only the stored updated_at moves, as after a
+        # save handled by another worker
+        with FakeOpenAIServer(reply='Before.'):
+            self.assertEqual(self.post().data['analysis'], 'Before.')
+        self.assertEqual(self.post().data, {'analysis': 'Before.', 'cached': True})
+        Listing.objects.filter(pk=self.listing.pk).update(
+            current_price=Decimal('1.00'), updated_at=timezone.now() + timedelta(seconds=1)
+        )
+        with FakeOpenAIServer(reply='After.') as server:
+            self.assertEqual(self.post().data, {'analysis': 'After.', 'cached': False})
+        self.assertEqual(server.calls, 1)
+
+    def test_memory_entries_expire_with_their_row(self):
+        analysis.store_analysis(self.listing, self.history, 'Aging.')
+        AnalysisCache.objects.update(timestamp=timezone.now() - timedelta(seconds=3590))
+        analysis.clear_memory()
+        with override_settings(ANALYSIS_CACHE_TTL=3600), mock.patch.object(analysis._memory(), 'set') as memory_set:
+            analysis.get_cached_analysis(self.listing, self.history)
+        self.assertLessEqual(memory_set.call_args.kwargs['timeout'], 10)
+        AnalysisCache.objects.update(timestamp=timezone.now() - timedelta(days=30))
+        with override_settings(ANALYSIS_CACHE_TTL=3600), mock.patch.object(analysis._memory(), 'set') as memory_set:
+            analysis.store_analysis(self.listing, self.history, 'Fresh.')
+        self.assertGreater(memory_set.call_args.kwargs['timeout'], 3500)
+
+    def test_lru_culls_are_counted_as_evictions(self):
+        small = {**settings.CACHES['analysis'], 'LOCATION': 'analysis-culls', 'OPTIONS': {'MAX_ENTRIES': 2, 'CULL_FREQUENCY': 2}}
+        with override_settings(CACHES={**settings.CACHES, 'analysis': small}):
+            analysis.clear_memory()
+            for listing in [self.listing] + make_listings(2):
+                analysis.store_analysis(listing, listing.pricehistory_set.first(), f'Analysis {listing.pk}.')
+            self.assertIsNone(analysis.get_memory_analysis(self.listing))  # the least recently used entry
+        self.assertEqual(analysis.stats.snapshot()['memory_evictions'], 1)
+
+    def test_expired_rows_are_misses_and_replaced(self):
+        analysis.store_analysis(self.listing, self.history, 'Stale.')
+        AnalysisCache.objects.update(timestamp=timezone.now() - timedelta(days=30))
+        with override_settings(ANALYSIS_CACHE_TTL=3600):
+            self.assertIsNone(analysis.get_cached_analysis(self.listing, self.history))
+            self.assertEqual(analysis.store_analysis(self.listing, self.history, 'Fresh.'), 'Fresh.')
+        self.assertEqual(AnalysisCache.objects.get().analysis_result, 'Fresh.')
+
+    def test_purge_removes_expired_and_oldest_rows(self):
+        listings = [self.listing] + make_listings(4, with_history=False)
+        for i, listing in enumerate(listings):
+            AnalysisCache.objects.create(listing=listing, prompt_hash=str(i), analysis_result=str(i))
+        AnalysisCache.objects.filter(listing=listings[0]).update(timestamp=timezone.now() - timedelta(days=30))
+        with override_settings(ANALYSIS_CACHE_TTL=3600):
+            deleted = analysis.purge_analysis_cache(max_rows=2)
+        self.assertEqual(deleted, 3)
+        self.assertEqual(sorted(AnalysisCache.objects.values_list('analysis_result', flat=True)), ['3', '4'])
+        self.assertEqual(analysis.stats.snapshot()['db_evictions'], 3)
+
+
+#----------------------------- Request profiling tests -----------------------------#
+
+
+@override_settings(REQUEST_PROFILING=True, REQUEST_PROFILING_SAMPLE_RATE=0)
+class RequestProfilingMiddlewareTests(TestCase):
+    """
+    RequestProfilingMiddleware reports per-request timings as Server-Timing and log lines.
+    """
+
+    def setUp(self):
+        response_cache.clear()
+        analysis.clear_memory()
+        self.listings = make_listings(3)
+
+    @staticmethod
+    def server_timing(response):
+        return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+    def test_list_view_reports_queries_and_serializer_time(self):
+        with self.assertLogs('listings.profiling', 'INFO') as logs, CaptureQueriesContext(connection) as queries:
+            response = APIClient().get(reverse('listing-list'))
+        timing = self.server_timing(response)
+        self.assertEqual(set(timing), {'app', 'db', 'serialize'})
+        self.assertIn(f'desc="{len(queries)} queries"', timing['db'])
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'request_profile')
+        self.assertEqual((record['path'], record['status']), (reverse('listing-list'), 200))
+        self.assertEqual(record['db_queries'], len(queries))
+        self.assertGreaterEqual(record['total_ms'], record['db_ms'])
+
+    def test_analysis_miss_reports_llm_time(self):
+        with FakeOpenAIServer(delay=0.2), self.assertLogs('listings.profiling', 'INFO') as logs:
+            response = APIClient().post(reverse('analyze-housing'), {'listing_id': self.listings[0].pk}, format='json')
+        self.assertIn('llm', self.server_timing(response))
+        self.assertGreaterEqual(json.loads(logs.records[0].getMessage())['llm_ms'], 200)
+
+    async def test_async_view_is_measured(self):
+        with FakeOpenAIServer(), self.assertLogs('listings.profiling', 'INFO') as logs:
+            response = await AsyncClient().post(
+                reverse('analyze-housing-async'), {'listing_id': self.listings[0].pk}, content_type='application/json'
+            )
+        timing = self.server_timing(response)
+        self.assertIn('llm', timing)
+        self.assertNotIn('desc="0 queries"', timing['db'])
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['event'], record['path'], record['status']),
+                         ('request_profile', reverse('analyze-housing-async'), 200))
+        self.assertGreater(record['db_queries'], 0)
+
+    def test_slow_sampled_request_dumps_profile(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with override_settings(REQUEST_PROFILING_SAMPLE_RATE=1, REQUEST_PROFILING_SLOW_MS=0, REQUEST_PROFILING_DIR=tmp), \
+                    self.assertLogs('listings.profiling', 'INFO') as logs:
+                APIClient().get(reverse('listing-detail', args=[self.listings[0].pk]))
+            record = json.loads(logs.records[0].getMessage())
+            self.assertTrue(record['slow'])
+            self.assertTrue(os.path.exists(record['profile']))
+            self.assertEqual(os.listdir(tmp), [os.path.basename(record['profile'])])
+
+    def test_disabled_and_other_paths_are_untouched(self):
+        with override_settings(REQUEST_PROFILING_PATH_PREFIX='/api/other/'):
+            self.assertNotIn('Server-Timing', APIClient().get(reverse('listing-list')))
+        with override_settings(REQUEST_PROFILING=False):
+            self.assertNotIn('Server-Timing', APIClient().get(reverse('listing-list')))
+
+
+#----------------------------- Management command tests -----------------------------#
+
+
+class PopulateListingsTests(TestCase):
+    """
+    populate_listings bulk-loads the hand-written samples or N synthetic listings.
+    """
+
+    def populate(self, **options):
+        out = StringIO()
+        call_command('populate_listings', stdout=out, **options)
+        return out.getvalue()
+
+    def test_sample_mode_loads_every_sample(self):
+        from .management.commands._sample_data import sample_listings
+
+        make_listings(2)
+        output = self.populate(seed=1)
+        self.assertEqual(Listing.objects.count(), len(sample_listings))
+        self.assertEqual(Listing.objects.order_by('id').first().id, 1)
+        self.assertEqual(PriceHistory.objects.count(), len(sample_listings))
+        self.assertTrue(PricePoint.objects.exists())
+        self.assertNotIn('Created listing:', output)
+        # Ids were reused, so the change feed restarts with a reset followed by the new listings
+        feed = APIClient().get(reverse('listing-changes'), {'since': 1}).data
+        self.assertTrue(feed['reset'])
+        self.assertEqual(len(feed['upserted']), len(sample_listings))
+        # Geocoded from the bundled gazetteer as they are written
+        self.assertFalse(Listing.objects.filter(latitude__isnull=True).exists())
+
+    def test_synthetic_mode_is_batched_and_reproducible(self):
+        self.populate(count=25, batch_size=7, seed=3)
+        first = list(Listing.objects.order_by('id').values_list('title', 'city', 'current_price'))
+        first_points = list(PricePoint.objects.order_by('id').values_list('price', flat=True))
+        self.populate(count=25, batch_size=10, seed=3)
+        self.assertEqual(list(Listing.objects.order_by('id').values_list('title', 'city', 'current_price')), first)
+        self.assertEqual(list(PricePoint.objects.order_by('id').values_list('price', flat=True)), first_points)
+        self.assertEqual(PriceHistory.objects.count(), 25)
+        self.assertEqual(PricePoint.objects.filter(listing__isnull=True).count(), 0)
+
+    def test_benchmark_search_rolls_back(self):
+        out = StringIO()
+        call_command('benchmark_search', rows=200, repeat=1, stdout=out)
+        self.assertIn('speedup', out.getvalue())
+        self.assertFalse(Listing.objects.exists())
+
+    def test_benchmark_api_writes_comparable_results(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = os.path.join(tmp, 'baseline.json')
+            call_command('benchmark_api', rows=30, iterations=3, warmup=1, output=baseline, stdout=StringIO())
+            with open(baseline) as f:
+                report = json.load(f)
+
+            out = StringIO()
+            call_command('benchmark_api', rows=30, iterations=2, warmup=0, cases='detail,analyze:memory_hit',
+                         compare=baseline, stdout=out)
+
+        self.assertEqual(report['metadata']['rows'], 30)
+        self.assertIn('analyze:stubbed_miss', report['results'])
+        for name, result in report['results'].items():
+            # search answers 404 when a filter matches nothing in a tiny dataset
+            expected = ({'304'} if name.endswith('not_modified') else {'200', '404'} if name.startswith('search')
+                        else {'201'} if name.startswith('write:per_row') else {'200'})
+            self.assertLessEqual(set(result['status_codes']), expected)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        self.assertEqual(report['results']['analyze:memory_hit']['queries_per_request'], 1)
+        self.assertIn('Comparison with', out.getvalue())
+        self.assertFalse(Listing.objects.exists())
+        self.assertFalse(AnalysisCache.objects.exists())
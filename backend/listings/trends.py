@@ -0,0 +1,191 @@
+import math
+
+import numpy as np
+from django.db.models import CharField, FloatField
+from django.db.models.functions import Cast
+
+from .models import Listing, PricePoint
+
+
+#----------------------------- Price trends -----------------------------#
+#
+# Deterministic price statistics of each listing's PricePoint series (all of its price
+# histories merged, in date order), answered without an OpenAI round trip:
+#   - percent_change: last price vs first price;
+#   - annualized_growth: the compound yearly rate between them (series spanning at least
+#     ANNUALIZE_MIN_DAYS, as shorter spans only extrapolate noise);
+#   - volatility: annualized standard deviation of the log returns between consecutive
+#     points, each scaled by the square root of its gap, so irregular series compare;
+#   - trend_slope_per_year: least-squares slope of price over time;
+#   - forecast: that line extended `horizon_days` past the last point.
+# compute_trends() works on many listings at once: points are sorted by (listing, date), so
+# every listing is a contiguous run and each statistic is one grouped reduction (reduceat /
+# bincount) over all runs. The whole catalogue is processed in keyset batches of listings
+# (iter_catalogue_trends, `python manage.py price_trends`).
+
+DAYS_PER_YEAR = 365.25
+ANNUALIZE_MIN_DAYS = 90
+MAX_HORIZON_DAYS = 3650
+
+
+def _rounded(values, digits=2):
+    # NaN (undefined for that listing) -> None
+    return [None if math.isnan(value) else value for value in np.round(values, digits).tolist()]
+
+
+def _iso_dates(days):
+    return np.datetime_as_string(days.astype('datetime64[D]')).tolist()
+
+
+def parse_horizon(raw, default):
+    """
+    Parse a `horizon_days` query parameter (1 to MAX_HORIZON_DAYS; `default` when empty).
+    Raises:
+        ValueError: If the value is not an integer in range.
+    """
+    try:
+        horizon = int(raw or default)
+        if not 1 <= horizon <= MAX_HORIZON_DAYS:
+            raise ValueError
+    except ValueError:
+        raise ValueError(f"Invalid value for 'horizon_days': {raw!r} (expected 1 to {MAX_HORIZON_DAYS})")
+    return horizon
+
+
+def compute_trends(listing_ids, days, prices, horizon_days):
+    """
+    Trend statistics of many price series at once.
+    Args:
+        listing_ids (np.ndarray): Listing id of each point, grouped (all points of a listing adjacent).
+        days (np.ndarray): Date of each point in days since 1970-01-01, ascending within each listing.
+        prices (np.ndarray): Price of each point.
+        horizon_days (int): How far past each listing's last point to forecast.
+    Returns:
+        dict[int, dict]: Trend per listing id (see empty_trend() for the keys); statistics that
+                         a series is too short for are None.
+    Example:
+        >>> compute_trends(np.array([7, 7]), np.array([19723, 20089]), np.array([400000.0, 420000.0]), 365)
+        {7: {"points": 2, "first_date": "2024-01-01", ..., "percent_change": 5.0, "annualized_growth": 5.0, ...}}
+    """
+    if len(listing_ids) == 0:
+        return {}
+    listing_ids = np.asarray(listing_ids)
+    days = np.asarray(days, dtype=np.int64)
+    prices = np.asarray(prices, dtype=float)
+
+    starts = np.flatnonzero(np.concatenate(([True], listing_ids[1:] != listing_ids[:-1])))
+    counts = np.diff(np.append(starts, len(listing_ids)))
+    ends = starts + counts - 1
+    first_day, last_day = days[starts], days[ends]
+    first_price, last_price = prices[starts], prices[ends]
+    span = (last_day - first_day).astype(float)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        ratio = np.where(first_price > 0, last_price / first_price, np.nan)
+        percent_change = (ratio - 1) * 100
+        annualizable = (span >= ANNUALIZE_MIN_DAYS) & (ratio > 0)
+        annualized_growth = np.where(
+            annualizable, (np.power(ratio, DAYS_PER_YEAR / np.where(annualizable, span, 1)) - 1) * 100, np.nan
+        )
+
+        # Least squares over x = days since the listing's first point
+        x = (days - np.repeat(first_day, counts)).astype(float)
+        sum_x, sum_y = np.add.reduceat(x, starts), np.add.reduceat(prices, starts)
+        sum_xx, sum_xy = np.add.reduceat(x * x, starts), np.add.reduceat(x * prices, starts)
+        denominator = counts * sum_xx - sum_x ** 2  # 0 when every point has the same date
+        slope = np.where(denominator > 0, (counts * sum_xy - sum_x * sum_y) / denominator, np.nan)
+        intercept = (sum_y - slope * sum_x) / counts
+        forecast = intercept + slope * (span + horizon_days)
+
+        # Consecutive points of the same listing, on different dates, both priced
+        group = np.repeat(np.arange(len(starts)), counts)
+        gaps = np.diff(days)
+        steps = (group[1:] == group[:-1]) & (gaps > 0) & (prices[1:] > 0) & (prices[:-1] > 0)
+        returns = np.log(prices[1:][steps] / prices[:-1][steps]) / np.sqrt(gaps[steps] / DAYS_PER_YEAR)
+        step_group = group[1:][steps]
+        n = np.bincount(step_group, minlength=len(starts)).astype(float)
+        total = np.bincount(step_group, weights=returns, minlength=len(starts))
+        total_sq = np.bincount(step_group, weights=returns ** 2, minlength=len(starts))
+        variance = np.where(n > 1, (total_sq - total ** 2 / np.where(n > 0, n, 1)) / (n - 1), np.nan)
+        volatility = np.sqrt(np.maximum(variance, 0)) * 100
+
+    trends = {}
+    for (listing_id, points, first, last, first_value, last_value, change, growth, vol,
+         per_year, predicted, predicted_day) in zip(
+        listing_ids[starts].tolist(), counts.tolist(), _iso_dates(first_day), _iso_dates(last_day),
+        _rounded(first_price), _rounded(last_price), _rounded(percent_change), _rounded(annualized_growth),
+        _rounded(volatility), _rounded(slope * DAYS_PER_YEAR), _rounded(forecast), _iso_dates(last_day + horizon_days),
+    ):
+        trends[listing_id] = {
+            'points': points,
+            'first_date': first,
+            'last_date': last,
+            'first_price': first_value,
+            'last_price': last_value,
+            'percent_change': change,
+            'annualized_growth': growth,
+            'volatility': vol,
+            'trend_slope_per_year': per_year,
+            'forecast': None if predicted is None else {
+                'date': predicted_day, 'price': predicted,
+            },
+        }
+    return trends
+
+
+def empty_trend():
+    """The trend of a listing without price points."""
+    return {
+        'points': 0, 'first_date': None, 'last_date': None, 'first_price': None, 'last_price': None,
+        'percent_change': None, 'annualized_growth': None, 'volatility': None,
+        'trend_slope_per_year': None, 'forecast': None,
+    }
+
+
+def _point_arrays(points):
+    # Dates as ISO text and prices as floats skip the per-row date and Decimal converters;
+    # numpy parses the dates in one call
+    rows = list(points.order_by('listing_id', 'date', 'id').values_list(
+        'listing_id', Cast('date', CharField()), Cast('price', FloatField())
+    ))
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    listing_ids, dates, prices = zip(*rows)
+    return (np.array(listing_ids, dtype=np.int64),
+            np.array(dates, dtype='datetime64[D]').astype(np.int64),
+            np.array(prices, dtype=float))
+
+
+def listing_trends(listing_ids, horizon_days):
+    """
+    Trends of the given listings, from one query over their price points.
+    Args:
+        listing_ids (Iterable[int]): Ids of existing listings.
+        horizon_days (int): Forecast horizon.
+    Returns:
+        dict[int, dict]: Trend per listing id; listings without points get empty_trend().
+    """
+    listing_ids = list(listing_ids)
+    trends = compute_trends(*_point_arrays(PricePoint.objects.filter(listing_id__in=listing_ids)), horizon_days)
+    return {pk: trends.get(pk) or empty_trend() for pk in listing_ids}
+
+
+def iter_catalogue_trends(horizon_days, batch_size=10_000):
+    """
+    Trends of every listing, in id order: one query for each batch of listing ids and one
+    for their points (an index range scan on (listing, date)).
+    Yields:
+        tuple[int, dict]: (listing id, trend).
+    """
+    last_id = 0
+    while True:
+        ids = list(Listing.objects.filter(pk__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        points = PricePoint.objects.filter(listing_id__gt=last_id, listing_id__lte=ids[-1])
+        trends = compute_trends(*_point_arrays(points), horizon_days)
+        for pk in ids:
+            yield pk, trends.get(pk) or empty_trend()
+        if len(ids) < batch_size:
+            return
+        last_id = ids[-1]
@@ -1,14 +1,33 @@
 from django.urls import path
-from .views import ListingListView, ListingCreateView, ListingUpdateView, ListingDeleteView, ListingDetailView, search_listings, OpenAIProxyAPIView
+from .views import ListingListView, ListingCreateView, ListingUpdateView, ListingDeleteView, ListingDetailView, search_listings, text_search_listings, listing_comparables, market_stats_view, OpenAIProxyAPIView, AsyncOpenAIProxyView, analysis_cache_stats_view, listing_cache_stats_view, export_listings, bulk_upsert_listings, bulk_delete_listings, listing_changes, listings_within, listing_clusters, listing_cluster_tile, listing_trend, listing_trends_batch
 
 urlpatterns = [
     path('', ListingListView.as_view(), name='listing-list'),
     path('<int:pk>/', ListingDetailView.as_view(), name='listing-detail'),
+    path('<int:pk>/comparables/', listing_comparables, name='listing-comparables'),
+    path('<int:pk>/trend/', listing_trend, name='listing-trend'),
+# Format: /api/listings/trends/?ids=1,2,3
+    path('trends/', listing_trends_batch, name='listing-trends'),
+    path('stats/', market_stats_view, name='market-stats'),
+    path('export/', export_listings, name='listing-export'),
+    path('changes/', listing_changes, name='listing-changes'),
+# Format: /api/listings/within/?bbox=west,south,east,north or ?lat=43.65&lng=-79.38&radius_km=5
+    path('within/', listings_within, name='listing-within'),
+# Format: /api/listings/clusters/?zoom=11&bbox=west,south,east,north or /api/listings/clusters/<zoom>/<x>/<y>/
+    path('clusters/', listing_clusters, name='listing-clusters'),
+    path('clusters/<int:z>/<int:x>/<int:y>/', listing_cluster_tile, name='listing-cluster-tile'),
+    path('cache/stats/', listing_cache_stats_view, name='listing-cache-stats'),
     path('create/', ListingCreateView.as_view(), name='listing-create'),
     path('<int:pk>/update/', ListingUpdateView.as_view(), name='listing-update'),
     path('<int:pk>/delete/', ListingDeleteView.as_view(), name='listing-delete'),
+    path('bulk/', bulk_upsert_listings, name='listing-bulk-upsert'),
+    path('bulk/delete/', bulk_delete_listings, name='listing-bulk-delete'),
 
 # Format: /api/listings/search/?city=CityName. For example, /api/listings/search/?city=Halifax
     path('search/', search_listings, name='listing-search'),
+# Format: /api/listings/search/text/?q=waterfront
+    path('search/text/', text_search_listings, name='listing-text-search'),
     path('analyze-housing/', OpenAIProxyAPIView.as_view(), name='analyze-housing'),
+    path('analyze-housing/async/', AsyncOpenAIProxyView.as_view(), name='analyze-housing-async'),
+    path('analyze-housing/stats/', analysis_cache_stats_view, name='analysis-cache-stats'),
 ]
\ No newline at end of file
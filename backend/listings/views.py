@@ -1,28 +1,61 @@
+import json
+import logging
 import os
 from django.conf import settings  # Add this import
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
 from rest_framework import generics, status
 from rest_framework.decorators import api_view
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from .models import AnalysisCache
-from .models import Listing
-from .serializer import ListingSerializer
-from openai import OpenAI
+from . import bulk, changes, clusters, comparables, export, geo, market, response_cache, trends
+from .conditional import collection_validators, conditional_get, listing_query_validators, listing_validators
+from .models import Listing, MarketStats
+from .filters import SEARCH_FILTERS, parse_search_filters
+from .pagination import ListingCursorPagination, ListingSearchPagination
+from .renderers import EventStreamRenderer
+from .search import ListingTextSearch, search_terms
+from .serializer import (
+    LISTING_ROW_FIELDS, BulkDeleteSerializer, ListingSerializer, MarketStatsSerializer, serialize_listing_rows,
+)
+from .analysis import (
+    aanalyze, aget_cached_analysis, aget_memory_analysis, analyze, generate_prompt,
+    get_cached_analysis, get_memory_analysis, stats as analysis_cache_stats, stream_analysis_events,
+)
 
+logger = logging.getLogger(__name__)
+
+# Query parameters that select a page of a listing collection (part of response cache keys)
+PAGE_PARAMS = (ListingCursorPagination.cursor_query_param, ListingCursorPagination.page_size_query_param)
 
 
 #----------------------------- API Views for Listings -----------------------------#
 
 
 # List all listings (GET only)
+@method_decorator([
+    conditional_get(collection_validators),
+    response_cache.cached_listing_response('list', PAGE_PARAMS),
+], name='get')
 class ListingListView(generics.ListAPIView):
     """
-    API view for listing all housing listings (GET requests only).
-    Frontend can call: GET /api/listings/
+    API view for listing all housing listings (GET requests only), one cursor page at a time.
+    Frontend can call: GET /api/listings/ (then follow the `next` link for further pages)
+    Responses carry an ETag; repeat polls with If-None-Match get 304 until a listing changes.
+    Rendered pages are cached until the next listing write (see listings/response_cache.py).
     """
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.values(*LISTING_ROW_FIELDS)
     serializer_class = ListingSerializer
 
+    def list(self, request, *args, **kwargs):
+        # Rows as dicts through the fast path; the output matches ListingSerializer byte for byte
+        page = self.paginate_queryset(self.get_queryset())
+        return self.get_paginated_response(serialize_listing_rows(page))
+
 # Create new listing (POST only)
 class ListingCreateView(generics.CreateAPIView):
     """
@@ -50,30 +83,227 @@ class ListingDeleteView(generics.DestroyAPIView):
     queryset = Listing.objects.all()
     serializer_class = ListingSerializer
 
+@api_view(['POST'])
+def bulk_upsert_listings(request):
+    """
+    Create or update many listings in one request and one transaction (see listings/bulk.py).
+    Items with an `external_id` that already exists update that listing; all others are created.
+    Invalid items are reported and skipped, the valid ones are still written.
+    Frontend/ingestion can call: POST /api/listings/bulk/
+    Request Body:
+        A JSON array (at most LISTINGS_BULK_MAX_ITEMS) of listings with all fields required by
+        POST /api/listings/create/, plus optional "external_id" and "price_values"
+        ([{"date": "YYYY-MM-DD", "price": 450000}, ...], recorded as a new price history).
+    Returns:
+        Response: {"created": 2, "updated": 1, "failed": 1, "results": [
+                      {"index": 0, "status": "created", "id": 7, "external_id": "feed-1"}, ...,
+                      {"index": 3, "status": "invalid", "errors": {"current_price": ["A valid number is required."]}}]}
+    """
+    items = request.data
+    if not isinstance(items, list):
+        return Response({"error": "Expected a JSON array of listings."}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > settings.LISTINGS_BULK_MAX_ITEMS:
+        return Response(
+            {"error": f"At most {settings.LISTINGS_BULK_MAX_ITEMS} listings per request, got {len(items)}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    validated = bulk.validate_items(items)
+    valid = [(index, data) for index, (data, errors) in enumerate(validated) if errors is None]
+    written = dict(zip([index for index, _ in valid], bulk.upsert_listings([data for _, data in valid]))) if valid else {}
+
+    results = []
+    for index, (_, errors) in enumerate(validated):
+        if errors is not None:
+            results.append({"index": index, "status": "invalid", "errors": errors})
+        else:
+            outcome, listing = written[index]
+            results.append({"index": index, "status": outcome, "id": listing.pk, "external_id": listing.external_id})
+    counts = {outcome: sum(result['status'] == outcome for result in results) for outcome in ('created', 'updated')}
+    return Response({**counts, "failed": len(items) - len(valid), "results": results})
+
+
+@api_view(['POST'])
+def bulk_delete_listings(request):
+    """
+    Delete many listings in one request and one transaction.
+    Frontend/ingestion can call: POST /api/listings/bulk/delete/
+    Request Body:
+        {"ids": [1, 2], "external_ids": ["feed-7"]} (either list may be omitted)
+    Returns:
+        Response: {"deleted": 2, "results": [{"id": 1, "status": "deleted"}, {"external_id": "feed-7", "status": "not_found"}, ...]}
+    """
+    serializer = BulkDeleteSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response({"error": serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
+    ids, external_ids = serializer.validated_data['ids'], serializer.validated_data['external_ids']
+    if len(ids) + len(external_ids) > settings.LISTINGS_BULK_MAX_ITEMS:
+        return Response(
+            {"error": f"At most {settings.LISTINGS_BULK_MAX_ITEMS} listings per request."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+
+    deleted_ids, deleted_keys = bulk.delete_listings(ids, external_ids)
+    results = [{"id": pk, "status": "deleted" if pk in deleted_ids else "not_found"} for pk in ids]
+    results += [{"external_id": key, "status": "deleted" if key in deleted_keys else "not_found"} for key in external_ids]
+    return Response({"deleted": len(deleted_ids), "results": results})
+
+@method_decorator(conditional_get(listing_validators), name='get')
 class ListingDetailView(generics.RetrieveAPIView):
     """
     API view for retrieving a single listing by its ID (GET requests only).
     Frontend can call: GET /api/listings/1/
+    Responses carry an ETag and Last-Modified; conditional requests get 304 until the listing changes.
     """
-    queryset = Listing.objects.all()
+    queryset = Listing.objects.with_price_histories()
     serializer_class = ListingSerializer
 
 
+@api_view(['GET'])
+def listing_comparables(request, pk):
+    """
+    Find the listings most similar to listing `pk` by price, bedrooms, bathrooms, square feet and location.
+    Frontend can call: GET /api/listings/1/comparables/?k=5
+    Query Parameters:
+        k (int, optional): Number of comparables (default COMPARABLES_DEFAULT_K, capped at COMPARABLES_MAX_K).
+        same_city (bool, optional): Only return listings in the same city.
+    Returns:
+        Response: {"listing_id": 1, "comparables": [...]} with serialized listings, closest first,
+                  each with a "distance" (0 = identical price, rooms, size and city).
+    """
+    try:
+        listing = Listing.objects.get(pk=pk)
+    except Listing.DoesNotExist:
+        return Response({"error": f"Listing with id {pk} not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        k = int(request.GET.get('k', settings.COMPARABLES_DEFAULT_K))
+        if k < 1:
+            raise ValueError
+    except ValueError:
+        return Response({"error": f"Invalid value for 'k': {request.GET.get('k')!r}"}, status=status.HTTP_400_BAD_REQUEST)
+    same_city = request.GET.get('same_city', '').lower() in ('1', 'true', 'yes')
+
+    # One vectorized distance computation over the in-memory feature matrix (see listings/comparables.py)
+    nearest = comparables.index.nearest(listing, k=min(k, settings.COMPARABLES_MAX_K), same_city=same_city)
+    found = Listing.objects.with_price_histories().in_bulk([pk for pk, _ in nearest])
+    ranked = [(found[pk], distance) for pk, distance in nearest if pk in found]
+
+    data = ListingSerializer([comparable for comparable, _ in ranked], many=True).data
+    for item, (_, distance) in zip(data, ranked):
+        item['distance'] = round(distance, 4)
+    return Response({"listing_id": listing.pk, "comparables": data})
+
+
+@api_view(['GET'])
+@conditional_get(listing_query_validators)  # price histories bump the listing's updated_at; one ETag per horizon
+def listing_trend(request, pk):
+    """
+    Return price trend statistics of listing `pk`, computed from its price points without an
+    OpenAI call (see listings/trends.py).
+    Frontend can call: GET /api/listings/1/trend/?horizon_days=180
+    Query Parameters:
+        horizon_days (int, optional): Forecast horizon (default LISTINGS_TREND_FORECAST_DAYS, at most 3650).
+    Returns:
+        Response: {"listing_id": 1, "points": 6, "first_date", "last_date", "first_price", "last_price",
+                   "percent_change", "annualized_growth", "volatility", "trend_slope_per_year",
+                   "forecast": {"date", "price"}}; statistics the history is too short for are null.
+    """
+    try:
+        horizon = trends.parse_horizon(request.GET.get('horizon_days'), settings.LISTINGS_TREND_FORECAST_DAYS)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    if not Listing.objects.filter(pk=pk).exists():
+        return Response({"error": f"Listing with id {pk} not found."}, status=status.HTTP_404_NOT_FOUND)
+    return Response({"listing_id": pk, **trends.listing_trends([pk], horizon)[pk]})
+
+
+@api_view(['GET'])
+@conditional_get(collection_validators)
+def listing_trends_batch(request):
+    """
+    Return the price trends of many listings from one query over their price points.
+    Frontend can call: GET /api/listings/trends/?ids=1,2,3
+    Query Parameters:
+        ids (str): Comma-separated listing ids (at most LISTINGS_TREND_MAX_IDS).
+        horizon_days (int, optional): As for /api/listings/<pk>/trend/.
+    Returns:
+        Response: {"count": 2, "results": [{"listing_id": 1, ...same keys as /trend/}, ...],
+                   "not_found": [3]}, in the order requested.
+    """
+    raw = request.GET.get('ids', '')
+    try:
+        ids = list(dict.fromkeys(int(value) for value in raw.split(',') if value.strip()))
+        if not ids:
+            raise ValueError
+    except ValueError:
+        return Response({"error": f"Invalid value for 'ids': {raw!r} (expected comma-separated listing ids)"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > settings.LISTINGS_TREND_MAX_IDS:
+        return Response({"error": f"At most {settings.LISTINGS_TREND_MAX_IDS} ids per request."},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        horizon = trends.parse_horizon(request.GET.get('horizon_days'), settings.LISTINGS_TREND_FORECAST_DAYS)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    found = set(Listing.objects.filter(pk__in=ids).values_list('id', flat=True))
+    computed = trends.listing_trends([pk for pk in ids if pk in found], horizon)
+    results = [{"listing_id": pk, **trend} for pk, trend in computed.items()]
+    return Response({"count": len(results), "results": results, "not_found": [pk for pk in ids if pk not in found]})
+
+
+@api_view(['GET'])
+def market_stats_view(request):
+    """
+    Return precomputed market statistics per city, read from the MarketStats table
+    (see listings/market.py), so the cost does not grow with the number of listings.
+    Markets marked stale by writes since the last read are recomputed first, in one batch.
+    Frontend can call: GET /api/listings/stats/?province=BC
+    Query Parameters:
+        city (str, optional): City name (case-insensitive).
+        province (str, optional): Province code (case-insensitive), e.g. "BC".
+    Returns:
+        Response: {"results": [{"city", "province", "listing_count", "median_price", "average_price",
+                   "median_price_per_sqft", "average_bedrooms", "average_bathrooms",
+                   "price_change_1y", "trend_sample_size", "updated_at"}, ...]}
+    """
+    market.refresh_stale_markets()
+    markets = MarketStats.objects.all()
+    if request.GET.get('city'):
+        markets = markets.filter(city__iexact=request.GET['city'])
+    if request.GET.get('province'):
+        markets = markets.filter(province__iexact=request.GET['province'])
+    return Response({"results": MarketStatsSerializer(markets, many=True).data})
+
+
 #----------------------------- Custom Search API View -----------------------------#
 
 
 # Custom API view for filtering listings
 @api_view(['GET'])  # This decorator specifies that this view only accepts GET requests
+@conditional_get(collection_validators)  # 304 for unchanged results (see listings/conditional.py)
+@response_cache.cached_listing_response('search', (*SEARCH_FILTERS, *PAGE_PARAMS))
 def search_listings(request):
     """
-    Handles GET requests to search for listings, optionally filtering by city.
+    Handles GET requests to search for listings, filtering by any combination of the parameters below.
     Query Parameters:
         city (str, optional): The city name to filter listings by. Performs a case-insensitive search.
+        city_exact (str, optional): Exact city name (index-backed, case-sensitive).
+        province (str, optional): Exact province code, e.g. "BC".
+        min_price / max_price (decimal, optional): Inclusive range on current_price.
+        min_bedrooms / min_bathrooms (int, optional): Minimum number of bedrooms / bathrooms.
+        min_sqft / max_sqft (int, optional): Inclusive range on square_feet.
+        cursor (str, optional): Pagination cursor from a previous response's `next`/`previous` link.
+        page_size (int, optional): Listings per page (capped, see ListingCursorPagination).
     Returns:
-        Response: A JSON response containing a list of serialized listings matching the search criteria.
+        Response: A JSON response containing one page of serialized listings matching the search criteria.
     
     The response will look like this if listings are found:
-    [
+    {
+      "next": "http://.../api/listings/search/?city=Springfield&cursor=cD0y",
+      "previous": null,
+      "results": [
         {
             "id": 1,
             "title": "Beautiful Family Home",
@@ -101,30 +331,255 @@ def search_listings(request):
             "image_url": "https://example.com/apartment-image.jpg"
         }
         ...
-    ]    
+      ]
+    }
     """
-    city = request.GET.get('city')  # Get the 'city' parameter from the query string, if provided
+    try:
+        filters = parse_search_filters(request.GET)  # Translate the query string into ORM lookups
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-    listings = Listing.objects.all()  # Start with all Listing objects in the database
+    # Apply every provided filter in a single WHERE clause (listings/filters.py lists which ones are index-backed)
+    listings = Listing.objects.filter(**filters).values(*LISTING_ROW_FIELDS)
 
-    if city:
-        # If a city was provided, filter listings where the city field contains the search term (case insensitive)
-        listings = listings.filter(city__icontains=city)
+    paginator = ListingCursorPagination()
+    page = paginator.paginate_queryset(listings, request)  # Only the rows of the requested page are fetched
 
-    serializer = ListingSerializer(listings, many=True)  # Serialize the queryset to JSON format
+    data = serialize_listing_rows(page)  # Same JSON as ListingSerializer, price histories in two queries
     # Return appropriate responses based on different scenarios
-    if listings.exists():
-        return Response(serializer.data, status=status.HTTP_200_OK)  # Return the serialized data as an HTTP response
+    if data:
+        return paginator.get_paginated_response(data)  # Return the page along with next/previous links
     else:
         return Response(
             {"message": "No listings found matching the search criteria."}, 
             status=status.HTTP_404_NOT_FOUND
         )
 
+@api_view(['GET'])
+def text_search_listings(request):
+    """
+    Full-text search over listing title, street address, city and description, best match first.
+    Backed by SQLite FTS5 or a Postgres GIN tsvector index (see listings/search.py).
+    Query Parameters:
+        q (str): Free text, e.g. "finished basement". Every word must match; words are stemmed,
+                 so "basements" also finds "basement".
+        page (int, optional): 1-based page number.
+        page_size (int, optional): Listings per page (capped, see ListingSearchPagination).
+    Returns:
+        Response: {"count", "next", "previous", "results"} where each result is a serialized
+                  listing plus its "search_rank" (higher is more relevant).
+    """
+    query = request.GET.get('q', '')
+    if not search_terms(query):
+        return Response({"error": "q is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    paginator = ListingSearchPagination()
+    page = paginator.paginate_queryset(ListingTextSearch(query), request)  # One ranked query for the page's ids
+
+    data = ListingSerializer(page, many=True).data
+    if not data:
+        return Response(
+            {"message": "No listings found matching the search criteria."},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    for item, listing in zip(data, page):
+        item['search_rank'] = None if listing.search_rank is None else round(listing.search_rank, 4)
+    return paginator.get_paginated_response(data)
+
+
+#----------------------------- Change Feed View -----------------------------#
+
+
+@api_view(['GET'])
+@conditional_get(collection_validators)  # polls with nothing new get 304 (see listings/conditional.py)
+def listing_changes(request):
+    """
+    Return the listings created, modified or deleted since a token, so clients can keep a
+    local copy in sync without downloading the catalogue again (see listings/changes.py).
+    Frontend can call: GET /api/listings/changes/?since=1042
+    Query Parameters:
+        since (str, optional): The `next` token of the previous response; omit for a full initial sync.
+        limit (int, optional): Maximum changes per response (capped at LISTINGS_CHANGES_PAGE_SIZE).
+    Returns:
+        Response: {"next": "1100", "has_more": false, "reset": false,
+                   "upserted": [listings shaped like /api/listings/ results], "deleted": [17, 23]}
+        When "reset" is true the catalogue was rebuilt: drop the local copy before applying.
+        While "has_more" is true, request again with the new token right away.
+    """
+    try:
+        since = int(request.GET.get('since') or 0)
+        if since < 0:
+            raise ValueError
+    except ValueError:
+        return Response({"error": f"Invalid value for 'since': {request.GET.get('since')!r}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        limit = min(int(request.GET.get('limit') or settings.LISTINGS_CHANGES_PAGE_SIZE), settings.LISTINGS_CHANGES_PAGE_SIZE)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return Response({"error": f"Invalid value for 'limit': {request.GET.get('limit')!r}"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(changes.changes_since(since, limit))
+
+
+#----------------------------- Geo Search View -----------------------------#
+
+
+@api_view(['GET'])
+@conditional_get(collection_validators)  # unchanged views of the map get 304 (see listings/conditional.py)
+def listings_within(request):
+    """
+    Return compact map markers for the listings inside a bounding box or within a radius,
+    served by the spatial index (see listings/geo.py). Accepts the /api/listings/search/ filters.
+    Frontend can call: GET /api/listings/within/?bbox=-79.5,43.6,-79.3,43.7
+                   or: GET /api/listings/within/?lat=43.65&lng=-79.38&radius_km=5
+    Query Parameters:
+        bbox (str): west,south,east,north in degrees (Leaflet's map.getBounds().toBBoxString()).
+        lat / lng / radius_km (float): A radius search instead of a box, nearest listings first.
+        limit (int, optional): Maximum markers (capped at LISTINGS_GEO_MAX_RESULTS).
+    Returns:
+        Response: {"count": 2, "truncated": false,
+                   "results": [{"id", "lat", "lng", "price", "bedrooms", "bathrooms", "title"}, ...]}
+        Radius results also carry "distance_km". "truncated" is true when more listings
+        match than were returned (zoom in, or add filters).
+    """
+    try:
+        limit = min(int(request.GET.get('limit') or settings.LISTINGS_GEO_MAX_RESULTS), settings.LISTINGS_GEO_MAX_RESULTS)
+        if limit < 1:
+            raise ValueError
+    except ValueError:
+        return Response({"error": f"Invalid value for 'limit': {request.GET.get('limit')!r}"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = parse_search_filters(request.GET)
+        if request.GET.get('bbox'):
+            bbox, radius = geo.parse_bbox(request.GET['bbox']), None
+        elif any(request.GET.get(name) for name in ('lat', 'lng', 'radius_km')):
+            radius = geo.parse_radius(request.GET, settings.LISTINGS_GEO_MAX_RADIUS_KM)
+        else:
+            raise ValueError("Provide 'bbox', or 'lat', 'lng' and 'radius_km'.")
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    listings = Listing.objects.filter(**filters)
+    if radius is None:
+        results, truncated = geo.listings_in_bbox(*bbox, limit=limit, listings=listings)
+    else:
+        results, truncated = geo.listings_within_radius(*radius, limit=limit, listings=listings)
+    return Response({"count": len(results), "truncated": truncated, "results": results})
+
+
+#----------------------------- Map Cluster Views -----------------------------#
+
+
+def _cluster_response(zoom, tiles):
+    token = changes.latest_token()
+    by_tile = clusters.tile_clusters(tiles, zoom, token)
+    results = [cluster for tile in tiles for cluster in by_tile[tile]]
+    return Response({
+        "zoom": zoom, "tiles": len(tiles), "count": sum(cluster['count'] for cluster in results), "clusters": results,
+    })
+
+
+@api_view(['GET'])
+@conditional_get(collection_validators)
+def listing_cluster_tile(request, z, x, y):
+    """
+    Return the listing clusters of one web-map tile (see listings/clusters.py): the tile is
+    split into an 8 x 8 grid and each non-empty cell is one cluster.
+    Frontend can call: GET /api/listings/clusters/10/286/373/
+    Returns:
+        Response: {"zoom": 10, "tiles": 1, "count": 812,
+                   "clusters": [{"lat", "lng", "count", "price_min", "price_median", "price_max"}, ...]}
+        A cluster of a single listing also carries its "id".
+    """
+    try:
+        zoom = clusters.parse_zoom(z)
+        if not (x < 2 ** zoom and y < 2 ** zoom):
+            raise ValueError(f"Tile {x}/{y} does not exist at zoom {zoom}.")
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return _cluster_response(zoom, [(x, y)])
+
+
+@api_view(['GET'])
+@conditional_get(collection_validators)
+def listing_clusters(request):
+    """
+    Return the listing clusters of every tile covering a map viewport, from the same
+    per-tile cache as listing_cluster_tile.
+    Frontend can call: GET /api/listings/clusters/?zoom=11&bbox=-79.6,43.5,-79.1,43.9
+    Query Parameters:
+        zoom (int): The map's zoom level (0 to 21).
+        bbox (str): west,south,east,north in degrees (Leaflet's map.getBounds().toBBoxString()).
+    Returns:
+        Response: Same shape as listing_cluster_tile; "tiles" is the number of tiles covered
+        (at most LISTINGS_CLUSTER_MAX_TILES).
+    """
+    try:
+        zoom = clusters.parse_zoom(request.GET.get('zoom'))
+        tiles = clusters.tiles_in_bbox(*geo.parse_bbox(request.GET.get('bbox') or ''), zoom)
+        if len(tiles) > settings.LISTINGS_CLUSTER_MAX_TILES:
+            raise ValueError(
+                f"The box covers {len(tiles)} tiles at zoom {zoom} (at most {settings.LISTINGS_CLUSTER_MAX_TILES}); zoom in."
+            )
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return _cluster_response(zoom, tiles)
+
+
+#----------------------------- Catalogue Export View -----------------------------#
+
+
+@require_GET
+def export_listings(request):
+    """
+    Stream every listing with its price histories, in id order, in constant memory
+    (see listings/export.py). Accepts the /api/listings/search/ filters to export a subset.
+    Partners can call: GET /api/listings/export/?format=ndjson&gzip=true
+    Query Parameters:
+        format (str, optional): "json" (default) for one JSON array, or "ndjson" for one listing per line.
+        gzip (bool, optional): Compress on the fly and send `Content-Encoding: gzip`.
+        city, province, min_price, ... (optional): Same filters as /api/listings/search/.
+    Returns:
+        StreamingHttpResponse: Listings shaped exactly like the list endpoint's results,
+                               or a JSON {"error": ...} with status 400 for invalid parameters.
+    """
+    export_format = request.GET.get('format', 'json').lower()
+    if export_format not in export.EXPORT_FORMATS:
+        return JsonResponse(
+            {"error": f"Invalid value for 'format': {export_format!r} (expected one of: {', '.join(export.EXPORT_FORMATS)})"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    try:
+        filters = parse_search_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    compress = request.GET.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    content_type, extension = export.EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(
+        export.export_stream(Listing.objects.filter(**filters), export_format, compress),
+        content_type=content_type,
+    )
+    response['Content-Disposition'] = f'attachment; filename="listings.{extension}"'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    response['X-Accel-Buffering'] = 'no'  # Let proxies pass chunks through instead of buffering the dump
+    return response
+
+
 class OpenAIProxyAPIView(APIView):
+    """
+    API view generating an AI analysis for a listing (POST requests only).
+    Frontend can call: POST /api/listings/analyze-housing/ with {"listing_id": 1}
+    Send {"listing_id": 1, "stream": true} (or `Accept: text/event-stream`) to receive
+    the analysis as server-sent events while OpenAI generates it
+    (see listings.analysis.stream_analysis_events for the event format).
+    """
+    renderer_classes = [JSONRenderer, EventStreamRenderer]
+
     def post(self, request):
-        # Debug: Print request data
-        print(f"DEBUG: Request data: {request.data}")
+        logger.debug("Request data: %s", request.data)
         
         listing_id = request.data.get('listing_id')
         
@@ -134,74 +589,139 @@ class OpenAIProxyAPIView(APIView):
         
         try:
             listing = Listing.objects.get(id=listing_id)
-        except Listing.DoesNotExist:
+        except (Listing.DoesNotExist, ValueError):
             return Response({"error": f"Listing with id {listing_id} not found."}, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check if OpenAI API key is available
-        if not settings.OPENAI_API_KEY:
-            return Response({"error": "OpenAI API key not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        
-        # Get the latest price history for the listing (if any)
-        price_history = listing.pricehistory_set.order_by('-date_recorded').first()
-        
-        # Check cache
-        cached = AnalysisCache.objects.filter(listing=listing, price_history=price_history).first()
-        if cached:
-            return Response({"analysis": cached.analysis_result, "cached": True})
-        
-        # Generate prompt using listing and price_history
-        prompt = self._generate_prompt(listing, price_history)
-        
-        # Call OpenAI - Updated to use Django settings
-        try:
-            # Use settings.OPENAI_API_KEY instead of os.getenv directly
-            client = OpenAI(api_key=settings.OPENAI_API_KEY)
-            response = client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
-                    {"role": "system", "content": "You are a real estate market analyst."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=256,
-                temperature=0.7,
-            )
-            analysis = response.choices[0].message.content.strip()
+
+        # Memory tier, keyed by the listing's updated_at: a hit costs no further query
+        cached = get_memory_analysis(listing)
+        price_history = None
+
+        if cached is None:
+            # Check if OpenAI API key is available
+            if not settings.OPENAI_API_KEY:
+                return Response({"error": "OpenAI API key not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            
+            # Get the latest price history for the listing (if any)
+            price_history = listing.pricehistory_set.order_by('-date_recorded').first()
             
-            # Cache the result
-            AnalysisCache.objects.create(
-                listing=listing,
-                price_history=price_history,
-                analysis_result=analysis
+            # Check the AnalysisCache table
+            cached = get_cached_analysis(listing, price_history)
+
+        # Streaming mode: relay tokens as they arrive (cache hits are a single event)
+        if self._wants_stream(request):
+            response = StreamingHttpResponse(
+                stream_analysis_events(listing, price_history, cached),
+                content_type='text/event-stream',
             )
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'  # Stop proxies such as nginx from buffering the stream
+            return response
+
+        if cached is not None:
+            return Response({"analysis": cached, "cached": True})
+        
+        # Cache miss: generate the analysis. Concurrent requests for the same listing and
+        # price history share a single upstream OpenAI call (see listings/analysis.py)
+        try:
+            analysis = analyze(listing, price_history)
             return Response({"analysis": analysis, "cached": False})
         except Exception as e:
-            print("OpenAI Exception:", str(e))
+            logger.exception("OpenAI analysis failed for listing %s", listing_id)
             return Response({"error": "AI analysis failed.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     @staticmethod
-    def _generate_prompt(listing, price_history):
+    def _wants_stream(request):
         """
-        Helper to generate the prompt for OpenAI based on Listing and PriceHistory.
+        True when the client asked for server-sent events.
         """
-        return (
-            f"Analyze the future price trend for this property and provide a structured, professional real estate analysis report:\n\n"
-            f"**Property Details:**\n"
-            f"• Listing: {listing.title}\n"
-            f"• Location: {listing.city}, {listing.province}\n"
-            f"• Current Price: {listing.current_price}\n"
-            f"• Specifications: {listing.bedrooms} bedrooms, {listing.bathrooms} bathrooms, {listing.square_feet} sqft\n"
-            f"• Description: {listing.description}\n\n"
-            f"**Price History Data:**\n"
-            f"• Price Values: {price_history.price_values if price_history else 'N/A'}\n"
-            f"• Date Recorded: {price_history.date_recorded if price_history else 'N/A'}\n\n"
-            f"Please provide your analysis in the following structured format with clear headings and bullet points:\n\n"
-            f"**MARKET ANALYSIS SUMMARY**\n"
-            f"[Brief overview of current market position]\n\n"
-            f"**PRICE TREND ANALYSIS**\n"
-            f"[Detailed analysis of price movements and patterns]\n\n"
-            f"**FUTURE PRICE PREDICTION**\n"
-            f"[Specific predictions with reasoning]\n\n"
-            f"**KEY FACTORS & RECOMMENDATIONS**\n"
-            f"[Important factors affecting price and actionable recommendations]\n\n"
-            f"Use professional real estate terminology and provide specific, actionable insights."
-        )
\ No newline at end of file
+        stream = request.data.get('stream')
+        if isinstance(stream, str):
+            stream = stream.lower() in ('1', 'true', 'yes')
+        return bool(stream) or 'text/event-stream' in request.headers.get('Accept', '')
+
+    # Prompt builder shared with the async view and batch tools (see listings/analysis.py)
+    _generate_prompt = staticmethod(generate_prompt)
+
+
+#----------------------------- Async AI Analysis View -----------------------------#
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncOpenAIProxyView(View):
+    """
+    Async variant of OpenAIProxyAPIView for ASGI deployments (lynapp-django/asgi.py).
+    While the LLM call is in flight the worker's event loop keeps serving other
+    requests, and the upstream call goes through the process-wide pooled AsyncOpenAI
+    client, limited to OPENAI_MAX_CONCURRENCY concurrent calls.
+    Frontend can call: POST /api/listings/analyze-housing/async/ with {"listing_id": 1}
+    Returns the same payloads and status codes as OpenAIProxyAPIView.
+    """
+    http_method_names = ['post']
+
+    async def post(self, request):
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body."}, status=status.HTTP_400_BAD_REQUEST)
+
+        listing_id = data.get('listing_id') if isinstance(data, dict) else None
+
+        # Validate listing_id
+        if not listing_id:
+            return JsonResponse({"error": "listing_id is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            listing = await Listing.objects.aget(id=listing_id)
+        except (Listing.DoesNotExist, ValueError):
+            return JsonResponse({"error": f"Listing with id {listing_id} not found."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Memory tier, keyed by the listing's updated_at: a hit costs no further query
+        cached = await aget_memory_analysis(listing)
+        if cached is not None:
+            return JsonResponse({"analysis": cached, "cached": True})
+
+        # Check if OpenAI API key is available
+        if not settings.OPENAI_API_KEY:
+            return JsonResponse({"error": "OpenAI API key not configured."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        # Get the latest price history for the listing (if any)
+        price_history = await listing.pricehistory_set.order_by('-date_recorded').afirst()
+
+        # Check the AnalysisCache table
+        cached = await aget_cached_analysis(listing, price_history)
+        if cached is not None:
+            return JsonResponse({"analysis": cached, "cached": True})
+
+        # Cache miss: concurrent requests for the same key await one shared upstream call
+        try:
+            analysis = await aanalyze(listing, price_history)
+        except Exception as e:
+            logger.exception("OpenAI analysis failed for listing %s", listing_id)
+            return JsonResponse({"error": "AI analysis failed.", "details": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        return JsonResponse({"analysis": analysis, "cached": False})
+
+
+@api_view(['GET'])
+def analysis_cache_stats_view(request):
+    """
+    Report the analysis cache counters of the worker process serving the request.
+    Frontend/monitoring can call: GET /api/listings/analyze-housing/stats/
+    Returns:
+        Response: {"memory_hits", "memory_misses", "memory_hit_rate", "db_hits", "db_misses",
+                   "db_hit_rate", "memory_evictions", "db_evictions"}
+    """
+    return Response(analysis_cache_stats.snapshot())
+
+
+@api_view(['GET'])
+def listing_cache_stats_view(request):
+    """
+    Report the listing response cache counters of the worker process serving the request.
+    Frontend/monitoring can call: GET /api/listings/cache/stats/
+    Returns:
+        Response: {"list_hits", "list_misses", "list_hit_rate", "search_hits", "search_misses",
+                   "search_hit_rate", "stores", "errors",
+                   "clusters": {"tile_hits", "tile_misses", "tile_hit_rate", "rebuilds", "updates", "errors"}}
+    """
+    return Response({**response_cache.stats.snapshot(), "clusters": clusters.stats.snapshot()})
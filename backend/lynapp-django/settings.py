@@ -30,6 +30,16 @@ DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_BASE_URL = os.getenv('OPENAI_BASE_URL') or None  # Point at any OpenAI-compatible server; None uses api.openai.com
+
+# Shared OpenAI client pool (see listings/llm.py)
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', '60'))  # Seconds for a whole completion request
+OPENAI_CONNECT_TIMEOUT = float(os.getenv('OPENAI_CONNECT_TIMEOUT', '5'))
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', '2'))
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', '50'))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '20'))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv('OPENAI_KEEPALIVE_EXPIRY', '30'))
+OPENAI_MAX_CONCURRENCY = int(os.getenv('OPENAI_MAX_CONCURRENCY', '50'))  # In-flight async analyses per worker
 
 
 ALLOWED_HOSTS = os.getenv('ALLOWED_HOSTS', 'localhost,127.0.0.1,lyn-housing-ai-app-backend.onrender.com').split(',')
@@ -48,6 +58,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'listings.profiling.RequestProfilingMiddleware',  # No-op unless REQUEST_PROFILING=True
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -151,6 +162,101 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'listings.pagination.ListingCursorPagination',
+}
+
+# Caches: `analysis` is the in-process memory tier in front of the AnalysisCache table, and
+# `listings` holds rendered list/search responses (listings/response_cache.py).
+# LocMemCache is an LRU bounded by MAX_ENTRIES with a per-entry TIMEOUT (seconds).
+# For a cache shared by all workers set LISTINGS_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# and LISTINGS_CACHE_LOCATION=redis://host:6379/0 (any Redis-protocol server works).
+LISTINGS_CACHE_BACKEND = os.getenv('LISTINGS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'analysis': {
+        # LocMemCache that also counts its LRU culls (memory_evictions in the analysis cache stats)
+        'BACKEND': os.getenv('ANALYSIS_MEMORY_CACHE_BACKEND', 'listings.metrics.CountingLocMemCache'),
+        'LOCATION': os.getenv('ANALYSIS_MEMORY_CACHE_LOCATION', 'analysis'),
+        'TIMEOUT': int(os.getenv('ANALYSIS_MEMORY_CACHE_TTL', '3600')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('ANALYSIS_MEMORY_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+    'listings': {
+        'BACKEND': LISTINGS_CACHE_BACKEND,
+        'LOCATION': os.getenv('LISTINGS_CACHE_LOCATION', 'listings'),
+        'TIMEOUT': int(os.getenv('LISTINGS_CACHE_TTL', '300')),
+        # MAX_ENTRIES only applies to the local-memory backend (Redis evicts by its own maxmemory policy)
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('LISTINGS_CACHE_MAX_ENTRIES', '500')),
+        } if LISTINGS_CACHE_BACKEND.endswith('LocMemCache') else {},
+    },
+}
+ANALYSIS_MEMORY_CACHE_ALIAS = 'analysis'
+LISTINGS_CACHE_ALIAS = 'listings'
+LISTINGS_RESPONSE_CACHE = os.getenv('LISTINGS_RESPONSE_CACHE', 'True').lower() == 'true'
+
+# AnalysisCache table: rows older than the TTL are treated as misses and purged, and the
+# table is trimmed to the newest MAX_ROWS rows every PURGE_INTERVAL new analyses
+ANALYSIS_CACHE_TTL = int(os.getenv('ANALYSIS_CACHE_TTL', str(7 * 24 * 3600)))
+ANALYSIS_CACHE_MAX_ROWS = int(os.getenv('ANALYSIS_CACHE_MAX_ROWS', '10000'))
+ANALYSIS_CACHE_PURGE_INTERVAL = int(os.getenv('ANALYSIS_CACHE_PURGE_INTERVAL', '100'))
+
+# Listing pagination: default page size and the hard cap clients can request via ?page_size=
+LISTINGS_PAGE_SIZE = int(os.getenv('LISTINGS_PAGE_SIZE', '50'))
+LISTINGS_MAX_PAGE_SIZE = int(os.getenv('LISTINGS_MAX_PAGE_SIZE', '200'))
+# Listings read, serialized and sent per database round trip by /api/listings/export/
+LISTINGS_EXPORT_CHUNK_SIZE = int(os.getenv('LISTINGS_EXPORT_CHUNK_SIZE', '1000'))
+# Change feed: changes returned per /api/listings/changes/ request (also the cap for ?limit=)
+LISTINGS_CHANGES_PAGE_SIZE = int(os.getenv('LISTINGS_CHANGES_PAGE_SIZE', '500'))
+# Bulk write API: items accepted per request, and rows per INSERT/UPDATE statement
+LISTINGS_BULK_MAX_ITEMS = int(os.getenv('LISTINGS_BULK_MAX_ITEMS', '5000'))
+LISTINGS_BULK_BATCH_SIZE = int(os.getenv('LISTINGS_BULK_BATCH_SIZE', '500'))
+# Geo search: most listings one /api/listings/within/ response returns (also the cap for ?limit=),
+# largest accepted radius, and the offline gazetteer used by `manage.py geocode_listings`
+LISTINGS_GEO_MAX_RESULTS = int(os.getenv('LISTINGS_GEO_MAX_RESULTS', '2000'))
+LISTINGS_GEO_MAX_RADIUS_KM = float(os.getenv('LISTINGS_GEO_MAX_RADIUS_KM', '200'))
+LISTINGS_GAZETTEER_PATH = os.getenv('LISTINGS_GAZETTEER_PATH', str(BASE_DIR / 'listings' / 'data' / 'gazetteer.csv'))
+# Map clusters: most tiles one /api/listings/clusters/?bbox= request may cover
+LISTINGS_CLUSTER_MAX_TILES = int(os.getenv('LISTINGS_CLUSTER_MAX_TILES', '64'))
+# Price trends: default forecast horizon in days (?horizon_days= accepts 1 to 3650), and the
+# most listings one /api/listings/trends/?ids= request may ask for
+LISTINGS_TREND_FORECAST_DAYS = int(os.getenv('LISTINGS_TREND_FORECAST_DAYS', '365'))
+LISTINGS_TREND_MAX_IDS = int(os.getenv('LISTINGS_TREND_MAX_IDS', '500'))
+
+# Listing read endpoints send ETag/Last-Modified; clients may reuse a response for this many
+# seconds before revalidating (0 = revalidate every time, cheap thanks to 304 responses)
+LISTINGS_HTTP_MAX_AGE = int(os.getenv('LISTINGS_HTTP_MAX_AGE', '0'))
+
+# Comparable listings: the in-memory feature matrix is rebuilt from the database at most this
+# often (seconds) to pick up writes made without signals or by other worker processes
+COMPARABLES_INDEX_TTL = int(os.getenv('COMPARABLES_INDEX_TTL', '300'))
+COMPARABLES_DEFAULT_K = 5
+COMPARABLES_MAX_K = 50
+
+# Request profiling (listings.profiling.RequestProfilingMiddleware): Server-Timing headers and a
+# "request_profile" log line per API request; SAMPLE_RATE of requests run under cProfile and
+# are dumped to PROFILING_DIR when slower than SLOW_MS
+REQUEST_PROFILING = os.getenv('REQUEST_PROFILING', 'False').lower() == 'true'
+REQUEST_PROFILING_PATH_PREFIX = os.getenv('REQUEST_PROFILING_PATH_PREFIX', '/api/listings/')
+REQUEST_PROFILING_SLOW_MS = float(os.getenv('REQUEST_PROFILING_SLOW_MS', '500'))
+REQUEST_PROFILING_SAMPLE_RATE = float(os.getenv('REQUEST_PROFILING_SAMPLE_RATE', '0'))
+REQUEST_PROFILING_DIR = os.getenv('REQUEST_PROFILING_DIR', str(BASE_DIR / 'profiles'))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'listings': {
+            'handlers': ['console'],
+            'level': os.getenv('LISTINGS_LOG_LEVEL', 'INFO'),
+        },
+    },
 }
 
 # CORS settings
@@ -1,14 +1,19 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useCallback } from 'react';
 import { listingsAPI } from '../services/api';
 
 /**
  * Custom hook to manage listings data fetching and state
  * 
+ * List and search responses are cursor-paginated ({ next, previous, results }), so the hook
+ * loads the first page and exposes `loadMore` to append the following pages on demand.
+ * 
  * @param {string|number} param - City name (string) to filter listings or listing ID (number) to fetch specific listing
  * @returns {Object} Object containing listings, loading state, and error state
- * @returns {Array|Object} returns.listings - Array of listing objects or single listing object
+ * @returns {Array|Object} returns.listings - Array of listing objects loaded so far or single listing object
  * @returns {boolean} returns.loading - Loading state indicator
  * @returns {string|null} returns.error - Error message or null
+ * @returns {boolean} returns.hasMore - True when another page of listings can be loaded
+ * @returns {Function} returns.loadMore - Fetch the next page and append it to `listings`
  */
 export const useListings = (param = '') => {
   // This creates a box to store our house listings (starts empty)
@@ -20,28 +25,35 @@ export const useListings = (param = '') => {
   // This creates a box to store error messages if something goes wrong (starts empty)
   const [error, setError] = useState(null);
 
+  // This remembers the link to the next page of listings (null when everything is loaded)
+  const [nextUrl, setNextUrl] = useState(null);
+
+  // This remembers if we're currently fetching another page
+  const [loadingMore, setLoadingMore] = useState(false);
+
   // This runs automatically when the hook is first used
   useEffect(() => {
     // This is a function that gets our house data from the internet
     const fetchData = async () => {
       setLoading(true);
       try {
-        let data;
-        
         // Check if param is a number (listing ID) or string (city)
         if (typeof param === 'number') {
-          data = await listingsAPI.getListing(param).then(res => res.data); // Fetch specific listing by ID
+          const data = await listingsAPI.getListing(param).then(res => res.data); // Fetch specific listing by ID
+          setListings(data);
+          setNextUrl(null);
         } else {
-          data = await listingsAPI.searchListings(param).then(res => res.data);
+          const data = await listingsAPI.searchListings(param).then(res => res.data); // First page only
+          setListings(data.results);
+          setNextUrl(data.next);
         }
         
-        // Put the house listings in our storage box
-        setListings(data);
         setError(null); // Clear any previous errors
       } catch (err) {
         // If something went wrong, save an error message
         console.error('Error fetching listings:', err);
         setListings([]);
+        setNextUrl(null);
         setError(
           err?.response?.data?.message ||
           'Failed to load listings'
@@ -56,10 +68,28 @@ export const useListings = (param = '') => {
     fetchData();
   }, [param]); // Re-run when param changes
 
+  // This gets the next page of listings and adds it to the ones we already have
+  const loadMore = useCallback(async () => {
+    if (!nextUrl || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const data = await listingsAPI.getPage(nextUrl).then(res => res.data);
+      setListings(prev => [...prev, ...data.results]);
+      setNextUrl(data.next);
+    } catch (err) {
+      console.error('Error fetching more listings:', err);
+      setNextUrl(null);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [nextUrl, loadingMore]);
+
   // Return the data so components can use it
   return {
     listings,
     loading,
-    error
+    error,
+    hasMore: Boolean(nextUrl),
+    loadMore
   };
-};
\ No newline at end of file
+};
@@ -3,7 +3,7 @@ import ListingCard from '../../components/ListingCard';
 import './styles/PropertiesPage.css';
 import { useNavigate, useLocation } from 'react-router-dom';
 import PropertySearchBox from '../../components/PropertySearchBox';
-import { useState, useRef } from 'react';
+import { useState, useRef, useEffect } from 'react';
 
 const PropertiesPage = () => {
   const navigate = useNavigate();
@@ -18,7 +18,7 @@ const PropertiesPage = () => {
   const [currentPage, setCurrentPage] = useState(pageParam);
   const listingsSectionRef = useRef(null);
 
-  const { listings, loading, error } = useListings(cityParam);
+  const { listings, loading, error, hasMore, loadMore } = useListings(cityParam);
 
   // Pagination logic
   const getItemsPerPage = () => {
@@ -31,6 +31,14 @@ const PropertiesPage = () => {
   const endIndex = startIndex + itemsPerPage;
   const currentListings = listings.slice(startIndex, endIndex);
 
+  // Listings arrive one cursor page at a time: fetch the next page once the
+  // current view (plus the following page of cards) reaches the end of what is loaded
+  useEffect(() => {
+    if (!loading && hasMore && endIndex + itemsPerPage >= listings.length) {
+      loadMore();
+    }
+  }, [loading, hasMore, endIndex, itemsPerPage, listings.length, loadMore]);
+
   const handleLayoutChange = (layout) => {
     setGridLayout(layout);
     currentPage ? setCurrentPage(currentPage) : setCurrentPage(1);
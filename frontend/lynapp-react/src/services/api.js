@@ -18,6 +18,9 @@ Regular CRUD API endpoints.
 - updateListing: (id, data) => api.put(`/listings/${id}/`, data) - Update a specific listing by ID
 - deleteListing: (id) => api.delete(`/listings/${id}/`) - Delete a specific listing by ID
 - searchListings: (city) => api.get(`/listings/search/?city=${encodeURIComponent(city)}`) - Search listings by city
+- getPage: (url) => api.get(url) - Follow a `next`/`previous` cursor link returned by a paginated endpoint
+
+List and search responses are cursor-paginated: { next, previous, results }.
 */
 
 export const listingsAPI = {
@@ -27,6 +30,7 @@ export const listingsAPI = {
   updateListing: (id, data) => api.put(`/listings/${id}/`, data),
   deleteListing: (id) => api.delete(`/listings/${id}/`),
   searchListings: (city) => api.get(`/listings/search/?city=${encodeURIComponent(city)}`) || getAllListings(),
+  getPage: (url) => api.get(url),
 };
 
 /* 
@@ -37,8 +41,11 @@ Custom API endpoints.
 
 
 export const getCitySuggestions = async (query) => {
-  // Fetch all listings, extract unique cities matching the query
-  const listings = await listingsAPI.getAllListings().then(res => res.data);
+  // Fetch the first page of listings matching the query, extract unique cities
+  // (the search endpoint answers 404 when nothing matches, which simply means no suggestions)
+  const listings = await listingsAPI.searchListings(query)
+    .then(res => res.data.results)
+    .catch(() => []);
   const cities = Array.from(new Set(
     listings
       .map(l => l.city)